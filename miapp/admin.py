@@ -26,6 +26,7 @@ class TaxGradeAdmin(admin.ModelAdmin):
 @admin.register(Import)
 class ImportAdmin(admin.ModelAdmin):
     list_display = ['file_name', 'file_type', 'status', 'uploader_id', 'uploaded_at']
+    list_select_related = ['uploader_id']
     list_filter = ['status', 'file_type', 'uploaded_at']
     search_fields = ['file_name', 'file_hash']
     readonly_fields = ['id', 'file_hash', 'uploaded_at']
@@ -35,6 +36,7 @@ class ImportAdmin(admin.ModelAdmin):
 @admin.register(ImportRecord)
 class ImportRecordAdmin(admin.ModelAdmin):
     list_display = ['import_id', 'row_number_or_page', 'rut', 'year', 'status', 'created_at']
+    list_select_related = ['import_id']
     list_filter = ['status', 'created_at']
     search_fields = ['rut', 'error_message']
     readonly_fields = ['id', 'created_at']
@@ -44,9 +46,11 @@ class ImportRecordAdmin(admin.ModelAdmin):
 @admin.register(AuditLog)
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['user_id', 'entity', 'entity_id', 'action', 'timestamp']
+    list_select_related = ['user_id']
     list_filter = ['entity', 'action', 'timestamp']
     search_fields = ['user_id__username', 'entity_id']
-    readonly_fields = ['id', 'timestamp']
+    exclude = ['before', 'after']
+    readonly_fields = ['id', 'timestamp', 'before_state', 'after_state']
     date_hierarchy = 'timestamp'
     
     def has_add_permission(self, request):
@@ -0,0 +1,267 @@
+"""
+Archivo mensual de audit_logs (manage.py archive_audit_logs).
+
+audit_logs crece con cada fila importada y cada edición, y la mantención de
+sus índices termina dominando el costo de cada INSERT. El comando mueve los
+meses cerrados más antiguos que AUDIT_ARCHIVE_KEEP_MONTHS a
+audit_log_archives: bloques de hasta AUDIT_ARCHIVE_CHUNK_SIZE entradas de un
+mismo mes, serializadas como JSON y comprimidas con zlib. Cada bloque se
+inserta y sus entradas se borran de audit_logs en una transacción, de modo
+que el proceso se puede interrumpir y retomar.
+
+GET /api/audit-logs/ sigue leyendo solo audit_logs salvo que date_from
+llegue a un mes archivado: entonces agrega las entradas archivadas que
+cumplen los filtros, descomprimiendo solo los bloques cuyo rango de fechas
+se cruza con el pedido. Para el total de la paginación, los bloques que caen
+completos en el rango se cuentan con row_count si no hay otros filtros, y los
+conteos que exigen descomprimir se guardan en la caché (los bloques no
+cambian una vez escritos); cada página descomprime solo los bloques que toca.
+"""
+import hashlib
+import json
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .cache import get_api_cache
+from .diffs import decode_payload
+from .models import AuditLog, AuditLogArchive
+
+DEFAULT_KEEP_MONTHS = 12
+DEFAULT_CHUNK_SIZE = 5000
+COMPRESSION_LEVEL = 9
+# Los conteos por bloque no cambian: se guardan sin expiración
+BLOCK_COUNT_TIMEOUT = None
+# Columnas de audit_logs guardadas por entrada (user_id es el id del usuario)
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'entity', 'entity_id', 'action', 'before', 'after',
+    'timestamp', 'ip_address', 'user_agent', 'rut', 'instrumento', 'year',
+)
+# Filtros del listado que se aplican también a las entradas archivadas
+ARCHIVE_FILTERS = ('entity', 'action', 'user_id', 'entity_id')
+
+
+def keep_months():
+    return getattr(settings, 'AUDIT_ARCHIVE_KEEP_MONTHS', DEFAULT_KEEP_MONTHS)
+
+
+def archive_chunk_size():
+    return getattr(settings, 'AUDIT_ARCHIVE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def month_start(value):
+    """Primer instante del mes de `value` en la zona horaria del proyecto"""
+    return timezone.localtime(value).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def archive_cutoff(keep=None, now=None):
+    """Inicio del mes más antiguo que se conserva en audit_logs"""
+    return add_months(month_start(now or timezone.now()), -(keep_months() if keep is None else keep))
+
+
+# --- Escritura ----------------------------------------------------------------
+
+def encode_rows(rows):
+    for row in rows:
+        # Las diferencias de audit_logs.delta se archivan como before/after completos
+        delta = row.pop('delta', None)
+        if delta is not None:
+            row['before'], row['after'] = decode_payload(delta)
+        row['id'] = str(row['id'])
+        row['timestamp'] = row['timestamp'].isoformat()
+    return zlib.compress(json.dumps(rows, separators=(',', ':'), default=str).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decode_rows(payload):
+    rows = json.loads(zlib.decompress(bytes(payload)))
+    for row in rows:
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    return rows
+
+
+def archive_audit_logs(cutoff=None, chunk_size=None, dry_run=False):
+    """
+    Mueve las entradas anteriores a `cutoff` (por defecto archive_cutoff())
+    a audit_log_archives, un mes a la vez y en bloques de `chunk_size`.
+    Retorna {primer día del mes: entradas movidas (o a mover con dry_run)}.
+    """
+    cutoff = cutoff or archive_cutoff()
+    chunk_size = chunk_size or archive_chunk_size()
+    pending = AuditLog.objects.filter(timestamp__lt=cutoff)
+    moved = {}
+    while True:
+        oldest = pending.aggregate(oldest=Min('timestamp'))['oldest']
+        if oldest is None:
+            return moved
+        month = month_start(oldest)
+        month_end = min(add_months(month, 1), cutoff)
+        entries = pending.filter(timestamp__gte=month, timestamp__lt=month_end)
+        pending = pending.filter(timestamp__gte=month_end)
+        if dry_run:
+            moved[month.date()] = entries.count()
+            continue
+
+        count = 0
+        while True:
+            rows = list(entries.order_by('timestamp', 'id').values(*ARCHIVE_FIELDS, 'delta')[:chunk_size])
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            with transaction.atomic():
+                AuditLogArchive.objects.create(
+                    month=month.date(),
+                    first_timestamp=rows[0]['timestamp'],
+                    last_timestamp=rows[-1]['timestamp'],
+                    row_count=len(rows),
+                    payload=encode_rows(rows),
+                )
+                AuditLog.objects.filter(id__in=ids).delete()
+            count += len(rows)
+        moved[month.date()] = count
+
+
+# --- Lectura ------------------------------------------------------------------
+
+def archive_horizon():
+    """Última fecha archivada (None si no hay archivo)"""
+    return AuditLogArchive.objects.aggregate(last=Max('last_timestamp'))['last']
+
+
+def audit_log_instances(rows):
+    """AuditLog (sin guardar) de entradas archivadas, con sus usuarios en una consulta"""
+    users = User.objects.in_bulk({row['user_id'] for row in rows if row['user_id'] is not None})
+    return [AuditLog(**{**row, 'user_id': users.get(row['user_id'])}) for row in rows]
+
+
+class ArchivedAuditLogs:
+    """
+    Entradas archivadas de [date_from, date_to] que cumplen `filters`, en orden
+    de timestamp. count() usa los conteos por bloque (block_counts) y
+    [inicio:fin] descomprime solo los bloques que cubren ese tramo.
+    """
+
+    def __init__(self, date_from, date_to=None, filters=None, descending=True):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.filters = filters or {}
+        self.descending = descending
+        self._blocks = None
+
+    def chunks(self):
+        chunks = AuditLogArchive.objects.filter(last_timestamp__gte=self.date_from)
+        if self.date_to is not None:
+            chunks = chunks.filter(first_timestamp__lte=self.date_to)
+        ordering = ('-last_timestamp', '-id') if self.descending else ('first_timestamp', 'id')
+        return chunks.order_by(*ordering)
+
+    def payloads(self, ids=None):
+        """{id: filas que cumplen, en el orden del listado} de los bloques `ids` (o de todos)"""
+        chunks = self.chunks() if ids is None else AuditLogArchive.objects.filter(id__in=ids)
+        rows = {}
+        for pk, payload in chunks.values_list('id', 'payload').iterator(chunk_size=10):
+            decoded = decode_rows(payload)
+            rows[pk] = [row for row in (reversed(decoded) if self.descending else decoded) if self.matches(row)]
+        return rows
+
+    def matches(self, row):
+        if row['timestamp'] < self.date_from or (self.date_to is not None and row['timestamp'] > self.date_to):
+            return False
+        # Los bloques archivados antes de las columnas rut/instrumento/year no las traen
+        return all(str(row.get(name)) == str(value) for name, value in self.filters.items())
+
+    def count_key(self, pk, inside):
+        """Llave de caché del conteo de un bloque (el rango solo importa si el bloque lo cruza)"""
+        scope = [sorted((name, str(value)) for name, value in self.filters.items())]
+        if not inside:
+            scope.append([str(self.date_from), str(self.date_to)])
+        digest = hashlib.sha256(json.dumps(scope).encode('utf-8')).hexdigest()
+        return f'api:archive-count:{pk}:{digest}'
+
+    def block_counts(self):
+        """[(id del bloque, entradas que cumplen)] en el orden del listado"""
+        if self._blocks is not None:
+            return self._blocks
+        blocks = list(self.chunks().values_list('id', 'first_timestamp', 'last_timestamp', 'row_count'))
+        counts, keys = {}, {}
+        for pk, first, last, row_count in blocks:
+            inside = first >= self.date_from and (self.date_to is None or last <= self.date_to)
+            if inside and not self.filters:
+                counts[pk] = row_count
+            else:
+                keys[self.count_key(pk, inside)] = pk
+        if keys:
+            cache = get_api_cache()
+            cached = cache.get_many(list(keys))
+            counts.update((keys[key], value) for key, value in cached.items())
+            missing = {pk: key for key, pk in keys.items() if key not in cached}
+            if missing:
+                computed = {pk: len(rows) for pk, rows in self.payloads(list(missing)).items()}
+                counts.update(computed)
+                cache.set_many({missing[pk]: count for pk, count in computed.items()}, BLOCK_COUNT_TIMEOUT)
+        self._blocks = [(pk, counts.get(pk, 0)) for pk, *_ in blocks]
+        return self._blocks
+
+    def __iter__(self):
+        for rows in self.payloads().values():
+            yield from rows
+
+    def count(self):
+        return sum(count for _, count in self.block_counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        wanted, offset, position = [], None, 0
+        for pk, count in self.block_counts():
+            if position + count > start and position < stop and count:
+                if offset is None:
+                    offset = start - position
+                wanted.append(pk)
+            position += count
+        if not wanted:
+            return []
+        rows = self.payloads(wanted)
+        rows = [row for pk in wanted for row in rows.get(pk, [])]
+        return audit_log_instances(rows[offset:offset + stop - start])
+
+
+class CombinedAuditLogs:
+    """Secuencia paginable que concatena fuentes ya ordenadas (audit_logs y el archivo)"""
+
+    def __init__(self, *parts):
+        self.parts = parts
+        self._sizes = None
+
+    def sizes(self):
+        if self._sizes is None:
+            self._sizes = [part.count() for part in self.parts]
+        return self._sizes
+
+    def count(self):
+        return sum(self.sizes())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        items = []
+        for part, size in zip(self.parts, self.sizes()):
+            if stop <= 0:
+                break
+            if start < size:
+                items.extend(part[max(start, 0):min(stop, size)])
+            start, stop = start - size, stop - size
+        return items
@@ -0,0 +1,122 @@
+"""
+Pipeline de assets estáticos (manage.py build_assets).
+
+Cada asset de settings.STATIC_ASSETS se escribe con el hash de su contenido
+en el nombre (js/app.<hash>.js) y se precomprime en .gz y .br (sin minificar:
+gzip/brotli ya quitan casi todo lo que ahorraría un minificador). manifest.json relaciona el nombre original con el nombre con hash;
+la plantilla usa {% asset 'js/app.js' %} y la vista serve_asset entrega la
+variante precomprimida que acepte el cliente con Cache-Control immutable (el
+nombre cambia con el contenido), sin comprimir nada por request.
+
+Sin build (desarrollo) {% asset %} apunta al archivo original en static/.
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+from .compression import brotli
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+BROTLI_QUALITY = 11
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Extensiones de las variantes precomprimidas, en orden de preferencia
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest_cache = {'key': None, 'entries': {}}
+
+
+def assets_root():
+    return Path(getattr(settings, 'STATIC_ASSETS_ROOT', Path(settings.BASE_DIR) / 'static_assets'))
+
+
+def assets_url():
+    return getattr(settings, 'STATIC_ASSETS_URL', '/assets/')
+
+
+# --- Build --------------------------------------------------------------------
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name, content):
+    base, ext = os.path.splitext(name)
+    return f'{base}.{content_hash(content)}{ext}'
+
+
+def _write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+def build_asset(name, root):
+    """
+    Escribe con hash y precomprime un asset. Retorna
+    (nombre con hash, {variante: bytes}).
+    """
+    source_path = finders.find(name)
+    if not source_path:
+        raise FileNotFoundError(f'No se encontró el asset {name} en los directorios estáticos')
+    content = Path(source_path).read_bytes()
+
+    target = hashed_name(name, content)
+    variants = {'identity': content, 'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=BROTLI_QUALITY)
+
+    _write(root / target, content)
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in variants:
+            _write(root / (target + suffix), variants[encoding])
+    return target, variants
+
+
+def build_assets(names=None, root=None):
+    """Construye los assets y escribe manifest.json; retorna {nombre: (con hash, variantes)}"""
+    names = names if names is not None else getattr(settings, 'STATIC_ASSETS', [])
+    root = Path(root) if root is not None else assets_root()
+    built = {name: build_asset(name, root) for name in names}
+    manifest = {name: target for name, (target, _) in built.items()}
+    _write(root / MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return built
+
+
+# --- Lectura ------------------------------------------------------------------
+
+def load_manifest():
+    """{nombre original: nombre con hash}; se relee cuando cambia manifest.json"""
+    path = assets_root() / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return {}
+    if _manifest_cache['key'] != (path, mtime):
+        try:
+            entries = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        _manifest_cache.update(key=(path, mtime), entries=entries)
+    return _manifest_cache['entries']
+
+
+def asset_url(name):
+    """URL del asset con hash si está construido, si no la de static/"""
+    target = load_manifest().get(name)
+    if target is None:
+        return static(name)
+    return assets_url() + target
+
+
+def asset_path(target):
+    """Ruta del archivo de un nombre con hash del manifest (None si no pertenece a él)"""
+    if target not in set(load_manifest().values()):
+        return None
+    path = assets_root() / target
+    return path if path.is_file() else None
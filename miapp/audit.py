@@ -0,0 +1,186 @@
+"""
+Auditoría de escrituras por conjunto.
+
+insert_audit_entries() registra una entrada de audit_logs por cada registro
+de un queryset con un solo INSERT ... SELECT: el estado anterior se arma en
+la base de datos con JSON_OBJECT (json_object en SQLite) a partir de las
+columnas del registro, sin traer las filas a Python.
+
+Las columnas rut, instrumento y year de audit_logs identifican el registro
+auditado (AUDIT_KEY_FIELDS de cada modelo) y permiten buscar su historial por
+índice; backfill_audit_keys() las completa en las entradas anteriores.
+"""
+import json
+
+from django.db import connections, transaction
+from django.db.models import CharField, DateTimeField, F, Func, IntegerField, TextField, Value
+from django.db.models.functions import Cast, Concat, JSONObject, Substr
+from rest_framework.exceptions import ValidationError
+
+from .models import AuditLog, DividendMaintainer, TaxGrade, audit_keys
+from .rut import normalize_rut
+
+KEY_FIELDS = ('rut', 'instrumento', 'year')
+BACKFILL_CHUNK_SIZE = 2000
+# Entidades cuyas entradas llevan columnas de búsqueda
+KEYED_MODELS = {model._meta.db_table: model for model in (TaxGrade, DividendMaintainer)}
+
+
+class RandomUUIDHex(Func):
+    """UUID aleatorio como 32 dígitos hexadecimales (formato de UUIDField en MySQL/SQLite)"""
+
+    output_field = CharField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return 'REPLACE(UUID(), \'-\', \'\')', []
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return 'lower(hex(randomblob(16)))', []
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return 'gen_random_uuid()', []
+
+
+def uuid_text(field_name, connection):
+    """Expresión con el UUID de `field_name` en texto con guiones (como str(uuid))"""
+    if connection.features.has_native_uuid_field:
+        return Cast(F(field_name), CharField())
+    parts = [Substr(F(field_name), start, length) for start, length in ((1, 8), (9, 4), (13, 4), (17, 4), (21, 12))]
+    pieces = [parts[0]]
+    for part in parts[1:]:
+        pieces += [Value('-'), part]
+    return Concat(*pieces, output_field=CharField())
+
+
+def text(field_name):
+    """Columna como texto (montos y fechas se auditan como str)"""
+    return Cast(F(field_name), CharField())
+
+
+def tax_grade_audit_state(connection):
+    """Estado auditado de un TaxGrade (igual que TaxGradeViewSet._serialize_model)"""
+    return {
+        'id': uuid_text('pk', connection),
+        'rut': F('rut'),
+        'name': F('name'),
+        'year': F('year'),
+        'source_type': F('source_type'),
+        'fuente_ingreso': F('fuente_ingreso'),
+        'amount': text('amount'),
+        'status': F('status'),
+    }
+
+
+def dividend_audit_state(connection):
+    """Estado auditado de un DividendMaintainer (igual que DividendMaintainerViewSet._serialize_model)"""
+    return {
+        'id': uuid_text('pk', connection),
+        'tipo_mercado': F('tipo_mercado'),
+        'origen_informacion': F('origen_informacion'),
+        'periodo_comercial': F('periodo_comercial'),
+        'instrumento': F('instrumento'),
+        'fecha_pago_dividendo': text('fecha_pago_dividendo'),
+        'origen': F('origen'),
+    }
+
+
+def insert_audit_entries(queryset, *, user, action, before, after=None,
+                         ip_address=None, user_agent='', timestamp):
+    """
+    Inserta una entrada de auditoría por registro de `queryset` con un
+    INSERT ... SELECT y retorna la cantidad de filas insertadas.
+
+    `before` es una función (connection) -> {llave: expresión} con el estado
+    anterior de cada registro; `after` es un valor JSON constante o None.
+    """
+    connection = connections[queryset.db]
+    entity = queryset.model._meta.db_table
+    columns = {
+        'id': RandomUUIDHex(),
+        'user_id': Value(user.pk if user else None),
+        'entity': Value(entity, output_field=CharField()),
+        'entity_id': uuid_text('pk', connection),
+        'action': Value(action, output_field=CharField()),
+        'before': JSONObject(**before(connection)),
+        'after': Value(None if after is None else json.dumps(after), output_field=TextField()),
+        'timestamp': Value(timestamp, output_field=DateTimeField()),
+        'ip_address': Value(ip_address, output_field=CharField()),
+        'user_agent': Value(user_agent or '', output_field=TextField()),
+        'rut': Value('', output_field=CharField()),
+        'instrumento': Value('', output_field=CharField()),
+        'year': Value(None, output_field=IntegerField()),
+        **{key: F(field) for key, field in queryset.model.AUDIT_KEY_FIELDS.items()},
+    }
+    return insert_select(queryset, AuditLog, columns)
+
+
+def insert_select(queryset, model, columns):
+    """
+    INSERT INTO `model` (columnas) SELECT ... FROM `queryset`: `columns` es
+    {campo de model: expresión sobre el queryset}. Retorna las filas insertadas.
+    """
+    connection = connections[queryset.db]
+    aliases = {name: f'insert_{name}' for name in columns}
+    select = queryset.order_by().annotate(
+        **{aliases[name]: expression for name, expression in columns.items()}
+    ).values_list(*aliases.values())
+    select_sql, params = select.query.sql_with_params()
+
+    opts = model._meta
+    quote = connection.ops.quote_name
+    target_columns = ', '.join(quote(opts.get_field(name).column) for name in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {quote(opts.db_table)} ({target_columns}) {select_sql}', params)
+        return cursor.rowcount
+
+
+# --- Columnas de búsqueda -----------------------------------------------------
+
+def audit_key_filters(params):
+    """Filtros ?rut= (cualquier formato), ?instrumento= y ?year= sobre las columnas de búsqueda"""
+    filters = {}
+    if params.get('rut'):
+        filters['rut'] = normalize_rut(params['rut'])
+    if params.get('instrumento'):
+        filters['instrumento'] = params['instrumento']
+    if params.get('year'):
+        try:
+            filters['year'] = int(params['year'])
+        except ValueError:
+            raise ValidationError({'year': 'Debe ser un año numérico.'})
+    return filters
+
+
+def backfill_audit_keys(chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Completa rut/instrumento/year de las entradas de calificaciones y
+    dividendos que no los tienen, en bloques de `chunk_size` recorridos por id.
+    Se toman de before/after y, si no están ahí (p. ej. actualizaciones de
+    importaciones de dividendos), del registro si todavía existe. Retorna la
+    cantidad de entradas actualizadas.
+    """
+    pending = AuditLog.objects.filter(
+        entity__in=list(KEYED_MODELS), rut='', instrumento='', year__isnull=True,
+    ).only('id', 'entity', 'entity_id', 'before', 'after', 'delta', *KEY_FIELDS).order_by('id')
+    updated, last = 0, None
+    while True:
+        logs = list((pending if last is None else pending.filter(id__gt=last))[:chunk_size])
+        if not logs:
+            return updated
+        last = logs[-1].id
+        for log in logs:
+            log.fill_keys()
+        missing = [log for log in logs if not (log.rut or log.instrumento or log.year is not None)]
+        for entity, model in KEYED_MODELS.items():
+            ids = {log.entity_id for log in missing if log.entity == entity}
+            records = model.objects.only(*model.AUDIT_KEY_FIELDS.values()).in_bulk(ids) if ids else {}
+            records = {str(pk): record for pk, record in records.items()}
+            for log in missing:
+                record = records.get(log.entity_id) if log.entity == entity else None
+                if record is not None:
+                    for key, value in audit_keys(record).items():
+                        setattr(log, key, value)
+        changed = [log for log in logs if log.rut or log.instrumento or log.year is not None]
+        with transaction.atomic():
+            AuditLog.objects.bulk_update(changed, KEY_FIELDS, batch_size=chunk_size)
+        updated += len(changed)
@@ -0,0 +1,442 @@
+"""
+Escrituras en lote (POST /api/tax-grades/bulk/ y /api/dividend-maintainers/bulk/).
+
+El cuerpo es una lista JSON de registros (o {"items": [...]}) de hasta
+BULK_WRITE_MAX_ITEMS elementos. Cada ítem se valida por separado con el
+serializer del lote (BulkListSerializer) y los válidos se escriben como
+upsert sobre la llave de negocio:
+
+- tax grades: (rut normalizado, año), igual que la importación de archivos.
+- dividendos: (periodo, instrumento, fecha de pago, secuencia del evento).
+
+Los ítems se procesan en bloques de BULK_WRITE_CHUNK_SIZE, una transacción
+por bloque: una lectura (SELECT ... FOR UPDATE) de los registros existentes,
+bulk_update de los modificados, bulk_create de los nuevos y de sus entradas
+de auditoría, y la mantención de la búsqueda, los factores y los rollups del
+bloque, y un evento del feed de cambios (miapp.changes) por registro escrito.
+Los campos omitidos conservan su valor en los registros existentes y
+los ítems sin cambios no se escriben. Si un bloque falla se revierte completo
+y sus ítems se informan con error; los demás bloques quedan escritos.
+
+La respuesta trae un resultado por ítem ({index, status, id} o {index,
+status: "error", errors}) y los totales por estado.
+
+Acciones por conjunto (POST /api/tax-grades/bulk-deactivate/ y
+/api/dividend-maintainers/bulk-delete/): toman los mismos filtros que el
+listado (query params, al menos uno) y aplican un solo UPDATE o DELETE sobre
+el conjunto. La auditoría se escribe con INSERT ... SELECT (miapp.audit) y
+los totales con un GROUP BY del conjunto antes de escribir. Con preview=true
+solo se informa cuántos registros (y de qué años) se modificarían; si el
+cuerpo trae expected_count y el conjunto ya no tiene esa cantidad se responde
+412 sin escribir nada.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from .audit import dividend_audit_state, insert_audit_entries, tax_grade_audit_state
+from .cache import bump_cache_generations
+from .changes import change_event, insert_change_events, record_changes
+from .conditional import PreconditionFailed
+from .factors import sync_dividend_factors
+from .models import AuditLog, DividendFactor, DividendMaintainer, ImportRecord, TaxGrade
+from .rollback import import_change, rollback_state
+from .rut import normalize_rut
+from .search import index_search_documents, remove_search_documents
+from .summaries import (
+    DIVIDEND_ROLLUP, DIVIDEND_ROLLUPS, TAX_GRADE_ROLLUPS, TAX_GRADE_SUMMARY, SummaryDelta, set_change_delta,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITEMS = 50000
+DEFAULT_CHUNK_SIZE = 500
+ITEMS_KEY = 'items'
+PREVIEW_PARAM = 'preview'
+EXPECTED_COUNT_KEY = 'expected_count'
+STATUSES = ('created', 'updated', 'unchanged', 'error')
+
+
+def bulk_max_items():
+    return getattr(settings, 'BULK_WRITE_MAX_ITEMS', DEFAULT_MAX_ITEMS)
+
+
+def bulk_chunk_size():
+    return getattr(settings, 'BULK_WRITE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def parse_bulk_items(data):
+    """Lista de ítems del cuerpo (lista JSON o {"items": [...]}); lanza ValidationError"""
+    if isinstance(data, dict) and ITEMS_KEY in data:
+        data = data[ITEMS_KEY]
+    if not isinstance(data, list):
+        raise ValidationError({ITEMS_KEY: 'Se espera una lista de registros.'})
+    if not data:
+        raise ValidationError({ITEMS_KEY: 'La lista de registros está vacía.'})
+    max_items = bulk_max_items()
+    if len(data) > max_items:
+        raise ValidationError({ITEMS_KEY: f'Máximo {max_items} registros por petición (se recibieron {len(data)}).'})
+    return data
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer de las cargas en lote: valida cada ítem por separado y
+    entrega los errores por posición en lugar de rechazar la lista completa.
+    """
+
+    def validate_items(self, items):
+        """[(datos validados, None) o (None, errores)] alineado con `items`"""
+        results = []
+        for item in items:
+            try:
+                results.append((self.child.run_validation(item), None))
+            except ValidationError as exc:
+                results.append((None, exc.detail))
+        return results
+
+
+class BulkUpsert:
+    """
+    Upsert por bloques de un modelo con VersionedModelMixin. Las subclases
+    definen la llave de negocio (key_fields), los rollups que mantienen y
+    after_write() para los índices derivados (búsqueda, factores).
+    """
+
+    model = None
+    key_fields = ()
+    year_field = None
+    rollups = ()
+    # Valores que se asignan solo al crear (el ítem no los puede cambiar)
+    create_defaults = {}
+    # Campos que identifican el registro en ImportRecord (rut, year)
+    label_fields = ()
+
+    def __init__(self, user, serialize, ip_address=None, user_agent='', import_obj=None):
+        self.user = user
+        self.serialize = serialize
+        self.ip_address = ip_address
+        self.user_agent = user_agent
+        # Con import_obj cada escritura queda en un ImportRecord (revertible con miapp.rollback)
+        self.import_obj = import_obj
+        self.entity = self.model._meta.db_table
+
+    def prepare(self, attrs):
+        """Datos validados -> valores del modelo (campos derivados de la llave)"""
+        return dict(attrs)
+
+    def item_key(self, attrs):
+        return tuple(attrs.get(name) for name in self.key_fields)
+
+    def instance_key(self, instance):
+        return tuple(getattr(instance, name) for name in self.key_fields)
+
+    def lookup(self, keys):
+        """Registros existentes de las llaves del bloque (con bloqueo de fila)"""
+        raise NotImplementedError
+
+    def after_write(self, created, updated):
+        """Mantención de índices derivados; `updated` es [(instancia, campos modificados)]"""
+
+    def run(self, validated):
+        """Escribe los ítems válidos de validate_items() y retorna el resumen con los resultados"""
+        results = [None] * len(validated)
+        seen = {}
+        pending = []
+        for index, (attrs, errors) in enumerate(validated):
+            if errors:
+                results[index] = {'index': index, 'status': 'error', 'errors': errors}
+                continue
+            attrs = self.prepare(attrs)
+            key = self.item_key(attrs)
+            if key in seen:
+                results[index] = {
+                    'index': index, 'status': 'error',
+                    'errors': {'non_field_errors': [f'Llave duplicada en el lote (ítem {seen[key]}).']},
+                }
+                continue
+            seen[key] = index
+            pending.append((index, key, attrs))
+
+        years = set()
+        chunk_size = bulk_chunk_size()
+        try:
+            for start in range(0, len(pending), chunk_size):
+                chunk_results, chunk_years = self.write_batch(pending[start:start + chunk_size])
+                for index, result in chunk_results.items():
+                    results[index] = result
+                years.update(chunk_years)
+        finally:
+            # Invalidar la caché de respuestas de los años escritos
+            bump_cache_generations(self.entity, years)
+
+        counts = dict.fromkeys(STATUSES, 0)
+        for result in results:
+            counts[result['status']] += 1
+        return {'total': len(results), **counts, 'results': results}
+
+    def write_batch(self, chunk):
+        """Escribe un bloque en su transacción; si falla, todos sus ítems quedan con error"""
+        try:
+            with transaction.atomic():
+                return self.write_chunk(chunk)
+        except DatabaseError as exc:
+            logger.exception('Error escribiendo un bloque de %s', self.entity)
+            return {
+                index: {'index': index, 'status': 'error', 'errors': {'non_field_errors': [str(exc)]}}
+                for index, _, _ in chunk
+            }, ()
+
+    def write_chunk(self, chunk):
+        """Escribe un bloque dentro de la transacción; retorna ({índice: resultado}, años)"""
+        existing = {}
+        for instance in self.lookup([key for _, key, _ in chunk]):
+            existing.setdefault(self.instance_key(instance), instance)
+
+        now = timezone.now()
+        delta = SummaryDelta(self.rollups)
+        created, updated, audit_entries = [], [], []
+        update_fields = {'updated_by', 'updated_at', 'version'}
+        results, years, import_changes, change_events = {}, set(), [], []
+
+        for index, key, attrs in chunk:
+            instance = existing.get(key)
+            if instance is None:
+                instance = self.model(**self.create_defaults, **attrs, created_by=self.user, updated_by=self.user)
+                created.append(instance)
+                if self.import_obj is not None:
+                    import_changes.append((index, instance, None, True))
+                change_events.append(change_event(instance, 'create'))
+                delta.change(None, delta.snapshot(instance))
+                audit_entries.append(self.audit_entry(instance, 'create', None, self.serialize(instance)))
+                status = 'created'
+            else:
+                changed = [name for name, value in attrs.items() if getattr(instance, name) != value]
+                if changed:
+                    before = self.serialize(instance)
+                    before_snapshot = delta.snapshot(instance)
+                    if self.import_obj is not None:
+                        import_changes.append((index, instance, rollback_state(instance), False))
+                    for name in changed:
+                        setattr(instance, name, attrs[name])
+                    instance.updated_by = self.user
+                    instance.updated_at = now
+                    instance.version += 1
+                    update_fields.update(changed)
+                    updated.append((instance, changed))
+                    change_events.append(change_event(instance, 'update'))
+                    delta.change(before_snapshot, delta.snapshot(instance))
+                    audit_entries.append(self.audit_entry(instance, 'update', before, self.serialize(instance)))
+                    status = 'updated'
+                else:
+                    status = 'unchanged'
+            if status != 'unchanged':
+                years.add(getattr(instance, self.year_field))
+            results[index] = {'index': index, 'status': status, 'id': str(instance.pk)}
+
+        if updated:
+            self.model.objects.bulk_update(
+                [instance for instance, _ in updated], sorted(update_fields), batch_size=len(chunk)
+            )
+        self.model.objects.bulk_create(created, batch_size=len(chunk))
+        AuditLog.objects.bulk_create(audit_entries, batch_size=len(chunk))
+        record_changes(change_events)
+        if import_changes:
+            self.record_import_changes(import_changes)
+        self.after_write(created, updated)
+        delta.apply()
+        return results, years
+
+    def record_import_changes(self, changes):
+        """ImportRecord de cada registro creado o actualizado, con su estado anterior y versión"""
+        records = []
+        for index, instance, before, created in changes:
+            rut, year = (getattr(instance, name) for name in self.label_fields)
+            records.append(ImportRecord(
+                import_id=self.import_obj,
+                row_number_or_page=index,
+                rut=str(rut)[:20],
+                year=year,
+                status='success',
+                error_message='Registro creado exitosamente' if created else 'Registro actualizado exitosamente',
+                **import_change(instance, before, created),
+            ))
+        ImportRecord.objects.bulk_create(records, batch_size=len(records))
+
+    def audit_entry(self, instance, action, before, after):
+        return AuditLog(
+            user_id=self.user,
+            entity=self.entity,
+            entity_id=str(instance.pk),
+            action=action,
+            before=before,
+            after=after,
+            ip_address=self.ip_address,
+            user_agent=self.user_agent,
+            timestamp=timezone.now(),
+        )
+
+
+class TaxGradeBulkUpsert(BulkUpsert):
+    """Upsert de TaxGrade por (rut normalizado, año); los nuevos quedan con fuente 'sistema'"""
+
+    model = TaxGrade
+    key_fields = ('rut_normalizado', 'year')
+    year_field = 'year'
+    rollups = TAX_GRADE_ROLLUPS
+    create_defaults = {'fuente_ingreso': 'sistema'}
+    label_fields = ('rut', 'year')
+
+    def prepare(self, attrs):
+        attrs = dict(attrs)
+        attrs['rut_normalizado'] = normalize_rut(attrs['rut'])
+        return attrs
+
+    def lookup(self, keys):
+        return TaxGrade.objects.select_for_update().filter(
+            rut_normalizado__in={rut for rut, _ in keys},
+            year__in={year for _, year in keys},
+        ).order_by('created_at')
+
+    def after_write(self, created, updated):
+        index_search_documents(created + [instance for instance, _ in updated])
+
+
+class DividendBulkUpsert(BulkUpsert):
+    """Upsert de DividendMaintainer por (periodo, instrumento, fecha de pago, secuencia)"""
+
+    model = DividendMaintainer
+    key_fields = ('periodo_comercial', 'instrumento', 'fecha_pago_dividendo', 'secuencia_evento_capital')
+    year_field = 'periodo_comercial'
+    rollups = DIVIDEND_ROLLUPS
+    label_fields = ('instrumento', 'periodo_comercial')
+
+    def lookup(self, keys):
+        return DividendMaintainer.objects.select_for_update().filter(
+            periodo_comercial__in={key[0] for key in keys},
+            instrumento__in={key[1] for key in keys},
+        ).order_by('created_at')
+
+    def after_write(self, created, updated):
+        index_search_documents(created + [instance for instance, _ in updated])
+        sync_dividend_factors(created + [
+            instance for instance, changed in updated if 'factores_8_37' in changed
+        ])
+
+
+def is_truthy(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'si', 'sí')
+
+
+class BulkFilterMixin:
+    """
+    Acciones por conjunto de un ViewSet sobre los registros que cumplen los
+    filtros del listado. `bulk_filter_params` son los parámetros que cuentan
+    como filtro (se exige al menos uno para no afectar la tabla completa).
+    """
+
+    bulk_filter_params = ()
+
+    def has_bulk_filter(self, name):
+        return name in self.bulk_filter_params
+
+    def bulk_filter_queryset(self):
+        if not any(value.strip() and self.has_bulk_filter(name) for name, value in self.request.query_params.items()):
+            raise ValidationError({
+                'filters': f"Se requiere al menos un filtro del listado: {', '.join(self.bulk_filter_params)}."
+            })
+        return self.filter_queryset(self.get_queryset()).order_by()
+
+    def bulk_options(self):
+        """(preview, expected_count) de la query string o del cuerpo"""
+        data = self.request.data if hasattr(self.request.data, 'get') else {}
+        preview = is_truthy(self.request.query_params.get(PREVIEW_PARAM, data.get(PREVIEW_PARAM, '')))
+        expected_count = data.get(EXPECTED_COUNT_KEY, self.request.query_params.get(EXPECTED_COUNT_KEY))
+        if expected_count in (None, ''):
+            return preview, None
+        try:
+            return preview, int(expected_count)
+        except (TypeError, ValueError):
+            raise ValidationError({EXPECTED_COUNT_KEY: 'Debe ser un número entero.'})
+
+
+def _preview(queryset, rollup, year_field):
+    """Cantidad y años del conjunto a partir del GROUP BY del rollup"""
+    totals = rollup.group_totals(queryset)
+    position = rollup.group_fields.index(year_field)
+    years = sorted({group[position] for group in totals})
+    return {'preview': True, 'count': sum(count for _, count in totals.values()), 'years': years}
+
+
+def _check_expected_count(count, expected_count):
+    if expected_count is not None and count != expected_count:
+        raise PreconditionFailed(
+            f'El conjunto cambió desde la vista previa: {count} registros en lugar de {expected_count}.'
+        )
+
+
+def _years(delta, rollup, year_field):
+    position = rollup.group_fields.index(year_field)
+    return sorted({group[position] for group in delta.deltas[rollup]})
+
+
+def deactivate_tax_grades(queryset, user, *, ip_address=None, user_agent='', preview=False, expected_count=None):
+    """Marca como inactivos los TaxGrade activos de `queryset` con un solo UPDATE"""
+    targets = queryset.filter(status='activo')
+    if preview:
+        return _preview(targets, TAX_GRADE_SUMMARY, 'year')
+
+    now = timezone.now()
+    with transaction.atomic():
+        # El INSERT ... SELECT de auditoría lee (y bloquea) el conjunto antes del UPDATE
+        count = insert_audit_entries(
+            targets, user=user, action='delete', before=tax_grade_audit_state, after={'status': 'inactivo'},
+            ip_address=ip_address, user_agent=user_agent, timestamp=now,
+        )
+        _check_expected_count(count, expected_count)
+        delta = set_change_delta(targets, TAX_GRADE_ROLLUPS, {'status': 'inactivo'})
+        years = _years(delta, TAX_GRADE_SUMMARY, 'year')
+        insert_change_events(targets, 'update', timestamp=now, version=F('version') + 1)
+        count = targets.update(status='inactivo', updated_by=user, updated_at=now, version=F('version') + 1)
+        delta.apply()
+    bump_cache_generations(TaxGrade._meta.db_table, years)
+    return {'preview': False, 'count': count, 'years': years}
+
+
+def delete_dividends(queryset, user, *, ip_address=None, user_agent='', preview=False, expected_count=None,
+                     freeze=False):
+    """
+    Elimina los dividendos de `queryset` sin cargar sus instancias (más sus
+    filas de dividend_factors y del índice de búsqueda). Con `freeze` el
+    conjunto se fija antes por id: necesario cuando los filtros dependen de
+    dividend_factors o del índice de búsqueda, que se borran primero.
+    """
+    if preview:
+        return _preview(queryset, DIVIDEND_ROLLUP, 'periodo_comercial')
+
+    with transaction.atomic():
+        targets = queryset
+        if freeze:
+            targets = DividendMaintainer.objects.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+        now = timezone.now()
+        count = insert_audit_entries(
+            targets, user=user, action='delete', before=dividend_audit_state, after=None,
+            ip_address=ip_address, user_agent=user_agent, timestamp=now,
+        )
+        _check_expected_count(count, expected_count)
+        insert_change_events(targets, 'delete', timestamp=now)
+        delta = set_change_delta(targets, DIVIDEND_ROLLUPS)
+        years = _years(delta, DIVIDEND_ROLLUP, 'periodo_comercial')
+        remove_search_documents(DividendMaintainer, targets.values('pk'))
+        DividendFactor.objects.filter(dividend__in=targets.values('pk')).delete()
+        # La cascada a factores obliga a QuerySet.delete() a leer las filas: solo
+        # los pk, porque los factores ya se borraron arriba
+        count = targets.only('pk').delete()[1].get(DividendMaintainer._meta.label, 0)
+        delta.apply()
+    bump_cache_generations(DividendMaintainer._meta.db_table, years)
+    return {'preview': False, 'count': count, 'years': years}
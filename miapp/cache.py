@@ -0,0 +1,127 @@
+"""
+Caché de respuestas versionada para los listados y detalles de la API.
+
+Cada respuesta se guarda bajo una llave que incluye los parámetros de la
+consulta normalizados y la generación vigente de (entidad, año). Las
+escrituras (perform_create/update/destroy e importaciones) incrementan esa
+generación, con lo que las respuestas anteriores dejan de encontrarse sin
+recorrer ni borrar llaves; expiran solas por TIMEOUT o por el LRU del backend.
+
+Además de la generación por año existe una generación 'all' de la entidad,
+que se incrementa en toda escritura y versiona las consultas que no filtran
+por un único año y los detalles.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+API_CACHE_ALIAS = 'api'
+ALL_YEARS = 'all'
+
+
+def get_api_cache():
+    alias = API_CACHE_ALIAS if API_CACHE_ALIAS in settings.CACHES else 'default'
+    return caches[alias]
+
+
+def api_cache_enabled():
+    return getattr(settings, 'API_CACHE_ENABLED', True)
+
+
+def generation_key(entity, year=ALL_YEARS):
+    return f'api:gen:{entity}:{year}'
+
+
+def _normalize_year(year):
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return ALL_YEARS
+
+
+def get_generation(entity, year=ALL_YEARS):
+    """
+    Generación vigente de (entidad, año). Si la llave no existe (o el backend
+    la desalojó) se inicializa con una marca de tiempo, nunca con un valor
+    que una respuesta antigua pudiera tener guardado.
+    """
+    cache = get_api_cache()
+    key = generation_key(entity, year)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_cache_generations(entity, years=()):
+    """Invalida las respuestas cacheadas de la entidad para los años indicados"""
+    if not api_cache_enabled():
+        return
+    cache = get_api_cache()
+    keys = [generation_key(entity)]
+    keys += [generation_key(entity, year) for year in {_normalize_year(y) for y in years} - {ALL_YEARS}]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Sin generación previa: cualquier valor nuevo invalida lo anterior
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def response_cache_key(request, view, entity, year):
+    """Llave de la respuesta: ruta, parámetros ordenados, formato y generación"""
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = json.dumps([
+        request.get_host(), request.path, view.action, params,
+        getattr(renderer, 'format', None), get_generation(entity, year),
+    ], separators=(',', ':'))
+    return f'api:resp:{entity}:{hashlib.sha1(raw.encode("utf-8")).hexdigest()}'
+
+
+class CachedResponseMixin:
+    """
+    Cachea list/retrieve de un ViewSet. `cache_entity` identifica la entidad
+    (db_table) y `cache_year_param` el parámetro que acota el año del listado.
+    Agrega el header X-Cache (HIT/MISS).
+    """
+
+    cache_entity = None
+    cache_year_param = None
+
+    def list(self, request, *args, **kwargs):
+        year = _normalize_year(request.query_params.get(self.cache_year_param)) if self.cache_year_param else ALL_YEARS
+        return self._cached_response(super().list, year, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, ALL_YEARS, request, *args, **kwargs)
+
+    def _cached_response(self, handler, year, request, *args, **kwargs):
+        if not api_cache_enabled() or not self.cache_entity:
+            return handler(request, *args, **kwargs)
+
+        cache = get_api_cache()
+        key = response_cache_key(request, self, self.cache_entity, year)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def invalidate_cache(self, *years):
+        bump_cache_generations(self.cache_entity, years)
@@ -0,0 +1,168 @@
+"""
+Feed de cambios (change data capture) para sincronización incremental.
+
+Cada escritura de calificaciones y dividendos (ViewSets, cargas en lote,
+acciones por conjunto, importaciones, ingesta y rollback) agrega una fila
+compacta a change_events en la misma transacción: entidad, id, operación y
+versión resultante. Los sistemas externos leen
+GET /api/changes/?since=<cursor>&limit= (keyset por id) y piden solo los
+registros que cambiaron, en lugar de exportar años completos. create y
+update se deben tratar como upsert (la compactación puede dejar solo el
+último evento de un registro).
+
+Los ids se asignan al insertar y una transacción larga puede confirmarse
+después de otra con ids mayores: el feed entrega solo eventos con más de
+CHANGE_FEED_SETTLE_SECONDS de antigüedad para no saltarse los pendientes.
+
+POST /api/changes/ack/ confirma la posición de un consumidor y el comando
+compact_change_feed borra los eventos confirmados por todos los consumidores
+y los reemplazados por un evento posterior del mismo registro.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, DateTimeField, Exists, F, Max, Min, OuterRef, Value
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .audit import insert_select
+from .models import ChangeEvent, ChangeFeedConsumer
+
+DEFAULT_LIMIT = 500
+DEFAULT_MAX_LIMIT = 5000
+DEFAULT_SETTLE_SECONDS = 5
+COMPACT_CHUNK_SIZE = 5000
+FEED_FIELDS = ('id', 'entity', 'entity_id', 'operation', 'version', 'created_at')
+
+
+def settle_seconds():
+    return getattr(settings, 'CHANGE_FEED_SETTLE_SECONDS', DEFAULT_SETTLE_SECONDS)
+
+
+def max_limit():
+    return getattr(settings, 'CHANGE_FEED_MAX_LIMIT', DEFAULT_MAX_LIMIT)
+
+
+# --- Escritura ----------------------------------------------------------------
+
+def change_event(instance, operation):
+    """ChangeEvent (sin guardar) de una escritura de `instance`"""
+    return ChangeEvent(
+        entity=instance._meta.db_table,
+        entity_id=instance.pk,
+        operation=operation,
+        version=getattr(instance, 'version', None),
+    )
+
+
+def record_change(instance, operation):
+    return change_event(instance, operation).save()
+
+
+def record_changes(events):
+    if events:
+        ChangeEvent.objects.bulk_create(events, batch_size=len(events))
+
+
+def insert_change_events(queryset, operation, *, timestamp, version=F('version')):
+    """
+    Un evento por registro de `queryset` con un INSERT ... SELECT (acciones
+    por conjunto). `version` es la expresión de la versión tras el cambio.
+    """
+    return insert_select(queryset, ChangeEvent, {
+        'entity': Value(queryset.model._meta.db_table, output_field=CharField()),
+        'entity_id': F('pk'),
+        'operation': Value(operation, output_field=CharField()),
+        'version': version,
+        'created_at': Value(timestamp, output_field=DateTimeField()),
+    })
+
+
+# --- Lectura ------------------------------------------------------------------
+
+def parse_cursor(value, name='since'):
+    if value in (None, ''):
+        return 0
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        cursor = -1
+    if cursor < 0:
+        raise ValidationError({name: 'Cursor inválido.'})
+    return cursor
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        raise ValidationError({'limit': 'Debe ser un entero positivo.'})
+    return min(limit, max_limit())
+
+
+def read_changes(since=0, limit=DEFAULT_LIMIT, entity=None):
+    """
+    Eventos con id > `since` en orden de id. Retorna
+    {'results', 'cursor', 'has_more'}; `cursor` es el `since` de la página
+    siguiente (no avanza si no hay eventos nuevos).
+    """
+    queryset = ChangeEvent.objects.filter(
+        id__gt=since, created_at__lte=timezone.now() - timedelta(seconds=settle_seconds())
+    )
+    if entity:
+        queryset = queryset.filter(entity=entity)
+    rows = list(queryset.order_by('id').values_list(*FEED_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [dict(zip(FEED_FIELDS, row)) for row in rows],
+        'cursor': str(rows[-1][0] if rows else since),
+        'has_more': has_more,
+    }
+
+
+# --- Confirmación y retención -------------------------------------------------
+
+def acknowledge(consumer, position):
+    """
+    Avanza la posición confirmada de `consumer` (nunca retrocede ni pasa del
+    último evento existente) y la retorna.
+    """
+    latest = ChangeEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+    position = min(position, latest)
+    with transaction.atomic():
+        entry, _ = ChangeFeedConsumer.objects.select_for_update().get_or_create(name=consumer)
+        if position > entry.position:
+            entry.position = position
+            entry.save(update_fields=['position', 'updated_at'])
+    return entry.position
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += ChangeEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def compact_changes(chunk_size=COMPACT_CHUNK_SIZE):
+    """
+    Borra los eventos confirmados por todos los consumidores registrados
+    (ninguno si no hay consumidores) y los reemplazados por un evento
+    posterior del mismo registro. Retorna {'acknowledged', 'superseded'}.
+    """
+    acknowledged = ChangeFeedConsumer.objects.aggregate(position=Min('position'))['position'] or 0
+    superseded = ChangeEvent.objects.filter(Exists(ChangeEvent.objects.filter(
+        entity_id=OuterRef('entity_id'), entity=OuterRef('entity'), id__gt=OuterRef('id'),
+    )))
+    return {
+        'acknowledged': _delete_in_chunks(ChangeEvent.objects.filter(id__lte=acknowledged), chunk_size),
+        'superseded': _delete_in_chunks(superseded, chunk_size),
+    }
@@ -0,0 +1,93 @@
+"""
+Representación columnar de los dividendos (?layout=columnar).
+
+En lugar de un objeto por fila (que repite los nombres de las columnas en
+cada registro) se entrega una lista por columna:
+
+    {"layout": "columnar", "columns": {"id": [...], "instrumento": [...]},
+     "factor_numbers": [8, ..., 37], "factors": [[0.5, null, ...], ...]}
+
+Los factores Factor-8..Factor-37 van como una matriz de filas x 30 armada con
+NumPy desde la tabla dividend_factors (sin parsear factores_8_37). En JSON
+la matriz es una lista de listas con null donde falta el factor; en
+MessagePack es un bloque binario float64 little-endian con NaN en los
+faltantes: {"dtype": "<f8", "shape": [filas, 30], "data": <bytes>}.
+"""
+import numpy as np
+
+from .exports import json_number
+from .models import FACTOR_NUMBERS, SII_FIELD_NUMBERS, DividendFactor, sii_field_key
+
+LAYOUT_PARAM = 'layout'
+COLUMNAR = 'columnar'
+FACTORS_FIELD = 'factores_8_37'
+SII_FIELD = 'campos_detallados_sii'
+# Ids por consulta al leer dividend_factors de una página
+FACTOR_LOOKUP_BATCH_SIZE = 1000
+
+
+def wants_columnar(request):
+    return request.query_params.get(LAYOUT_PARAM) == COLUMNAR
+
+
+def factor_matrix(ids, dividend_queryset=None):
+    """
+    Matriz float64 (len(ids) x 30) con los factores de `ids` y NaN donde el
+    registro no tiene el factor. Con `dividend_queryset` los factores se leen
+    con una subconsulta en lugar de listas de ids (exportaciones completas).
+    """
+    matrix = np.full((len(ids), len(FACTOR_NUMBERS)), np.nan)
+    if not ids:
+        return matrix
+    position = {pk: index for index, pk in enumerate(ids)}
+    if dividend_queryset is not None:
+        sources = [DividendFactor.objects.filter(dividend__in=dividend_queryset.order_by().values('pk'))]
+    else:
+        sources = [
+            DividendFactor.objects.filter(dividend_id__in=ids[start:start + FACTOR_LOOKUP_BATCH_SIZE])
+            for start in range(0, len(ids), FACTOR_LOOKUP_BATCH_SIZE)
+        ]
+    for source in sources:
+        rows = [
+            (position[dividend_id], factor_no, valor)
+            for dividend_id, factor_no, valor in source.values_list('dividend_id', 'factor_no', 'valor')
+            if dividend_id in position
+        ]
+        if rows:
+            row_index, factor_no, valor = zip(*rows)
+            matrix[np.array(row_index), np.array(factor_no) - FACTOR_NUMBERS.start] = np.array(valor, dtype=np.float64)
+    return matrix
+
+
+def sii_matrix(values):
+    """Matriz float64 (filas x 29) de los campos SII a partir de los JSON campos_detallados_sii"""
+    matrix = np.array(
+        [[json_number(campos, sii_field_key(n)) for n in SII_FIELD_NUMBERS] for campos in values],
+        dtype=np.float64,
+    )
+    return matrix.reshape(len(values), len(SII_FIELD_NUMBERS))
+
+
+def encode_matrix(matrix, binary=False):
+    """Lista de listas con null (JSON) o bloque float64 con su forma (MessagePack)"""
+    if binary:
+        return {
+            'dtype': '<f8',
+            'shape': list(matrix.shape),
+            'data': matrix.astype('<f8', copy=False).tobytes(),
+        }
+    values = matrix.astype(object)
+    values[np.isnan(matrix)] = None
+    return values.tolist()
+
+
+def columnar_payload(plan, rows, factors=None, sii=None, binary=False):
+    """Arma la respuesta columnar a partir de las filas de un RowPlan"""
+    payload = {'layout': COLUMNAR, 'columns': plan.to_columns(rows)}
+    if factors is not None:
+        payload['factor_numbers'] = list(FACTOR_NUMBERS)
+        payload['factors'] = encode_matrix(factors, binary)
+    if sii is not None:
+        payload['sii_field_numbers'] = list(SII_FIELD_NUMBERS)
+        payload['sii'] = encode_matrix(sii, binary)
+    return payload
@@ -0,0 +1,174 @@
+"""
+Compresión de respuestas según Accept-Encoding: brotli (si la librería está
+instalada) o gzip. Solo se comprimen respuestas de al menos
+RESPONSE_COMPRESSION_MIN_LENGTH bytes, con un Content-Type de
+RESPONSE_COMPRESSION_CONTENT_TYPES y cuando el resultado es más chico.
+
+Las respuestas en streaming (exportaciones CSV) se comprimen a medida que se
+generan: se leen los primeros fragmentos hasta llegar al umbral y, si la
+respuesta lo supera, el resto pasa por un compresor incremental sin armar el
+contenido completo en memoria.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se usa gzip
+    brotli = None
+
+DEFAULT_MIN_LENGTH = 1024
+DEFAULT_BROTLI_QUALITY = 5
+DEFAULT_CONTENT_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/x-msgpack',
+    'image/svg+xml',
+)
+# Nivel de gzip de las respuestas (el mismo de django.utils.text.compress_string)
+GZIP_LEVEL = 6
+
+
+def _min_length():
+    return getattr(settings, 'RESPONSE_COMPRESSION_MIN_LENGTH', DEFAULT_MIN_LENGTH)
+
+
+def _brotli_quality():
+    return getattr(settings, 'RESPONSE_COMPRESSION_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+
+
+def accepted_encodings(request):
+    """{codificación: q} de Accept-Encoding (sin las de q=0)"""
+    encodings = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            encodings[name.lower()] = quality
+    return encodings
+
+
+def negotiate_encoding(request):
+    """'br', 'gzip' o None según lo que acepta el cliente (brotli primero)"""
+    encodings = accepted_encodings(request)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    for name in candidates:
+        if name in encodings or '*' in encodings:
+            return name
+    return None
+
+
+def compress_bytes(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=_brotli_quality())
+    return compress_string(content)
+
+
+def compress_stream(chunks, encoding):
+    """
+    Comprime una secuencia de bytes de forma incremental. No fuerza un flush
+    por fragmento (las exportaciones generan una línea por fragmento): el
+    compresor entrega bloques a medida que llena su buffer.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=_brotli_quality())
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def is_compressible(response):
+    """Respuestas con contenido, sin codificar y con un Content-Type de texto/JSON"""
+    if response.status_code in (204, 206, 304) or response.has_header('Content-Encoding'):
+        return False
+    if 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    content_types = getattr(settings, 'RESPONSE_COMPRESSION_CONTENT_TYPES', DEFAULT_CONTENT_TYPES)
+    return any(content_type.startswith(prefix) for prefix in content_types)
+
+
+def _mark_encoded(response, encoding):
+    # Igual que GZipMiddleware: el ETag pasa a ser débil porque cambia la representación
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    response['Content-Encoding'] = encoding
+
+
+def _peek(iterator, min_length):
+    """Lee fragmentos hasta juntar min_length bytes; retorna (fragmentos, llegó_al_umbral)"""
+    head, size = [], 0
+    for chunk in iterator:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= min_length:
+            return head, True
+    return head, False
+
+
+def _chain(head, iterator):
+    yield from head
+    yield from iterator
+
+
+def compress_streaming_response(request, response):
+    """Comprime una respuesta en streaming si supera el umbral (las async no se tocan)"""
+    if response.is_async:
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = negotiate_encoding(request)
+    if encoding is None:
+        return response
+
+    iterator = iter(response.streaming_content)
+    head, above_threshold = _peek(iterator, _min_length())
+    if not above_threshold:
+        response.streaming_content = head
+        return response
+
+    response.streaming_content = compress_stream(_chain(head, iterator), encoding)
+    if response.has_header('Content-Length'):
+        del response['Content-Length']
+    _mark_encoded(response, encoding)
+    return response
+
+
+def compress_response(request, response):
+    """Comprime una respuesta ya renderizada (o en streaming) según Accept-Encoding"""
+    if not is_compressible(response):
+        return response
+    if response.streaming:
+        return compress_streaming_response(request, response)
+    if len(response.content) < _min_length():
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = negotiate_encoding(request)
+    if encoding is None:
+        return response
+    compressed = compress_bytes(response.content, encoding)
+    if len(compressed) >= len(response.content):
+        return response
+
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    _mark_encoded(response, encoding)
+    return response
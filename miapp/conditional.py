@@ -0,0 +1,183 @@
+"""
+Peticiones condicionales sobre los listados y detalles.
+
+GET (ETag / If-None-Match): el ETag se calcula antes de ejecutar la vista con
+una sola consulta indexada:
+- detalle: id y `version` del registro (por pk)
+- listado: MAX(updated_at) y COUNT(*) del queryset filtrado, junto con los
+  parámetros de la consulta y el formato (cada página o filtro tiene el suyo)
+Si coincide con If-None-Match se responde 304 sin cargar ni serializar.
+
+Escrituras (If-Match): PUT/PATCH/DELETE comparan el ETag del detalle con la
+versión actual y responden 412 si no coincide. La actualización se escribe
+con UPDATE ... WHERE id = %s AND version = %s, solo con los campos que
+cambiaron, así que dos ediciones concurrentes no se pisan sin tomar locks.
+"""
+import hashlib
+import json
+
+from django.db.models import Count, Max
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'El registro fue modificado por otro usuario; vuelva a cargarlo.'
+    default_code = 'precondition_failed'
+
+
+def compute_etag(request, *parts):
+    """ETag fuerte a partir de la ruta, los parámetros, el formato y `parts`"""
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = json.dumps(
+        [request.path, params, getattr(renderer, 'format', None), *parts],
+        separators=(',', ':'), default=str,
+    )
+    return quote_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
+def detail_etag(pk, version):
+    """ETag del detalle de un registro versionado"""
+    return quote_etag(f'{pk}-{version}')
+
+
+def etag_matches(request, etag, header='HTTP_IF_NONE_MATCH'):
+    """
+    Comparación débil (If-None-Match): una respuesta comprimida entrega el
+    mismo ETag como W/"..." y el cliente lo devuelve así.
+    """
+    value = request.META.get(header)
+    if not value:
+        return False
+    etags = {tag.removeprefix('W/') for tag in parse_etags(value)}
+    return '*' in etags or etag.removeprefix('W/') in etags
+
+
+class ConditionalGetMixin:
+    """
+    Agrega ETag a list/retrieve y responde 304 a If-None-Match. Debe ir antes
+    de CachedResponseMixin para que el 304 no consulte la caché.
+    """
+
+    etag_field = 'updated_at'
+    version_field = 'version'
+
+    def list(self, request, *args, **kwargs):
+        fingerprint = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+            last_modified=Max(self.etag_field), total=Count('pk'),
+        )
+        etag = compute_etag(request, fingerprint['last_modified'], fingerprint['total'])
+        return self._conditional_response(super().list, etag, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        version = (
+            self.get_queryset().order_by()
+            .filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+            .values_list(self.version_field, flat=True)
+            .first()
+        )
+        if version is None:
+            # Registro inexistente: la vista responde el 404 habitual
+            return super().retrieve(request, *args, **kwargs)
+        etag = detail_etag(kwargs[lookup_url_kwarg], version)
+        return self._conditional_response(super().retrieve, etag, request, *args, **kwargs)
+
+    def _conditional_response(self, handler, etag, request, *args, **kwargs):
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        return response
+
+
+class OptimisticConcurrencyMixin:
+    """
+    Concurrencia optimista para update/partial_update/destroy de modelos con
+    VersionedModelMixin. La versión esperada se toma de If-Match (ETag del
+    detalle), del campo `version` del cuerpo o, si no viene, de la versión
+    leída al cargar el registro.
+
+    En perform_update usar save_versioned(serializer, ...) en lugar de
+    serializer.save(): reutiliza la instancia ya cargada (una sola lectura) y
+    escribe solo los campos modificados.
+    """
+
+    def get_expected_version(self, instance):
+        if_match = self.request.META.get('HTTP_IF_MATCH')
+        if if_match:
+            etags = parse_etags(if_match)
+            if '*' in etags:
+                return instance.version
+            prefix = f'{instance.pk}-'
+            versions = {
+                int(tag[len(prefix):])
+                for tag in (etag.removeprefix('W/').strip('"') for etag in etags)
+                if tag.startswith(prefix) and tag[len(prefix):].isdigit()
+            }
+            if instance.version in versions:
+                return instance.version
+            raise PreconditionFailed()
+        body_version = self.request.data.get('version') if hasattr(self.request.data, 'get') else None
+        if body_version not in (None, ''):
+            try:
+                return int(body_version)
+            except (TypeError, ValueError):
+                raise ValidationError({'version': 'Debe ser un número entero.'})
+        return instance.version
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        self.expected_version = self.get_expected_version(instance)
+        if self.expected_version != instance.version:
+            raise PreconditionFailed()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        response = Response(serializer.data)
+        response['ETag'] = detail_etag(instance.pk, instance.version)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.expected_version = self.get_expected_version(instance)
+        if self.expected_version != instance.version:
+            raise PreconditionFailed()
+        self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def save_versioned(self, serializer, **extra):
+        """
+        Aplica validated_data (+ extra) a serializer.instance y lo guarda con
+        UPDATE condicional sobre la versión esperada, escribiendo solo los
+        campos que cambiaron. Lanza PreconditionFailed si hubo una escritura
+        concurrente.
+        """
+        instance = serializer.instance
+        values = {**serializer.validated_data, **extra}
+        opts = instance._meta
+        changed = []
+        for name, value in values.items():
+            field = opts.get_field(name)
+            current = getattr(instance, field.attname)
+            new = value.pk if field.is_relation and value is not None else value
+            if current != new:
+                setattr(instance, name, value)
+                changed.append(name)
+
+        expected_version = getattr(self, 'expected_version', instance.version)
+        if not instance.save_if_version(expected_version, changed):
+            raise PreconditionFailed()
+        return instance
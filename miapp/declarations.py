@@ -0,0 +1,368 @@
+"""
+Generador de archivos de Declaraciones Juradas para el SII.
+
+Cada tipo de declaración se describe con un DeclarationLayout (registro de
+cabecera, registro de detalle y registro de totales) y se registra en LAYOUTS.
+Los registros de detalle se leen por bloques desde la base de datos y se
+formatean con funciones precompiladas por layout; los totales se calculan
+con agregados acumulados durante la misma pasada.
+
+IMPORTANTE: Las posiciones y largos de cada layout deben ajustarse según las
+instrucciones oficiales del SII vigentes para cada año tributario.
+"""
+import unicodedata
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.utils import timezone
+
+from .exports import iter_queryset_chunks, json_number
+from .models import TaxGrade, DividendMaintainer, FACTOR_NUMBERS, factor_key
+
+# Filas leídas por consulta al generar una declaración
+DECLARATION_CHUNK_SIZE = 5000
+
+LINE_TERMINATOR = '\r\n'
+FILE_ENCODING = 'latin-1'
+
+
+class DeclarationFieldOverflow(ValueError):
+    """Un valor no cabe en el largo de su campo (no se trunca: el SII leería otro valor)"""
+
+    def __init__(self, field, value, record=''):
+        self.field = field
+        self.value = value
+        self.record = record
+        super().__init__(
+            f"{record or 'Registro'}: el campo {field.name} ({value}) excede su largo de {field.length}"
+        )
+
+
+class DeclarationField:
+    """
+    Campo de un registro de declaración.
+
+    kind:
+    - 'alpha': texto en mayúsculas sin tildes, alineado a la izquierda
+    - 'numeric': entero alineado a la derecha con ceros
+    - 'amount': monto con `decimals` decimales implícitos, alineado con ceros
+    - 'date': fecha DDMMAAAA
+    - 'rut': RUT sin puntos ni guion (cuerpo + dígito verificador)
+
+    source es la llave de la fila (o del contexto en cabecera/totales) o una
+    función que recibe la fila; value fija un valor constante.
+    """
+
+    KINDS = ('alpha', 'numeric', 'amount', 'date', 'rut')
+
+    def __init__(self, name, length, kind='alpha', source=None, decimals=0, value=None, total=False):
+        if kind not in self.KINDS:
+            raise ValueError(f"Tipo de campo inválido: {kind}")
+        self.name = name
+        self.length = length
+        self.kind = kind
+        self.source = source or name
+        self.decimals = decimals
+        self.value = value
+        self.total = total
+
+
+class DeclarationLayout:
+    """Definición de un tipo de declaración (formato fijo o delimitado)"""
+
+    def __init__(self, code, description, source, detail_fields, trailer_fields,
+                 header_fields=(), delimiter=None):
+        self.code = code
+        self.description = description
+        self.source = source
+        self.header_fields = list(header_fields)
+        self.detail_fields = list(detail_fields)
+        self.trailer_fields = list(trailer_fields)
+        self.delimiter = delimiter
+        self._compiled = None
+
+    @property
+    def record_length(self):
+        """Largo de los registros de detalle (solo formato fijo)"""
+        if self.delimiter:
+            return None
+        return sum(field.length for field in self.detail_fields)
+
+    def compile(self):
+        """Precompila los formateadores de cada tipo de registro (una vez por layout)"""
+        if self._compiled is None:
+            self._compiled = (
+                _compile_record(self.header_fields, self.delimiter, f'{self.code}, cabecera')
+                if self.header_fields else None,
+                _compile_record(self.detail_fields, self.delimiter, f'{self.code}, detalle'),
+                _compile_record(self.trailer_fields, self.delimiter, f'{self.code}, totales'),
+            )
+        return self._compiled
+
+    def total_fields(self):
+        return [field.name for field in self.detail_fields if field.total]
+
+
+LAYOUTS = {}
+
+
+def register_layout(layout):
+    """Registra un layout de declaración por su código"""
+    LAYOUTS[layout.code] = layout
+    return layout
+
+
+def get_layout(code):
+    """Obtiene un layout registrado (None si no existe)"""
+    return LAYOUTS.get(code)
+
+
+# --- Formateadores ---------------------------------------------------------
+
+def _ascii_upper(value):
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(text.upper().split())
+
+
+def _compile_converter(field):
+    """Convierte el valor de origen a su forma canónica (texto o entero)"""
+    kind = field.kind
+    if kind == 'alpha':
+        return lambda value: _ascii_upper(value) if value is not None else ''
+    if kind == 'numeric':
+        return lambda value: int(value) if value not in (None, '') else 0
+    if kind == 'amount':
+        scale = Decimal(10) ** field.decimals
+
+        def convert_amount(value):
+            if value in (None, ''):
+                return 0
+            return int((Decimal(str(value)) * scale).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        return convert_amount
+    if kind == 'date':
+        return lambda value: value.strftime('%d%m%Y') if value else ''
+
+    def convert_rut(value):
+        if not value:
+            return ''
+        return ''.join(ch for ch in str(value).upper() if ch.isdigit() or ch == 'K')
+    return convert_rut
+
+
+def _compile_renderer(field, delimiter):
+    """
+    Convierte el valor canónico al texto del archivo. Números y RUT que no
+    caben en el largo fijo lanzan DeclarationFieldOverflow.
+    """
+    length = field.length
+    if field.kind in ('numeric', 'amount'):
+        if delimiter:
+            return str
+
+        def render_number(value):
+            text = '-' + str(-value).zfill(length - 1) if value < 0 else str(value).zfill(length)
+            if len(text) > length:
+                raise DeclarationFieldOverflow(field, value)
+            return text
+        return render_number
+    if field.kind == 'rut':
+        if delimiter:
+            return lambda value: value
+
+        def render_rut(value):
+            if len(value) > length:
+                raise DeclarationFieldOverflow(field, value)
+            return value.zfill(length)
+        return render_rut
+    if delimiter:
+        return lambda value: value[:length].replace(delimiter, ' ')
+    return lambda value: value[:length].ljust(length)
+
+
+def _compile_getter(field):
+    if field.value is not None:
+        constant = field.value
+        return lambda row: constant
+    if callable(field.source):
+        return field.source
+    key = field.source
+    return lambda row: row.get(key)
+
+
+def _compile_record(fields, delimiter, record):
+    """
+    Compila un registro en una sola función row -> línea. Los campos marcados
+    con total=True suman su valor canónico en el dict `totals` recibido. Los
+    desbordes se informan con `record` y el pk de la fila (si tiene).
+    """
+    parts = [
+        (field.name, field.total, _compile_getter(field), _compile_converter(field),
+         _compile_renderer(field, delimiter))
+        for field in fields
+    ]
+    separator = delimiter or ''
+
+    def render(row, totals=None):
+        values = []
+        for name, is_total, getter, convert, render_value in parts:
+            value = convert(getter(row))
+            if is_total and totals is not None:
+                totals[name] += value
+            try:
+                values.append(render_value(value))
+            except DeclarationFieldOverflow as exc:
+                pk = row.get('pk')
+                raise DeclarationFieldOverflow(
+                    exc.field, exc.value, record if pk is None else f'{record} (pk={pk})'
+                ) from None
+        return separator.join(values)
+
+    return render
+
+
+# --- Generación ------------------------------------------------------------
+
+def iter_declaration_chunks(layout, periodo_comercial, declarant_rut='', chunk_size=DECLARATION_CHUNK_SIZE):
+    """
+    Genera el contenido de la declaración en bloques de texto (una pasada).
+    Cada bloque corresponde a un bloque de filas leído desde la base de datos.
+    """
+    render_header, render_detail, render_trailer = layout.compile()
+    # En formato fijo la cabecera y los totales se completan al largo del detalle
+    record_length = layout.record_length or 0
+    context = {
+        'periodo_comercial': periodo_comercial,
+        'declarant_rut': declarant_rut,
+        'generated_at': timezone.localdate(),
+    }
+
+    if render_header:
+        yield render_header(context).ljust(record_length) + LINE_TERMINATOR
+
+    totals = {name: 0 for name in layout.total_fields()}
+    record_count = 0
+    for chunk in iter_queryset_chunks(layout.source(periodo_comercial), chunk_size):
+        lines = [render_detail(row, totals) for row in chunk]
+        record_count += len(lines)
+        yield LINE_TERMINATOR.join(lines) + LINE_TERMINATOR
+
+    context['record_count'] = record_count
+    for name, value in totals.items():
+        context[f'total_{name}'] = value
+    yield render_trailer(context).ljust(record_length) + LINE_TERMINATOR
+
+
+def iter_declaration_bytes(layout, periodo_comercial, declarant_rut='', chunk_size=DECLARATION_CHUNK_SIZE):
+    """Igual que iter_declaration_chunks pero codificado para el archivo final"""
+    for chunk in iter_declaration_chunks(layout, periodo_comercial, declarant_rut, chunk_size):
+        yield chunk.encode(FILE_ENCODING, errors='replace')
+
+
+def write_declaration(layout, periodo_comercial, output, declarant_rut='', chunk_size=DECLARATION_CHUNK_SIZE):
+    """Escribe la declaración completa en `output` (archivo binario). Retorna bytes escritos."""
+    written = 0
+    for data in iter_declaration_bytes(layout, periodo_comercial, declarant_rut, chunk_size):
+        output.write(data)
+        written += len(data)
+    return written
+
+
+def declaration_file_name(layout, periodo_comercial):
+    extension = 'csv' if layout.delimiter else 'txt'
+    return f"{layout.code}_{periodo_comercial}.{extension}"
+
+
+# --- Layouts ---------------------------------------------------------------
+
+def _dividend_source(periodo_comercial):
+    return DividendMaintainer.objects.filter(periodo_comercial=periodo_comercial).values(
+        'pk', 'tipo_mercado', 'instrumento', 'fecha_pago_dividendo', 'secuencia_evento_capital',
+        'acogido_isfut_isift', 'factor_actualizacion', 'dividendo', 'valor_historico', 'factores_8_37',
+    )
+
+
+def _tax_grade_source(periodo_comercial):
+    return TaxGrade.objects.filter(year=periodo_comercial, status='activo').values(
+        'pk', 'rut', 'name', 'source_type', 'amount', 'factor',
+    )
+
+
+def _factor_getter(factor_number):
+    key = factor_key(factor_number)
+    return lambda row: json_number(row['factores_8_37'], key)
+
+
+MARKET_TYPE_CODES = {'acciones': '1', 'cfi': '2', 'fondos_mutuos': '3'}
+ISFUT_ISIFT_CODES = {'isfut': '1', 'isift': '2', 'ninguno': '0'}
+SOURCE_TYPE_CODES = {'declaracion': '1', 'certificado': '2', 'manual': '3', 'calculo': '4'}
+
+
+def _header_fields():
+    return [
+        DeclarationField('tipo_registro', 1, 'numeric', value=0),
+        DeclarationField('periodo_comercial', 4, 'numeric'),
+        DeclarationField('declarant_rut', 10, 'rut'),
+        DeclarationField('generated_at', 8, 'date'),
+    ]
+
+
+def _dividend_detail_fields():
+    return [
+        DeclarationField('tipo_registro', 1, 'numeric', value=1),
+        DeclarationField('tipo_mercado', 1, 'numeric', source=lambda row: MARKET_TYPE_CODES.get(row['tipo_mercado'], 0)),
+        DeclarationField('instrumento', 30, 'alpha'),
+        DeclarationField('fecha_pago_dividendo', 8, 'date'),
+        DeclarationField('secuencia_evento_capital', 10, 'numeric'),
+        DeclarationField('acogido_isfut_isift', 1, 'numeric', source=lambda row: ISFUT_ISIFT_CODES.get(row['acogido_isfut_isift'], 0)),
+        DeclarationField('factor_actualizacion', 12, 'amount', decimals=6),
+        DeclarationField('dividendo', 15, 'amount', total=True),
+        DeclarationField('valor_historico', 15, 'amount', total=True),
+    ] + [
+        DeclarationField(f'factor_{n}', 10, 'amount', source=_factor_getter(n), decimals=8)
+        for n in FACTOR_NUMBERS
+    ]
+
+
+def _dividend_trailer_fields():
+    return [
+        DeclarationField('tipo_registro', 1, 'numeric', value=9),
+        DeclarationField('record_count', 10, 'numeric'),
+        DeclarationField('total_dividendo', 18, 'amount'),
+        DeclarationField('total_valor_historico', 18, 'amount'),
+    ]
+
+
+def _tax_grade_detail_fields():
+    return [
+        DeclarationField('tipo_registro', 1, 'numeric', value=1),
+        DeclarationField('rut', 10, 'rut'),
+        DeclarationField('name', 60, 'alpha'),
+        DeclarationField('source_type', 1, 'numeric', source=lambda row: SOURCE_TYPE_CODES.get(row['source_type'], 0)),
+        DeclarationField('amount', 15, 'amount', total=True),
+        DeclarationField('factor', 10, 'amount', decimals=4),
+    ]
+
+
+def _tax_grade_trailer_fields():
+    return [
+        DeclarationField('tipo_registro', 1, 'numeric', value=9),
+        DeclarationField('record_count', 10, 'numeric'),
+        DeclarationField('total_amount', 18, 'amount'),
+    ]
+
+
+register_layout(DeclarationLayout(
+    'dividendos_fijo', 'Dividendos pagados - formato de largo fijo',
+    _dividend_source, _dividend_detail_fields(), _dividend_trailer_fields(), _header_fields(),
+))
+register_layout(DeclarationLayout(
+    'dividendos_delimitado', 'Dividendos pagados - formato delimitado por punto y coma',
+    _dividend_source, _dividend_detail_fields(), _dividend_trailer_fields(), _header_fields(), delimiter=';',
+))
+register_layout(DeclarationLayout(
+    'calificaciones_fijo', 'Calificaciones tributarias - formato de largo fijo',
+    _tax_grade_source, _tax_grade_detail_fields(), _tax_grade_trailer_fields(), _header_fields(),
+))
+register_layout(DeclarationLayout(
+    'calificaciones_delimitado', 'Calificaciones tributarias - formato delimitado por punto y coma',
+    _tax_grade_source, _tax_grade_detail_fields(), _tax_grade_trailer_fields(), _header_fields(), delimiter=';',
+))
@@ -0,0 +1,133 @@
+"""
+Codificación compacta de before/after de audit_logs.
+
+Una actualización guardaba dos snapshots completos: en un dividendo, el dict
+factores_8_37 iba dos veces aunque cambiara un solo factor. AuditLog.save()
+y AuditLog.objects.bulk_create() guardan ahora las actualizaciones como una
+diferencia en la columna binaria `delta` (before y after quedan en NULL):
+cada campo va una sola vez, con los dos valores solo si cambió, y los dicts
+anidados se comparan llave a llave. Los payloads de un solo lado (altas,
+bajas, importaciones) siguen en las columnas JSON salvo que superen
+AUDIT_PAYLOAD_COMPRESS_MIN_BYTES.
+
+El documento se guarda como JSON, comprimido con zstd (si la librería
+zstandard está instalada) o zlib cuando supera
+AUDIT_PAYLOAD_COMPRESS_MIN_BYTES; el primer byte indica el formato.
+AuditLog.before_state/after_state (y AuditLogSerializer) reconstruyen los
+snapshots; las entradas anteriores, sin delta, se leen tal cual.
+"""
+import json
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional: sin él se comprime con zlib
+    zstandard = None
+
+DEFAULT_COMPRESS_MIN_BYTES = 512
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+# Primer byte de `delta`
+PLAIN, ZLIB, ZSTD = b'j', b'z', b's'
+
+# Operaciones por campo de la diferencia: [llave, op, valores...]
+SAME = '='       # [llave, '=', valor]
+CHANGED = '~'    # [llave, '~', antes, después]
+ADDED = '+'      # [llave, '+', después]
+REMOVED = '-'    # [llave, '-', antes]
+NESTED = '>'     # [llave, '>', diferencia del dict anidado]
+
+
+def compress_min_bytes():
+    return getattr(settings, 'AUDIT_PAYLOAD_COMPRESS_MIN_BYTES', DEFAULT_COMPRESS_MIN_BYTES)
+
+
+def same_value(old, new):
+    # 1 == True y 1 == 1.0 en Python, pero en JSON son valores distintos
+    return type(old) is type(new) and old == new
+
+
+def diff_states(before, after):
+    """Diferencia entre dos dicts, en el orden de `before` y luego las llaves nuevas"""
+    entries = []
+    for key, old in before.items():
+        if key not in after:
+            entries.append([key, REMOVED, old])
+            continue
+        new = after[key]
+        if same_value(old, new):
+            entries.append([key, SAME, old])
+        elif isinstance(old, dict) and isinstance(new, dict):
+            entries.append([key, NESTED, diff_states(old, new)])
+        else:
+            entries.append([key, CHANGED, old, new])
+    entries.extend([key, ADDED, new] for key, new in after.items() if key not in before)
+    return entries
+
+
+def apply_diff(entries):
+    """(before, after) a partir de una diferencia de diff_states()"""
+    before, after = {}, {}
+    for key, operation, *values in entries:
+        if operation == NESTED:
+            before[key], after[key] = apply_diff(values[0])
+        elif operation == CHANGED:
+            before[key], after[key] = values
+        else:
+            if operation != ADDED:
+                before[key] = values[0]
+            if operation != REMOVED:
+                after[key] = values[0]
+    return before, after
+
+
+def dumps(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def pack(raw):
+    """JSON con su byte de formato, comprimido si supera el umbral y queda más chico"""
+    if len(raw) >= compress_min_bytes():
+        if zstandard is not None:
+            marker, compressed = ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        else:
+            marker, compressed = ZLIB, zlib.compress(raw, ZLIB_LEVEL)
+        if len(compressed) < len(raw):
+            return marker + compressed
+    return PLAIN + raw
+
+
+def encode_payload(before, after):
+    """
+    Contenido de `delta` para un par before/after, o None si conviene
+    dejarlos en las columnas JSON (un solo lado y bajo el umbral).
+    """
+    if isinstance(before, dict) and isinstance(after, dict):
+        return pack(dumps({'d': diff_states(before, after)}))
+    document = {name: value for name, value in (('b', before), ('a', after)) if value is not None}
+    if not document:
+        return None
+    raw = dumps(document)
+    if len(raw) < compress_min_bytes():
+        return None
+    return pack(raw)
+
+
+def decode_payload(data):
+    """(before, after) guardados en `delta`"""
+    data = bytes(data)
+    marker, body = data[:1], data[1:]
+    if marker == ZLIB:
+        body = zlib.decompress(body)
+    elif marker == ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured('Hay entradas de auditoría comprimidas con zstd: instale zstandard.')
+        body = zstandard.ZstdDecompressor().decompress(body)
+    document = json.loads(body)
+    if 'd' in document:
+        return apply_diff(document['d'])
+    return document.get('b'), document.get('a')
@@ -0,0 +1,291 @@
+import base64
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .changes import settle_seconds
+from .models import FACTOR_NUMBERS, SII_FIELD_NUMBERS, factor_key, sii_field_key
+
+# Filas leídas por consulta al recorrer la tabla
+EXPORT_CHUNK_SIZE = 2000
+
+# Filas por row group al escribir Parquet
+PARQUET_ROW_GROUP_SIZE = 50000
+
+
+# Columnas fijas de la exportación de dividendos: (nombre, tipo)
+DIVIDEND_BASE_COLUMNS = [
+    ('id', 'string'),
+    ('tipo_mercado', 'string'),
+    ('origen_informacion', 'string'),
+    ('periodo_comercial', 'int32'),
+    ('instrumento', 'string'),
+    ('fecha_pago_dividendo', 'date'),
+    ('descripcion_dividendo', 'string'),
+    ('secuencia_evento_capital', 'int64'),
+    ('acogido_isfut_isift', 'string'),
+    ('origen', 'string'),
+    ('factor_actualizacion', 'decimal(15,6)'),
+    ('dividendo', 'decimal(15,2)'),
+    ('valor_historico', 'decimal(15,2)'),
+]
+
+DIVIDEND_FACTOR_COLUMNS = [(f'factor_{n}', 'float64') for n in FACTOR_NUMBERS]
+DIVIDEND_SII_COLUMNS = [(f'sii_campo_{n}', 'float64') for n in SII_FIELD_NUMBERS]
+
+DIVIDEND_EXPORT_COLUMNS = DIVIDEND_BASE_COLUMNS + DIVIDEND_FACTOR_COLUMNS + DIVIDEND_SII_COLUMNS
+
+# Columnas agregadas en la exportación delta (?updated_since= / ?watermark=)
+DELTA_COLUMNS = [('updated_at', 'timestamp'), ('watermark', 'string')]
+
+_DIVIDEND_FETCH_FIELDS = [name for name, _ in DIVIDEND_BASE_COLUMNS] + ['factores_8_37', 'campos_detallados_sii']
+
+
+def iter_queryset_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Recorre un queryset en bloques ordenados por pk (keyset), sin OFFSET
+    ni cursores del servidor: cada bloque es una consulta acotada.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_qs[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+        last_pk = last['pk'] if isinstance(last, dict) else last.pk
+        if len(chunk) < chunk_size:
+            return
+
+
+def json_number(container, key):
+    """Extrae el 'valor' numérico de un campo {nombre, valor} de los JSON de dividendos"""
+    if not isinstance(container, dict):
+        return None
+    entry = container.get(key)
+    if isinstance(entry, dict):
+        entry = entry.get('valor')
+    if entry is None or entry == '':
+        return None
+    try:
+        return float(entry)
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten_dividend(row):
+    """Convierte una fila (dict de values()) en los valores de DIVIDEND_EXPORT_COLUMNS"""
+    factores = row['factores_8_37']
+    campos = row['campos_detallados_sii']
+    values = [row[name] for name, _ in DIVIDEND_BASE_COLUMNS]
+    values[0] = str(values[0])
+    values.extend(json_number(factores, factor_key(n)) for n in FACTOR_NUMBERS)
+    values.extend(json_number(campos, sii_field_key(n)) for n in SII_FIELD_NUMBERS)
+    return values
+
+
+def iter_dividend_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE, delta=None):
+    """
+    Genera filas aplanadas de DividendMaintainer leyendo la tabla por bloques.
+    Con `delta` (DeltaWindow) se recorren solo las filas modificadas, en orden
+    (updated_at, id), y cada fila termina con las columnas de DELTA_COLUMNS.
+    """
+    if delta is None:
+        values_qs = queryset.values('pk', *_DIVIDEND_FETCH_FIELDS)
+        for chunk in iter_queryset_chunks(values_qs, chunk_size):
+            for row in chunk:
+                yield flatten_dividend(row)
+        return
+
+    values_qs = queryset.values('pk', 'updated_at', *_DIVIDEND_FETCH_FIELDS)
+    for chunk in delta.chunks(values_qs, chunk_size):
+        for row in chunk:
+            yield flatten_dividend(row) + [row['updated_at'], encode_watermark(row['updated_at'], row['pk'])]
+
+
+def dividend_export_columns(delta=None):
+    return DIVIDEND_EXPORT_COLUMNS + (DELTA_COLUMNS if delta is not None else [])
+
+
+class _Echo:
+    """Buffer mínimo para que csv.writer devuelva cada línea en lugar de escribirla"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (Decimal, date)):
+        return str(value)
+    return value
+
+
+def stream_dividend_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE, delta=None):
+    """Genera el CSV de dividendos línea a línea (para StreamingHttpResponse)"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in dividend_export_columns(delta)])
+    for values in iter_dividend_rows(queryset, chunk_size, delta):
+        yield writer.writerow([_csv_value(v) for v in values])
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {
+        'string': pa.string(),
+        'int32': pa.int32(),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'decimal(15,6)': pa.decimal128(15, 6),
+        'decimal(15,2)': pa.decimal128(15, 2),
+    }
+    return pa.schema([(name, types[type_name]) for name, type_name in columns])
+
+
+def write_dividend_parquet(queryset, output, chunk_size=EXPORT_CHUNK_SIZE,
+                           row_group_size=PARQUET_ROW_GROUP_SIZE, delta=None):
+    """
+    Escribe la exportación de dividendos en formato Parquet sobre `output`.
+    Las filas se acumulan por columnas y se vuelcan como un row group cada
+    `row_group_size` filas, de modo que la memoria usada queda acotada.
+    Retorna el número de filas escritas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(dividend_export_columns(delta))
+    names = schema.names
+    column_count = len(names)
+    total = 0
+
+    with pq.ParquetWriter(output, schema, compression='snappy') as writer:
+        buffers = [[] for _ in range(column_count)]
+        pending = 0
+        for values in iter_dividend_rows(queryset, chunk_size, delta):
+            for index in range(column_count):
+                buffers[index].append(values[index])
+            pending += 1
+            if pending >= row_group_size:
+                writer.write_table(pa.Table.from_pydict(dict(zip(names, buffers)), schema=schema))
+                total += pending
+                buffers = [[] for _ in range(column_count)]
+                pending = 0
+        if pending or not total:
+            writer.write_table(pa.Table.from_pydict(dict(zip(names, buffers)), schema=schema))
+            total += pending
+
+    return total
+
+
+# --- Exportación delta ----------------------------------------------------------
+
+def encode_watermark(updated_at, pk):
+    """Token opaco con la posición (updated_at, id) de una fila de la exportación delta"""
+    payload = json.dumps([updated_at.isoformat(), str(pk)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_watermark(token, model):
+    """(updated_at, pk) de un token de encode_watermark(); ValueError si no es válido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        updated_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        updated_at = datetime.fromisoformat(updated_at)
+        if timezone.is_naive(updated_at):
+            raise ValueError
+        return updated_at, model._meta.pk.to_python(pk)
+    except Exception:
+        raise ValueError('Watermark inválido')
+
+
+def parse_timestamp(value, name='updated_since'):
+    """Fecha u hora ISO 8601 de un parámetro (sin zona horaria se usa la del proyecto)"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'{name} debe ser una fecha u hora ISO 8601')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class DeltaWindow:
+    """
+    Filas modificadas desde una marca de agua, en orden (updated_at, id) y por
+    bloques con keyset sobre el índice (updated_at, id). `updated_since`
+    incluye las filas con updated_at >= T; `position` (de un watermark)
+    continúa después de la última fila entregada. El corte superior se fija al
+    empezar (ahora menos CHANGE_FEED_SETTLE_SECONDS) para no saltarse filas de
+    transacciones aún abiertas.
+    """
+
+    def __init__(self, updated_since=None, position=None):
+        self.updated_since = updated_since
+        self.position = position
+        self.until = timezone.now() - timedelta(seconds=settle_seconds())
+
+    @classmethod
+    def from_params(cls, params, model):
+        """DeltaWindow de ?updated_since= y/o ?watermark=, o None si no se pidió; ValueError si son inválidos"""
+        updated_since, watermark = params.get('updated_since'), params.get('watermark')
+        if not updated_since and not watermark:
+            return None
+        return cls(
+            updated_since=parse_timestamp(updated_since) if updated_since else None,
+            position=decode_watermark(watermark, model) if watermark else None,
+        )
+
+    def chunks(self, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+        queryset = queryset.filter(updated_at__lte=self.until).order_by('updated_at', 'pk')
+        if self.updated_since is not None:
+            queryset = queryset.filter(updated_at__gte=self.updated_since)
+        position = self.position
+        while True:
+            chunk_qs = queryset
+            if position is not None:
+                updated_at, pk = position
+                # Cota sobre la primera columna para que el optimizador use un rango del índice
+                chunk_qs = queryset.filter(Q(updated_at__gte=updated_at) & (Q(updated_at__gt=updated_at) | Q(pk__gt=pk)))
+            chunk = list(chunk_qs[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last = chunk[-1]
+            position = (last['updated_at'], last['pk']) if isinstance(last, dict) else (last.updated_at, last.pk)
+            if len(chunk) < chunk_size:
+                return
+
+    def watermark(self):
+        return encode_watermark(*self.position) if self.position else None
+
+
+def stream_json_delta(queryset, delta, serialize, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Genera {"data": [...], "watermark": "..."} fila a fila: cada fila trae su
+    `watermark` (para reanudar desde ella) y el del final es el de la última.
+    `serialize` convierte un bloque de instancias en una lista de dicts.
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+    watermark = delta.watermark()
+    yield '{"data":['
+    separator = ''
+    for chunk in delta.chunks(queryset, chunk_size):
+        for instance, data in zip(chunk, serialize(chunk)):
+            watermark = data['watermark'] = encode_watermark(instance.updated_at, instance.pk)
+            yield separator + encoder.encode(data)
+            separator = ','
+    yield '],"watermark":' + encoder.encode(watermark) + '}'
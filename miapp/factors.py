@@ -0,0 +1,140 @@
+"""
+Factores Factor-8..Factor-37 en una tabla tipada (dividend_factors).
+
+factores_8_37 sigue siendo lo que entrega la API (JSON {factor_i: {nombre,
+valor}}); dividend_factors guarda una fila numérica por factor, sincronizada
+en cada escritura, para que filtrar u ordenar por un factor recorra el índice
+(factor_no, valor) en lugar de leer y parsear el JSON de cada fila.
+
+Parámetros de los listados de dividendos (n = número de factor SII, 8 a 37,
+igual que las columnas factor_<n> de la exportación):
+- ?factor_<n>=valor, ?factor_<n>_min=valor, ?factor_<n>_max=valor
+- ?ordering=factor_<n> o -factor_<n> (los registros sin ese factor van al final)
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, FilteredRelation, Q
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from .models import FACTOR_NUMBERS, DividendFactor, factor_key
+
+BACKFILL_BATCH_SIZE = 2000
+VALOR_PLACES = Decimal('1E-8')
+# DecimalField(max_digits=20, decimal_places=8): 12 dígitos enteros
+VALOR_LIMIT = Decimal(10) ** 12
+
+FACTOR_PARAM_RE = re.compile(r'^factor_(\d+)(?:_(min|max))?$')
+FACTOR_ORDERING_RE = re.compile(r'^(-?)factor_(\d+)$')
+_PARAM_LOOKUPS = {None: 'exact', 'min': 'gte', 'max': 'lte'}
+
+
+def factor_values(factores):
+    """{número de factor: Decimal} de un factores_8_37 (omite valores no numéricos)"""
+    if not isinstance(factores, dict):
+        return {}
+    values = {}
+    for number in FACTOR_NUMBERS:
+        entry = factores.get(factor_key(number))
+        if isinstance(entry, dict):
+            entry = entry.get('valor')
+        if entry is None or entry == '' or isinstance(entry, bool):
+            continue
+        try:
+            value = Decimal(str(entry))
+        except InvalidOperation:
+            continue
+        if value.is_finite() and abs(value) < VALOR_LIMIT:
+            values[number] = value.quantize(VALOR_PLACES)
+    return values
+
+
+def sync_dividend_factors(dividends, factor_model=DividendFactor):
+    """Reemplaza las filas de dividend_factors de `dividends` (un DELETE y un INSERT)"""
+    dividends = list(dividends)
+    if not dividends:
+        return
+    rows = [
+        factor_model(dividend_id=dividend.pk, factor_no=number, valor=value)
+        for dividend in dividends
+        for number, value in factor_values(dividend.factores_8_37).items()
+    ]
+    # Dentro de una escritura mayor se une a su transacción (sin SAVEPOINT)
+    with transaction.atomic(savepoint=False):
+        factor_model.objects.filter(dividend_id__in=[dividend.pk for dividend in dividends]).delete()
+        factor_model.objects.bulk_create(rows, batch_size=BACKFILL_BATCH_SIZE)
+
+
+def backfill_dividend_factors(dividend_model, factor_model=DividendFactor, batch_size=BACKFILL_BATCH_SIZE):
+    """Reconstruye dividend_factors por bloques de id (sin cargar la tabla completa)"""
+    queryset = dividend_model.objects.only('id', 'factores_8_37').order_by('id')
+    last_id = None
+    total = 0
+    while True:
+        batch = queryset.filter(id__gt=last_id) if last_id else queryset
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        sync_dividend_factors(batch, factor_model)
+        total += len(batch)
+        last_id = batch[-1].id
+    return total
+
+
+def _factor_number(raw, param):
+    number = int(raw)
+    if number not in FACTOR_NUMBERS:
+        raise ValidationError({param: f'Número de factor inválido (debe ser de {FACTOR_NUMBERS.start} a {FACTOR_NUMBERS.stop - 1}).'})
+    return number
+
+
+class DividendFactorFilter(filters.BaseFilterBackend):
+    """
+    Filtros y orden por factor sobre dividend_factors. Debe ir después de
+    OrderingFilter: reemplaza el orden cuando ?ordering= incluye factor_<n>.
+    """
+
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        conditions = {}
+        for param, value in request.query_params.items():
+            match = FACTOR_PARAM_RE.match(param)
+            if not match or value.strip() == '':
+                continue
+            number = _factor_number(match.group(1), param)
+            try:
+                valor = Decimal(value.strip())
+            except InvalidOperation:
+                raise ValidationError({param: 'Debe ser un número.'})
+            conditions.setdefault(number, {})[f'valor__{_PARAM_LOOKUPS[match.group(2)]}'] = valor
+
+        for number, lookups in conditions.items():
+            queryset = queryset.filter(pk__in=DividendFactor.objects.filter(
+                factor_no=number, **lookups
+            ).values('dividend_id'))
+
+        return self._order(request, queryset, view)
+
+    def _order(self, request, queryset, view):
+        terms = [term.strip() for term in request.query_params.get(self.ordering_param, '').split(',') if term.strip()]
+        if not any(FACTOR_ORDERING_RE.match(term) for term in terms):
+            return queryset
+
+        allowed = set(getattr(view, 'ordering_fields', None) or ())
+        ordering = []
+        for term in terms:
+            match = FACTOR_ORDERING_RE.match(term)
+            if match:
+                number = _factor_number(match.group(2), self.ordering_param)
+                alias = f'factor_{number}_row'
+                queryset = queryset.annotate(**{
+                    alias: FilteredRelation('factors', condition=Q(factors__factor_no=number)),
+                })
+                valor = F(f'{alias}__valor')
+                ordering.append(valor.desc(nulls_last=True) if match.group(1) else valor.asc(nulls_last=True))
+            elif term.lstrip('-') in allowed:
+                ordering.append(term)
+        return queryset.order_by(*ordering, 'pk')
@@ -0,0 +1,177 @@
+"""
+Fast path de los listados.
+
+En lugar de crear una instancia por fila y recorrer los campos del
+ModelSerializer, list() lee las columnas del conjunto de campos con
+values_list() y las convierte con conversores precalculados por campo. Los
+conversores replican to_representation() de DRF para Decimal, fechas y UUID;
+los textos y enteros pasan tal cual y cualquier otro campo usa su propio
+to_representation(), así que el JSON resultante es el mismo que el del
+serializer.
+
+Si el serializer tiene campos que no son columnas del modelo (source con
+puntos, métodos, relaciones no simples) se usa el list() normal. Se desactiva
+con settings.API_FAST_LIST_ENABLED = False.
+"""
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Campos cuyo valor de BD ya es su representación (str/int/bool)
+_PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.ChoiceField)
+
+_plans = {}
+
+
+def fast_list_enabled():
+    return getattr(settings, 'API_FAST_LIST_ENABLED', True)
+
+
+def _decimal_converter(field):
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) or field.localize:
+        return None
+    if field.decimal_places is None:
+        return lambda value: '{:f}'.format(value if isinstance(value, decimal.Decimal) else decimal.Decimal(str(value).strip()))
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def field_converter(field):
+    """
+    (conversor, usa_floats) de un campo del serializer. El conversor None
+    significa que el valor de BD se entrega sin cambios.
+    """
+    if isinstance(field, serializers.DecimalField):
+        convert = _decimal_converter(field)
+        return (convert, False) if convert else (field.to_representation, True)
+    if isinstance(field, serializers.UUIDField):
+        return (str if field.uuid_format == 'hex_verbose' else field.to_representation), False
+    if isinstance(field, serializers.DateField):
+        output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+        if output_format and output_format.lower() == ISO_8601:
+            return (lambda value: value if isinstance(value, str) else value.isoformat()), False
+        return field.to_representation, False
+    if isinstance(field, serializers.DateTimeField):
+        return field.to_representation, False
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None, False
+    if isinstance(field, _PASSTHROUGH_FIELDS):
+        return None, False
+    # JSON, float y campos desconocidos: pueden traer floats (orjson los escribe distinto)
+    return field.to_representation, not isinstance(field, serializers.BooleanField)
+
+
+class RowPlan:
+    """Columnas a leer y conversores de un (serializer, conjunto de campos)"""
+
+    def __init__(self, columns, items, json_safe):
+        self.columns = columns
+        self.items = items
+        self.json_safe = json_safe
+
+    def to_representation(self, rows):
+        items = self.items
+        return [
+            {
+                name: value if value is None or convert is None else convert(value)
+                for name, index, convert in items
+                for value in (row[index],)
+            }
+            for row in rows
+        ]
+
+    def to_columns(self, rows):
+        """Misma conversión, una lista por campo (representación columnar)"""
+        return {
+            name: [value if value is None or convert is None else convert(value)
+                   for value in (row[index] for row in rows)]
+            for name, index, convert in self.items
+        }
+
+
+def build_row_plan(serializer_class, fieldset, extra_columns=()):
+    """RowPlan del serializer, o None si algún campo no es una columna del modelo"""
+    key = (serializer_class, fieldset, extra_columns)
+    if key in _plans:
+        return _plans[key]
+
+    serializer = serializer_class(context={'fieldset': list(fieldset)})
+    opts = serializer_class.Meta.model._meta
+    columns, items, json_safe = [], [], True
+    plan = None
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            break
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            break
+        if not model_field.concrete or (model_field.is_relation and not isinstance(field, serializers.PrimaryKeyRelatedField)):
+            break
+        convert, uses_floats = field_converter(field)
+        json_safe = json_safe and not uses_floats
+        if model_field.attname not in columns:
+            columns.append(model_field.attname)
+        items.append((name, columns.index(model_field.attname), convert))
+    else:
+        for name in extra_columns:
+            attname = opts.get_field(name).attname
+            if attname not in columns:
+                columns.append(attname)
+        plan = RowPlan(tuple(columns), tuple(items), json_safe)
+
+    _plans[key] = plan
+    return plan
+
+
+class FastListMixin:
+    """
+    list() con values_list() y conversores por campo (ver el docstring del
+    módulo). Usa el conjunto de campos de SparseFieldsetMixin y lee también
+    las columnas de keyset_ordering para el cursor. Las respuestas sin floats
+    se marcan con `fast_json` para que FastJSONRenderer las escriba con orjson.
+    """
+
+    def get_fast_list_plan(self):
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'default_fieldset'):
+            return None
+        fieldset = self.get_fieldset() if hasattr(self, 'get_fieldset') else None
+        if fieldset is None:
+            fieldset = serializer_class.default_fieldset()
+        cursor_fields = tuple(name.lstrip('-') for name in getattr(self, 'keyset_ordering', None) or ())
+        return build_row_plan(serializer_class, tuple(fieldset), cursor_fields)
+
+    def use_fast_list(self):
+        return fast_list_enabled()
+
+    def fast_list_data(self, plan, rows):
+        """Datos de una página; retorna (datos, sin_floats)"""
+        return plan.to_representation(rows), plan.json_safe
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_fast_list_plan() if self.use_fast_list() else None
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*plan.columns, named=True)
+        page = self.paginate_queryset(queryset)
+        data, json_safe = self.fast_list_data(plan, list(queryset) if page is None else page)
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        response.fast_json = json_safe
+        return response
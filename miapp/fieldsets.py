@@ -0,0 +1,91 @@
+"""
+Sparse fieldsets para los listados (?fields= / ?exclude=).
+
+?fields=id,rut,year entrega solo esas columnas y ?exclude=a,b quita columnas
+del conjunto por defecto. Los campos de Meta.deferred_fields del serializer
+(JSON/TEXT pesados) no se entregan salvo que se pidan en ?fields=. El mismo
+conjunto define el only() del queryset, así que las columnas que no se
+entregan tampoco se leen de la base de datos.
+"""
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def _split_names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    ModelSerializer que entrega solo los campos de context['fieldset'] o,
+    si no viene, los de Meta.fields menos Meta.deferred_fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            fieldset = self.default_fieldset()
+        for name in set(self.fields) - set(fieldset):
+            self.fields.pop(name)
+
+    @classmethod
+    def available_fields(cls):
+        return list(cls.Meta.fields)
+
+    @classmethod
+    def default_fieldset(cls):
+        deferred = set(getattr(cls.Meta, 'deferred_fields', ()))
+        return [name for name in cls.Meta.fields if name not in deferred]
+
+
+class SparseFieldsetMixin:
+    """
+    Aplica ?fields=/?exclude= a las acciones de `fieldset_actions` (por defecto
+    el listado): pasa el conjunto al serializer por el contexto y limita el
+    queryset con only_fieldset(). Las columnas de keyset_ordering se leen
+    siempre porque el cursor las necesita.
+    """
+
+    fieldset_actions = ('list',)
+
+    def get_fieldset(self):
+        if self.action not in self.fieldset_actions:
+            return None
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = self._resolve_fieldset()
+        return self._fieldset
+
+    def _resolve_fieldset(self):
+        serializer_class = self.get_serializer_class()
+        available = serializer_class.available_fields()
+        requested = _split_names(self.request.query_params.get(FIELDS_PARAM))
+        excluded = _split_names(self.request.query_params.get(EXCLUDE_PARAM))
+        for param, names in ((FIELDS_PARAM, requested), (EXCLUDE_PARAM, excluded)):
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise ValidationError({
+                    param: f"Campos inválidos: {', '.join(unknown)}. Opciones: {', '.join(available)}"
+                })
+        selected = set(requested or serializer_class.default_fieldset()) - set(excluded)
+        return [name for name in available if name in selected]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            context['fieldset'] = fieldset
+        return context
+
+    def only_fieldset(self, queryset):
+        """only() con las columnas del conjunto pedido (más pk y las del cursor)"""
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return queryset
+        opts = queryset.model._meta
+        concrete = {field.name for field in opts.concrete_fields}
+        cursor_fields = [name.lstrip('-') for name in getattr(self, 'keyset_ordering', None) or ()]
+        columns = {opts.pk.name, *cursor_fields, *fieldset} & concrete
+        return queryset.only(*sorted(columns))
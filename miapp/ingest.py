@@ -0,0 +1,242 @@
+"""
+Ingesta en streaming de registros enviados por otros sistemas
+(POST /api/ingest/tax-grades/ y /api/ingest/dividend-maintainers/).
+
+El cuerpo es NDJSON (application/x-ndjson): un objeto JSON por línea,
+normalmente enviado con Transfer-Encoding: chunked. Se lee línea a línea sin
+armar el cuerpo en memoria; cada línea se valida con el serializer de las
+cargas en lote y las válidas se escriben con el mismo upsert por bloques de
+miapp.bulk (un bloque cada BULK_WRITE_CHUNK_SIZE líneas). Dentro del stream
+las líneas se aplican en orden: una llave repetida cierra el bloque en curso
+y la línea posterior actualiza el registro escrito por la anterior.
+
+La petición queda registrada como un Import con file_type='stream' y un
+ImportRecord por línea (número de línea, estado y, si se escribió, el estado
+anterior del registro): se consulta con /api/imports/{id}/records/ y se
+revierte con /api/imports/{id}/rollback/ igual que un archivo. La memoria
+usada es la de un bloque, sin importar el largo del cuerpo.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import UnsupportedMediaType, ValidationError
+from rest_framework.response import Response
+
+from .bulk import STATUSES, bulk_chunk_size
+from .cache import bump_cache_generations
+from .models import AuditLog, Import, ImportRecord
+from .renderers import orjson
+from .services import generate_import_report
+
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl')
+STREAM_FILE_TYPE = 'stream'
+DEFAULT_MAX_LINE_LENGTH = 1024 * 1024
+# Errores que se copian al reporte (el detalle completo queda en los ImportRecord)
+REPORT_ERROR_SAMPLE = 50
+
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def max_line_length():
+    return getattr(settings, 'INGEST_MAX_LINE_LENGTH', DEFAULT_MAX_LINE_LENGTH)
+
+
+def request_body_stream(request):
+    """
+    Cuerpo de la petición como stream, sin leerlo completo. Con
+    Transfer-Encoding: chunked no hay Content-Length y Django entrega un
+    cuerpo vacío: si el servidor WSGI indica que wsgi.input termina solo
+    (wsgi.input_terminated, p. ej. gunicorn) se lee directamente de ahí.
+    """
+    meta = request.META
+    if not meta.get('CONTENT_LENGTH') and meta.get('wsgi.input_terminated'):
+        return meta['wsgi.input']
+    return request._request
+
+
+def iter_lines(stream, digest, limit):
+    """
+    (número de línea, bytes) de cada línea del stream; las de más de `limit`
+    bytes se descartan (bytes None) sin cargarlas completas en memoria.
+    """
+    number = 0
+    while True:
+        line = stream.readline(limit + 1)
+        if not line:
+            return
+        number += 1
+        digest.update(line)
+        if len(line) > limit and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(limit + 1)
+                digest.update(line)
+            yield number, None
+            continue
+        yield number, line
+
+
+def format_errors(detail):
+    """Errores de validación como texto ('campo: mensaje; ...')"""
+    if isinstance(detail, dict):
+        return '; '.join(f'{field}: {format_errors(errors)}' for field, errors in detail.items())
+    if isinstance(detail, list):
+        return ', '.join(format_errors(error) for error in detail)
+    return str(detail)
+
+
+class StreamIngest:
+    """Escribe las líneas de un stream NDJSON con un BulkUpsert asociado a un Import"""
+
+    def __init__(self, import_obj, writer, serializer):
+        self.import_obj = import_obj
+        self.writer = writer
+        self.serializer = serializer
+        self.chunk_size = bulk_chunk_size()
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self.errors = []
+        self.years = set()
+        self.pending = []
+        self.pending_keys = set()
+        self.records = []
+
+    def label(self, item):
+        """(rut, year) de ImportRecord a partir de los datos de una línea"""
+        rut, year = (item.get(name) if isinstance(item, dict) else None for name in self.writer.label_fields)
+        return ('' if rut is None else str(rut))[:20], year if isinstance(year, int) else None
+
+    def error(self, number, message, item=None):
+        rut, _ = self.label(item)
+        self.counts['error'] += 1
+        if len(self.errors) < REPORT_ERROR_SAMPLE:
+            self.errors.append(f'Línea {number}: {message}')
+        self.records.append(ImportRecord(
+            import_id=self.import_obj, row_number_or_page=number, rut=rut, year=None,
+            status='error', error_message=message[:500],
+        ))
+
+    def add(self, number, line):
+        if line is None:
+            return self.error(number, f'Línea de más de {max_line_length()} bytes')
+        try:
+            item = loads(line)
+        except ValueError as exc:
+            return self.error(number, f'JSON inválido: {exc}')
+        if not isinstance(item, dict):
+            return self.error(number, 'Se espera un objeto JSON por línea')
+        try:
+            attrs = self.writer.prepare(self.serializer.run_validation(item))
+        except ValidationError as exc:
+            return self.error(number, format_errors(exc.detail), item)
+
+        key = self.writer.item_key(attrs)
+        if key in self.pending_keys:
+            # La misma llave otra vez: se escribe el bloque para aplicar las líneas en orden
+            self.flush()
+        self.pending.append((number, key, attrs))
+        self.pending_keys.add(key)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Escribe el bloque pendiente y los ImportRecord de las líneas sin cambios o con error"""
+        if self.pending:
+            results, years = self.writer.write_batch(self.pending)
+            self.years.update(years)
+            attrs_by_number = {number: attrs for number, _, attrs in self.pending}
+            for number, result in sorted(results.items()):
+                if result['status'] == 'error':
+                    self.error(number, format_errors(result['errors']), attrs_by_number[number])
+                    continue
+                self.counts[result['status']] += 1
+                if result['status'] == 'unchanged':
+                    rut, year = self.label(attrs_by_number[number])
+                    self.records.append(ImportRecord(
+                        import_id=self.import_obj, row_number_or_page=number, rut=rut, year=year,
+                        status='success', error_message='Sin cambios',
+                    ))
+            self.pending, self.pending_keys = [], set()
+        self.save_records()
+
+    def save_records(self):
+        ImportRecord.objects.bulk_create(self.records, batch_size=self.chunk_size)
+        self.records = []
+
+    def run(self, stream):
+        """Procesa el stream completo y deja el Import terminado; retorna el resumen"""
+        digest = hashlib.sha256()
+        try:
+            for number, line in iter_lines(stream, digest, max_line_length()):
+                if line is not None and not line.strip():
+                    continue
+                self.add(number, line)
+                if len(self.records) >= self.chunk_size:
+                    self.save_records()
+            self.flush()
+        except Exception:
+            logger.exception('Error en la ingesta %s', self.import_obj.id)
+            self.import_obj.status = 'failed'
+            self.import_obj.save(update_fields=['status'])
+            raise
+        finally:
+            # Invalidar la caché de respuestas de los años escritos
+            bump_cache_generations(self.writer.entity, self.years)
+
+        written = self.counts['created'] + self.counts['updated'] + self.counts['unchanged']
+        self.import_obj.file_hash = digest.hexdigest()
+        self.import_obj.status = 'done' if written or not self.counts['error'] else 'failed'
+        self.import_obj.save(update_fields=['file_hash', 'status'])
+        generate_import_report(self.import_obj, self.errors + [
+            f"RESUMEN: {self.counts['created']} registros creados, {self.counts['updated']} registros "
+            f"actualizados, {self.counts['unchanged']} sin cambios, {self.counts['error']} con error"
+        ])
+        summary = {'import_id': str(self.import_obj.id), 'status': self.import_obj.status,
+                   'total': written + self.counts['error'], **self.counts}
+        AuditLog.objects.create(
+            user_id=self.writer.user,
+            entity='imports',
+            entity_id=str(self.import_obj.id),
+            action='import',
+            after={'file_name': self.import_obj.file_name, **summary},
+            ip_address=self.writer.ip_address,
+            user_agent=self.writer.user_agent,
+            timestamp=timezone.now(),
+        )
+        return summary
+
+
+class StreamIngestMixin:
+    """
+    Acción de ingesta NDJSON de un ViewSet con carga en lote: usa
+    bulk_writer_class (BulkUpsert) y bulk_serializer_class (un ítem).
+    """
+
+    bulk_writer_class = None
+    bulk_serializer_class = None
+
+    def ingest(self, request, *args, **kwargs):
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type not in NDJSON_CONTENT_TYPES:
+            raise UnsupportedMediaType(content_type or 'sin Content-Type')
+
+        entity = self.bulk_writer_class.model._meta.db_table
+        import_obj = Import.objects.create(
+            uploader_id=request.user,
+            file_name=(request.query_params.get('source') or f'{entity}.ndjson')[:255],
+            file_hash='',
+            file_type=STREAM_FILE_TYPE,
+            status='processing',
+        )
+        writer = self.bulk_writer_class(
+            request.user, self._serialize_model,
+            ip_address=self._get_client_ip(), user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            import_obj=import_obj,
+        )
+        serializer = self.bulk_serializer_class(context=self.get_serializer_context())
+        summary = StreamIngest(import_obj, writer, serializer).run(request_body_stream(request))
+        return Response(summary, status=status.HTTP_201_CREATED)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from miapp.archive import archive_audit_logs, archive_chunk_size, archive_cutoff, keep_months
+
+
+class Command(BaseCommand):
+    help = ('Mueve los meses cerrados de audit_logs a audit_log_archives '
+            '(bloques comprimidos, una transacción por bloque)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=None,
+                            help='Meses que se conservan en audit_logs (por defecto AUDIT_ARCHIVE_KEEP_MONTHS)')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--dry-run', action='store_true', help='Solo informar cuántas entradas se moverían')
+
+    def handle(self, *args, **options):
+        keep = options['keep_months'] if options['keep_months'] is not None else keep_months()
+        cutoff = archive_cutoff(keep)
+        moved = archive_audit_logs(cutoff, options['chunk_size'] or archive_chunk_size(), options['dry_run'])
+        verb = 'a archivar' if options['dry_run'] else 'archivadas'
+        for month, count in moved.items():
+            self.stdout.write(f'{month:%Y-%m}: {count} entradas {verb}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(moved.values())} entradas {verb} (anteriores a {cutoff:%Y-%m-%d})'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from miapp.audit import BACKFILL_CHUNK_SIZE, backfill_audit_keys
+
+
+class Command(BaseCommand):
+    help = ('Completa las columnas rut/instrumento/year de las entradas de audit_logs de '
+            'calificaciones y dividendos registradas antes de que existieran')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        updated = backfill_audit_keys(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Entradas de auditoría actualizadas: {updated}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from miapp.assets import assets_root, build_assets
+
+
+class Command(BaseCommand):
+    help = 'Agrega el hash de contenido y precomprime (gzip/brotli) los assets de STATIC_ASSETS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Assets a construir (por defecto settings.STATIC_ASSETS)')
+
+    def handle(self, *args, **options):
+        built = build_assets(options['names'] or None)
+        for name, (target, variants) in built.items():
+            sizes = ', '.join(f'{encoding} {len(content)} B' for encoding, content in variants.items())
+            self.stdout.write(f'{name} -> {target} ({sizes})')
+        self.stdout.write(self.style.SUCCESS(f'{len(built)} assets escritos en {assets_root()}'))
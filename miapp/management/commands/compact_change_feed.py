@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from miapp.changes import COMPACT_CHUNK_SIZE, compact_changes
+
+
+class Command(BaseCommand):
+    help = ('Compacta el feed de cambios (change_events): borra los eventos confirmados por todos '
+            'los consumidores y los reemplazados por un evento posterior del mismo registro')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=COMPACT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        counts = compact_changes(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Eventos eliminados: {counts['acknowledged']} confirmados, {counts['superseded']} reemplazados"
+        ))
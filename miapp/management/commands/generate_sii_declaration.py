@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp.declarations import (
+    LAYOUTS, DeclarationFieldOverflow, get_layout, write_declaration, declaration_file_name,
+)
+
+
+class Command(BaseCommand):
+    help = 'Genera el archivo de una Declaración Jurada del SII para un periodo comercial'
+
+    def add_arguments(self, parser):
+        parser.add_argument('layout', help=f"Layout de la declaración ({', '.join(LAYOUTS)})")
+        parser.add_argument('periodo_comercial', type=int, help='Año del periodo comercial')
+        parser.add_argument('--output', help='Ruta del archivo de salida (por defecto en media/declarations/)')
+        parser.add_argument('--declarant-rut', default=settings.SII_DECLARANT_RUT, help='RUT del declarante')
+
+    def handle(self, *args, **options):
+        layout = get_layout(options['layout'])
+        if layout is None:
+            raise CommandError(f"Layout no encontrado: {options['layout']}. Disponibles: {', '.join(LAYOUTS)}")
+
+        periodo_comercial = options['periodo_comercial']
+        output_path = options['output'] or settings.DECLARATIONS_DIR / declaration_file_name(layout, periodo_comercial)
+
+        try:
+            with open(output_path, 'wb') as output:
+                written = write_declaration(layout, periodo_comercial, output, options['declarant_rut'])
+        except DeclarationFieldOverflow as exc:
+            # No dejar un archivo incompleto que parezca válido
+            Path(output_path).unlink(missing_ok=True)
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(f"Declaración generada en {output_path} ({written} bytes)"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from miapp.factors import BACKFILL_BATCH_SIZE, backfill_dividend_factors
+from miapp.models import DividendMaintainer
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla dividend_factors desde factores_8_37, por bloques de registros'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+                            help='Registros por bloque')
+
+    def handle(self, *args, **options):
+        total = backfill_dividend_factors(DividendMaintainer, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Factores sincronizados para {total} dividendos'))
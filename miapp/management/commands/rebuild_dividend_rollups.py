@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from miapp.models import DividendMaintainer, DividendRollup, DividendInstrumentSeries
+from miapp.summaries import rebuild_dividend_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los rollups de dividendos (dividend_rollups y dividend_instrument_series), un periodo a la vez'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periodo', type=int, action='append', dest='periodos',
+                            help='Recalcular solo este periodo comercial (se puede repetir)')
+
+    def handle(self, *args, **options):
+        periodos = options['periodos']
+        if not periodos:
+            periodos = set(
+                DividendMaintainer.objects.order_by().values_list('periodo_comercial', flat=True).distinct()
+            )
+            # Periodos que quedaron sin dividendos también se recalculan (quedan vacíos)
+            for model in (DividendRollup, DividendInstrumentSeries):
+                periodos.update(model.objects.order_by().values_list('periodo_comercial', flat=True).distinct())
+            periodos = sorted(periodos)
+
+        for periodo in periodos:
+            counts = rebuild_dividend_rollups(periodo)
+            detail = ', '.join(f'{table}: {count}' for table, count in counts.items())
+            self.stdout.write(f'Periodo {periodo}: {detail}')
+        self.stdout.write(self.style.SUCCESS(f'Rollups recalculados para {len(periodos)} periodos'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from miapp.exports import iter_queryset_chunks
+from miapp.search import SEARCH_DOCUMENTS, TrigramBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de trigramas de búsqueda (search_trigrams) por bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--force', action='store_true',
+                            help='Reconstruir aunque el backend activo no use trigramas')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not isinstance(backend, TrigramBackend) and not options['force']:
+            self.stdout.write(f"El backend activo ({type(backend).__name__}) no usa la tabla de trigramas")
+            return
+
+        backend = TrigramBackend()
+        for model, fields in SEARCH_DOCUMENTS.items():
+            total = 0
+            queryset = model.objects.only('pk', *fields)
+            for chunk in iter_queryset_chunks(queryset, options['chunk_size']):
+                backend.index_documents(chunk)
+                total += len(chunk)
+            self.stdout.write(self.style.SUCCESS(f"{model._meta.db_table}: {total} registros indexados"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from miapp.summaries import rebuild_tax_grade_summary
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla de totales de calificaciones (tax_grade_summaries) con un GROUP BY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, action='append', dest='years',
+                            help='Recalcular solo este año (se puede repetir)')
+
+    def handle(self, *args, **options):
+        groups = rebuild_tax_grade_summary(options['years'])
+        scope = ', '.join(str(year) for year in options['years']) if options['years'] else 'todos los años'
+        self.stdout.write(self.style.SUCCESS(f"Resumen recalculado ({scope}): {groups} grupos"))
@@ -1,7 +1,14 @@
 import json
+import logging
+import time
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
+from .compression import compress_response
 from .models import AuditLog
 
+logger = logging.getLogger(__name__)
+
 
 class AuditLogMiddleware:
     """
@@ -34,3 +41,93 @@ class AuditLogMiddleware:
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
+
+class QueryBudgetExceeded(AssertionError):
+    """Una acción superó su presupuesto de consultas SQL (solo con QUERY_BUDGET_ENFORCE)"""
+
+
+class QueryCounter:
+    """Wrapper de ejecución (connection.execute_wrapper) que cuenta consultas y su duración"""
+    
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Mide la cantidad de consultas SQL y el tiempo de base de datos de cada
+    request a la API y los expone en el header Server-Timing.
+    
+    Las vistas pueden declarar `query_budgets = {'list': 3, ...}` por acción;
+    si una acción lo supera se registra un warning, o se lanza
+    QueryBudgetExceeded cuando settings.QUERY_BUDGET_ENFORCE está activo (tests).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        
+        response['Server-Timing'] = (
+            f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries", '
+            f'total;dur={total * 1000:.1f}'
+        )
+        response['X-Query-Count'] = str(counter.count)
+        
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{request.method} {request.path} ({request._query_budget_action}) "
+                f"ejecutó {counter.count} consultas, presupuesto {budget}"
+            )
+            if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Resolver el presupuesto de la acción DRF que atenderá el request"""
+        view_class = getattr(view_func, 'cls', None)
+        budgets = getattr(view_class, 'query_budgets', None)
+        if not budgets:
+            return None
+        
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(request.method.lower(), request.method.lower())
+        if action in budgets:
+            request._query_budget = budgets[action]
+            request._query_budget_action = action
+        return None
+
+
+class ResponseCompressionMiddleware:
+    """
+    Comprime con brotli o gzip (según Accept-Encoding) las respuestas de texto
+    y JSON que superan RESPONSE_COMPRESSION_MIN_LENGTH, incluidas las de
+    streaming. Debe ir antes que los middlewares que leen o modifican el
+    contenido de la respuesta.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        return compress_response(request, self.get_response(request))
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0005_taxgrade_fuente_ingreso_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['-timestamp', 'id'], name='audit_log_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dividendmaintainer',
+            index=models.Index(fields=['-periodo_comercial', 'instrumento', 'fecha_pago_dividendo', 'id'], name='dividend_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importrecord',
+            index=models.Index(fields=['import_id', 'row_number_or_page', 'id'], name='import_record_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taxgrade',
+            index=models.Index(fields=['status', '-year', 'rut', 'id'], name='tax_grade_keyset_idx'),
+        ),
+    ]
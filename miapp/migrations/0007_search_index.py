@@ -0,0 +1,52 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:28
+
+from django.db import migrations, models
+
+
+FULLTEXT_INDEXES = [
+    ('tax_grades', 'tax_grade_search_ft', ['rut', 'name', 'calculation_basis']),
+    ('dividend_maintainers', 'dividend_search_ft', ['instrumento', 'descripcion_dividendo']),
+]
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    """Índices FULLTEXT para la búsqueda (solo MySQL/MariaDB)"""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} ADD FULLTEXT INDEX {quote(name)} ({', '.join(quote(c) for c in columns)})"
+        )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f"ALTER TABLE {quote(table)} DROP INDEX {quote(name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(help_text="Entidad indexada (ej. 'tax_grades')", max_length=50)),
+                ('object_id', models.UUIDField(help_text='ID del registro indexado')),
+                ('trigram', models.CharField(max_length=3)),
+            ],
+            options={
+                'db_table': 'search_trigrams',
+                'indexes': [models.Index(fields=['entity', 'trigram', 'object_id'], name='search_trigram_lookup_idx'), models.Index(fields=['entity', 'object_id'], name='search_trigram_doc_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
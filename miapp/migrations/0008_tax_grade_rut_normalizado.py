@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+from miapp.rut import normalize_rut
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def backfill_rut_normalizado(apps, schema_editor):
+    """Completa rut_normalizado por bloques de id (sin cargar la tabla completa)"""
+    TaxGrade = apps.get_model('miapp', 'TaxGrade')
+    queryset = TaxGrade.objects.only('id', 'rut').order_by('id')
+    last_id = None
+    while True:
+        batch = queryset.filter(id__gt=last_id) if last_id else queryset
+        batch = list(batch[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            break
+        for tax_grade in batch:
+            tax_grade.rut_normalizado = normalize_rut(tax_grade.rut)
+        TaxGrade.objects.bulk_update(batch, ['rut_normalizado'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0007_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taxgrade',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, default='', editable=False, help_text='RUT sin puntos ni guion (cuerpo + DV), se calcula al guardar', max_length=12),
+        ),
+        migrations.RunPython(backfill_rut_normalizado, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='taxgrade',
+            index=models.Index(fields=['rut_normalizado', 'year'], name='tax_grade_rut_norm_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0008_tax_grade_rut_normalizado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dividendmaintainer',
+            index=models.Index(fields=['periodo_comercial', 'updated_at'], name='dividend_etag_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taxgrade',
+            index=models.Index(fields=['status', 'year', 'updated_at'], name='tax_grade_etag_idx'),
+        ),
+    ]
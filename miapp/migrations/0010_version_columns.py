@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0009_etag_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dividendmaintainer',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Se incrementa en cada escritura (concurrencia optimista)'),
+        ),
+        migrations.AddField(
+            model_name='taxgrade',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Se incrementa en cada escritura (concurrencia optimista)'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_summary(apps, schema_editor):
+    """Carga inicial de los totales con un GROUP BY sobre tax_grades"""
+    TaxGrade = apps.get_model('miapp', 'TaxGrade')
+    TaxGradeSummary = apps.get_model('miapp', 'TaxGradeSummary')
+    groups = (
+        TaxGrade.objects.order_by()
+        .values('year', 'source_type', 'fuente_ingreso', 'status')
+        .annotate(total_amount=Coalesce(Sum('amount'), Decimal(0)), record_count=Count('id'))
+    )
+    TaxGradeSummary.objects.bulk_create([TaxGradeSummary(**group) for group in groups], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0010_version_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxGradeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('source_type', models.CharField(choices=[('declaracion', 'Declaración'), ('certificado', 'Certificado'), ('manual', 'Manual'), ('calculo', 'Cálculo')], max_length=20)),
+                ('fuente_ingreso', models.CharField(choices=[('archivo', 'Archivo de Carga'), ('manual', 'Ingreso Manual'), ('sistema', 'Proveniente del Sistema')], max_length=20)),
+                ('status', models.CharField(choices=[('activo', 'Activo'), ('inactivo', 'Inactivo')], max_length=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('record_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'tax_grade_summaries',
+                'ordering': ['-year', 'source_type', 'fuente_ingreso', 'status'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='taxgradesummary',
+            constraint=models.UniqueConstraint(fields=('year', 'source_type', 'fuente_ingreso', 'status'), name='tax_grade_summary_group_uniq'),
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:42
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_rollups(apps, schema_editor):
+    """Carga inicial de los rollups de dividendos con un GROUP BY"""
+    DividendMaintainer = apps.get_model('miapp', 'DividendMaintainer')
+    totals = {
+        'total_dividendo': Coalesce(Sum('dividendo'), Decimal(0)),
+        'total_valor_historico': Coalesce(Sum('valor_historico'), Decimal(0)),
+    }
+    targets = [
+        ('DividendRollup', ('periodo_comercial', 'tipo_mercado', 'origen_informacion'), 'record_count'),
+        ('DividendInstrumentSeries', ('periodo_comercial', 'instrumento', 'fecha_pago_dividendo'), 'payment_count'),
+    ]
+    for model_name, group_fields, count_field in targets:
+        model = apps.get_model('miapp', model_name)
+        groups = (
+            DividendMaintainer.objects.order_by()
+            .values(*group_fields)
+            .annotate(**totals, **{count_field: Count('id')})
+        )
+        model.objects.bulk_create([model(**group) for group in groups], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0011_tax_grade_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DividendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_comercial', models.IntegerField()),
+                ('tipo_mercado', models.CharField(choices=[('acciones', 'Acciones'), ('cfi', 'CFI'), ('fondos_mutuos', 'Fondos Mutuos')], max_length=20)),
+                ('origen_informacion', models.CharField(choices=[('corredora', 'Corredora'), ('sistema', 'Sistema')], max_length=20)),
+                ('total_dividendo', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_valor_historico', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('record_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'dividend_rollups',
+                'ordering': ['-periodo_comercial', 'tipo_mercado', 'origen_informacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DividendInstrumentSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_comercial', models.IntegerField()),
+                ('instrumento', models.CharField(max_length=255)),
+                ('fecha_pago_dividendo', models.DateField()),
+                ('total_dividendo', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_valor_historico', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('payment_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'dividend_instrument_series',
+                'ordering': ['instrumento', 'fecha_pago_dividendo'],
+                'indexes': [models.Index(fields=['instrumento', 'fecha_pago_dividendo'], name='dividend_series_instr_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dividendinstrumentseries',
+            constraint=models.UniqueConstraint(fields=('periodo_comercial', 'instrumento', 'fecha_pago_dividendo'), name='dividend_series_point_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='dividendrollup',
+            constraint=models.UniqueConstraint(fields=('periodo_comercial', 'tipo_mercado', 'origen_informacion'), name='dividend_rollup_group_uniq'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
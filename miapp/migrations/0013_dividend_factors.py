@@ -0,0 +1,42 @@
+# Generated by Django 5.0.4 on 2026-10-19 00:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from miapp.factors import backfill_dividend_factors
+
+
+def populate_dividend_factors(apps, schema_editor):
+    """Copia factores_8_37 a dividend_factors por bloques de id"""
+    backfill_dividend_factors(
+        apps.get_model('miapp', 'DividendMaintainer'),
+        apps.get_model('miapp', 'DividendFactor'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0012_dividend_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DividendFactor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factor_no', models.PositiveSmallIntegerField(help_text='Número de factor SII (8 a 37)')),
+                ('valor', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('dividend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='factors', to='miapp.dividendmaintainer')),
+            ],
+            options={
+                'db_table': 'dividend_factors',
+                'indexes': [models.Index(fields=['factor_no', 'valor', 'dividend'], name='dividend_factor_value_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dividendfactor',
+            constraint=models.UniqueConstraint(fields=('dividend', 'factor_no'), name='dividend_factor_uniq'),
+        ),
+        migrations.RunPython(populate_dividend_factors, migrations.RunPython.noop),
+    ]
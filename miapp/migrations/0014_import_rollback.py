@@ -0,0 +1,47 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0013_dividend_factors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrecord',
+            name='before',
+            field=models.JSONField(blank=True, help_text='Estado anterior del registro actualizado (JSON)', null=True),
+        ),
+        migrations.AddField(
+            model_name='importrecord',
+            name='entity',
+            field=models.CharField(blank=True, help_text="Tabla del registro escrito (ej. 'tax_grades')", max_length=50),
+        ),
+        migrations.AddField(
+            model_name='importrecord',
+            name='entity_id',
+            field=models.UUIDField(blank=True, help_text='ID del registro escrito', null=True),
+        ),
+        migrations.AddField(
+            model_name='importrecord',
+            name='operation',
+            field=models.CharField(blank=True, choices=[('create', 'Crear'), ('update', 'Actualizar')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='importrecord',
+            name='version',
+            field=models.PositiveIntegerField(blank=True, help_text='Versión del registro después de escribirlo', null=True),
+        ),
+        migrations.AlterField(
+            model_name='import',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('done', 'Completado'), ('failed', 'Fallido'), ('rolled_back', 'Revertido')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='importrecord',
+            index=models.Index(fields=['import_id', 'entity', 'entity_id', 'version'], name='import_record_change_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0014_import_rollback'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='import',
+            name='file_type',
+            field=models.CharField(choices=[('csv', 'CSV'), ('zip', 'ZIP'), ('pdf', 'PDF'), ('xlsx', 'Excel'), ('stream', 'Stream NDJSON')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0015_import_stream_file_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedConsumer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0, help_text='Último id de change_events procesado')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'change_feed_consumers',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(help_text="Entidad afectada (ej. 'tax_grades')", max_length=50)),
+                ('entity_id', models.UUIDField()),
+                ('operation', models.CharField(choices=[('create', 'Crear'), ('update', 'Actualizar'), ('delete', 'Eliminar')], max_length=10)),
+                ('version', models.PositiveIntegerField(blank=True, help_text='Versión del registro tras el cambio', null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'change_events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['entity', 'id'], name='change_event_entity_idx'), models.Index(fields=['entity_id', 'id'], name='change_event_record_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0016_change_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dividendmaintainer',
+            index=models.Index(fields=['updated_at', 'id'], name='dividend_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taxgrade',
+            index=models.Index(fields=['updated_at', 'id'], name='tax_grade_updated_idx'),
+        ),
+    ]
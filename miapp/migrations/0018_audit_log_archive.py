@@ -0,0 +1,30 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0017_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogArchive',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField(help_text='Primer día del mes archivado')),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField(help_text='Filas del bloque (JSON comprimido con zlib)')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'audit_log_archives',
+                'ordering': ['-last_timestamp', '-id'],
+                'indexes': [models.Index(fields=['month'], name='audit_log_a_month_e26215_idx'), models.Index(fields=['last_timestamp', 'first_timestamp'], name='audit_archive_range_idx')],
+            },
+        ),
+    ]
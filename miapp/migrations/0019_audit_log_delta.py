@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0018_audit_log_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='delta',
+            field=models.BinaryField(blank=True, help_text='Estados anterior y posterior como diferencia, comprimida si es grande (miapp.diffs)', null=True),
+        ),
+    ]
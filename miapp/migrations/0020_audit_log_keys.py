@@ -0,0 +1,46 @@
+# Generated by Django 5.0.4 on 2026-10-19 01:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0019_audit_log_delta'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='audit_logs_entity_22e216_idx',
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='instrumento',
+            field=models.CharField(blank=True, default='', help_text='Instrumento del registro (dividendos)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='rut',
+            field=models.CharField(blank=True, default='', help_text='RUT normalizado del registro (tax grades)', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='year',
+            field=models.IntegerField(blank=True, help_text='Año tributario o periodo comercial del registro', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['entity', 'entity_id', '-timestamp', 'id'], name='audit_log_entity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['rut', 'year', '-timestamp', 'id'], name='audit_log_rut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['instrumento', 'year', '-timestamp', 'id'], name='audit_log_instrumento_idx'),
+        ),
+    ]
@@ -1,11 +1,80 @@
 import uuid
-from django.db import models
+from django.db import DatabaseError, models
 from django.contrib.auth.models import User
 from django.utils import timezone
 import json
 
+from .diffs import decode_payload, encode_payload
+from .rut import normalize_rut
 
-class TaxGrade(models.Model):
+
+# Factores numéricos del certificado (Factor-8 a Factor-37). En factores_8_37
+# se guardan con llaves factor_1..factor_N, donde factor_i es el Factor-(i+7).
+FACTOR_NUMBERS = range(8, 38)
+
+# Campos detallados del SII (campo_1..campo_29 en campos_detallados_sii)
+SII_FIELD_NUMBERS = range(1, 30)
+
+
+def factor_key(factor_number):
+    """Llave en factores_8_37 para un número de factor SII (Factor-8 -> factor_1)"""
+    return f'factor_{factor_number - 7}'
+
+
+def sii_field_key(field_number):
+    """Llave en campos_detallados_sii para un número de campo SII"""
+    return f'campo_{field_number}'
+
+
+def audit_keys(instance):
+    """Columnas de búsqueda de AuditLog (rut, instrumento, year) de un registro auditado"""
+    return {key: getattr(instance, field) for key, field in instance.AUDIT_KEY_FIELDS.items()}
+
+
+class VersionedModelMixin:
+    """
+    Concurrencia optimista sobre un campo `version`.
+
+    save_if_version() escribe solo los campos indicados con
+    UPDATE ... WHERE id = %s AND version = %s y retorna False si otro
+    proceso modificó el registro entretanto. Los save() normales también
+    incrementan la versión.
+    """
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and getattr(self, '_expected_version', None) is None:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+    
+    def save_if_version(self, expected_version, update_fields):
+        """Guarda `update_fields` solo si la versión en BD sigue siendo `expected_version`"""
+        self._expected_version = expected_version
+        self._version_conflict = False
+        previous_version, self.version = self.version, expected_version + 1
+        try:
+            self.save(update_fields={*update_fields, 'version', 'updated_at'})
+        except DatabaseError:
+            if not self._version_conflict:
+                raise
+            self.version = previous_version
+            return False
+        finally:
+            del self._expected_version
+        return True
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = getattr(self, '_expected_version', None)
+        if expected_version is not None:
+            base_qs = base_qs.filter(version=expected_version)
+        updated = super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        self._version_conflict = not updated
+        return updated
+
+
+class TaxGrade(VersionedModelMixin, models.Model):
     """Modelo para calificaciones tributarias"""
     
     SOURCE_TYPE_CHOICES = [
@@ -26,8 +95,13 @@ class TaxGrade(models.Model):
         ('inactivo', 'Inactivo'),
     ]
     
+    # Columnas de AuditLog que identifican el registro (miapp.models.audit_keys)
+    AUDIT_KEY_FIELDS = {'rut': 'rut_normalizado', 'year': 'year'}
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     rut = models.CharField(max_length=20, db_index=True, help_text="RUT/ID del contribuyente")
+    rut_normalizado = models.CharField(max_length=12, blank=True, default='', editable=False,
+                                       help_text="RUT sin puntos ni guion (cuerpo + DV), se calcula al guardar")
     name = models.CharField(max_length=255)
     year = models.IntegerField(db_index=True, help_text="Ejercicio fiscal (2023, 2024, ...)")
     source_type = models.CharField(max_length=20, choices=SOURCE_TYPE_CHOICES, db_index=True)
@@ -42,20 +116,36 @@ class TaxGrade(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='tax_grades_updated')
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False, help_text="Se incrementa en cada escritura (concurrencia optimista)")
     
     class Meta:
         db_table = 'tax_grades'
         indexes = [
             models.Index(fields=['rut', 'year']),  # Índice compuesto para búsquedas rápidas
+            # Búsquedas exactas y por prefijo del RUT normalizado (LIKE '1234%')
+            models.Index(fields=['rut_normalizado', 'year'], name='tax_grade_rut_norm_idx'),
             models.Index(fields=['source_type']),
             models.Index(fields=['fuente_ingreso']),
             models.Index(fields=['status']),
             models.Index(fields=['year']),
+            # Paginación keyset del listado (status por defecto + orden -year, rut, id)
+            models.Index(fields=['status', '-year', 'rut', 'id'], name='tax_grade_keyset_idx'),
+            # ETag del listado: MAX(updated_at)/COUNT(*) por estado y año desde el índice
+            models.Index(fields=['status', 'year', 'updated_at'], name='tax_grade_etag_idx'),
+            # Exportación delta (?updated_since=): keyset por (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='tax_grade_updated_idx'),
         ]
         ordering = ['-year', 'rut']
     
     def __str__(self):
         return f"{self.rut} - {self.year} - {self.name}"
+    
+    def save(self, *args, **kwargs):
+        self.rut_normalizado = normalize_rut(self.rut)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rut' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'rut_normalizado'}
+        super().save(*args, **kwargs)
 
 
 class Import(models.Model):
@@ -66,6 +156,7 @@ class Import(models.Model):
         ('processing', 'Procesando'),
         ('done', 'Completado'),
         ('failed', 'Fallido'),
+        ('rolled_back', 'Revertido'),
     ]
     
     FILE_TYPE_CHOICES = [
@@ -73,6 +164,7 @@ class Import(models.Model):
         ('zip', 'ZIP'),
         ('pdf', 'PDF'),
         ('xlsx', 'Excel'),
+        ('stream', 'Stream NDJSON'),
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -93,7 +185,12 @@ class Import(models.Model):
 
 
 class ImportRecord(models.Model):
-    """Registros individuales asociados a cada importación"""
+    """
+    Registros individuales asociados a cada importación. Las filas escritas
+    guardan el registro afectado (entity, entity_id), si se creó o actualizó,
+    su estado anterior y la versión con que quedó: con eso se revierte la
+    importación completa (miapp.rollback).
+    """
     
     STATUS_CHOICES = [
         ('success', 'Éxito'),
@@ -101,6 +198,11 @@ class ImportRecord(models.Model):
         ('warning', 'Advertencia'),
     ]
     
+    OPERATION_CHOICES = [
+        ('create', 'Crear'),
+        ('update', 'Actualizar'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     import_id = models.ForeignKey(Import, on_delete=models.CASCADE, related_name='records')
     row_number_or_page = models.IntegerField(help_text="Número de fila o página del archivo")
@@ -110,19 +212,51 @@ class ImportRecord(models.Model):
     error_message = models.TextField(blank=True, help_text="Mensaje de error si aplica")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Registro escrito por la fila (para revertir la importación)
+    entity = models.CharField(max_length=50, blank=True, help_text="Tabla del registro escrito (ej. 'tax_grades')")
+    entity_id = models.UUIDField(null=True, blank=True, help_text="ID del registro escrito")
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES, blank=True)
+    before = models.JSONField(null=True, blank=True, help_text="Estado anterior del registro actualizado (JSON)")
+    version = models.PositiveIntegerField(null=True, blank=True, help_text="Versión del registro después de escribirlo")
+    
     class Meta:
         db_table = 'import_records'
         indexes = [
             models.Index(fields=['import_id', 'status']),
             models.Index(fields=['rut', 'year']),
+            models.Index(fields=['import_id', 'row_number_or_page', 'id'], name='import_record_keyset_idx'),
+            # Rollback: cambios de la importación por registro, en orden de versión
+            models.Index(fields=['import_id', 'entity', 'entity_id', 'version'], name='import_record_change_idx'),
         ]
     
     def __str__(self):
         return f"Import {self.import_id.file_name} - Row {self.row_number_or_page} - {self.status}"
 
 
+class AuditLogManager(models.Manager):
+    """bulk_create() codifica before/after igual que AuditLog.save()"""
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.fill_keys()
+            obj.encode_payload()
+        try:
+            return super().bulk_create(objs, *args, **kwargs)
+        finally:
+            for obj in objs:
+                obj.restore_payload()
+
+
 class AuditLog(models.Model):
-    """Log de auditoría para todas las acciones"""
+    """
+    Log de auditoría para todas las acciones.
+    
+    Las actualizaciones se guardan como diferencia en `delta` (miapp.diffs) y
+    no en before/after: se leen con before_state/after_state. rut, instrumento
+    y year identifican el registro auditado para buscar su historial por
+    índice; si el escritor no los indica se toman de before/after.
+    """
     
     ACTION_CHOICES = [
         ('create', 'Crear'),
@@ -139,24 +273,118 @@ class AuditLog(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_CHOICES, db_index=True)
     before = models.JSONField(null=True, blank=True, help_text="Estado anterior (JSON)")
     after = models.JSONField(null=True, blank=True, help_text="Estado posterior (JSON)")
+    delta = models.BinaryField(
+        null=True, blank=True, editable=False,
+        help_text="Estados anterior y posterior como diferencia, comprimida si es grande (miapp.diffs)",
+    )
     timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
+    rut = models.CharField(max_length=12, blank=True, default='', help_text="RUT normalizado del registro (tax grades)")
+    instrumento = models.CharField(max_length=255, blank=True, default='', help_text="Instrumento del registro (dividendos)")
+    year = models.IntegerField(null=True, blank=True, help_text="Año tributario o periodo comercial del registro")
+    
+    objects = AuditLogManager()
     
     class Meta:
         db_table = 'audit_logs'
         indexes = [
-            models.Index(fields=['entity', 'entity_id']),
             models.Index(fields=['user_id', 'timestamp']),
             models.Index(fields=['action', 'timestamp']),
+            models.Index(fields=['-timestamp', 'id'], name='audit_log_keyset_idx'),
+            # Historial paginado por cursor (-timestamp, id) de un registro, RUT o instrumento
+            models.Index(fields=['entity', 'entity_id', '-timestamp', 'id'], name='audit_log_entity_idx'),
+            models.Index(fields=['rut', 'year', '-timestamp', 'id'], name='audit_log_rut_idx'),
+            models.Index(fields=['instrumento', 'year', '-timestamp', 'id'], name='audit_log_instrumento_idx'),
         ]
         ordering = ['-timestamp']
     
     def __str__(self):
         return f"{self.action} {self.entity} by {self.user_id} at {self.timestamp}"
+    
+    def save(self, *args, **kwargs):
+        self.fill_keys()
+        self.encode_payload()
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self.restore_payload()
+    
+    def fill_keys(self):
+        """Completa rut/instrumento/year desde before/after (primero after) si no vienen indicados"""
+        if self.rut or self.instrumento or self.year is not None:
+            return
+        for state in reversed(self.states()):
+            if not isinstance(state, dict):
+                continue
+            if not self.rut and state.get('rut'):
+                self.rut = normalize_rut(state['rut'])[:12]
+            if not self.instrumento and state.get('instrumento'):
+                self.instrumento = str(state['instrumento'])[:255]
+            year = state.get('year', state.get('periodo_comercial'))
+            if self.year is None and isinstance(year, int) and not isinstance(year, bool):
+                self.year = year
+    
+    def encode_payload(self):
+        """Pasa before/after a `delta` antes de escribir (restore_payload() los devuelve)"""
+        if self.before is None and self.after is None:
+            return
+        self.delta = encode_payload(self.before, self.after)
+        if self.delta is not None:
+            self._payload = (self.before, self.after)
+            self.before = self.after = None
+    
+    def restore_payload(self):
+        payload = self.__dict__.pop('_payload', None)
+        if payload is not None:
+            self.before, self.after = payload
+    
+    def states(self):
+        """(before, after) completos, reconstruidos desde `delta` si hace falta"""
+        if self.delta is None or self.before is not None or self.after is not None:
+            return self.before, self.after
+        if '_states' not in self.__dict__:
+            self._states = decode_payload(self.delta)
+        return self._states
+    
+    @property
+    def before_state(self):
+        return self.states()[0]
+    
+    @property
+    def after_state(self):
+        return self.states()[1]
+
+
+class AuditLogArchive(models.Model):
+    """
+    Bloque de entradas de audit_logs de un mes cerrado, archivadas por
+    manage.py archive_audit_logs: las filas van como JSON comprimido con zlib
+    (miapp.archive) y se leen solo si una consulta llega a ese rango de fechas.
+    """
+    
+    id = models.BigAutoField(primary_key=True)
+    month = models.DateField(help_text="Primer día del mes archivado")
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    row_count = models.PositiveIntegerField()
+    payload = models.BinaryField(help_text="Filas del bloque (JSON comprimido con zlib)")
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'audit_log_archives'
+        indexes = [
+            models.Index(fields=['month']),
+            # Bloques que se cruzan con un rango [desde, hasta]
+            models.Index(fields=['last_timestamp', 'first_timestamp'], name='audit_archive_range_idx'),
+        ]
+        ordering = ['-last_timestamp', '-id']
+    
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.row_count} entradas"
 
 
-class DividendMaintainer(models.Model):
+class DividendMaintainer(VersionedModelMixin, models.Model):
     """Modelo para mantenedor de dividendos"""
     
     MARKET_TYPE_CHOICES = [
@@ -176,6 +404,9 @@ class DividendMaintainer(models.Model):
         ('ninguno', 'Ninguno'),
     ]
     
+    # Columnas de AuditLog que identifican el registro (miapp.models.audit_keys)
+    AUDIT_KEY_FIELDS = {'instrumento': 'instrumento', 'year': 'periodo_comercial'}
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
     # Filtros
@@ -205,6 +436,7 @@ class DividendMaintainer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='dividend_maintainers_updated')
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False, help_text="Se incrementa en cada escritura (concurrencia optimista)")
     
     class Meta:
         db_table = 'dividend_maintainers'
@@ -216,8 +448,186 @@ class DividendMaintainer(models.Model):
             models.Index(fields=['instrumento']),
             # Índice compuesto para la llave única de actualización
             models.Index(fields=['periodo_comercial', 'instrumento', 'fecha_pago_dividendo', 'secuencia_evento_capital'], name='dividend_unique_key_idx'),
+            models.Index(fields=['-periodo_comercial', 'instrumento', 'fecha_pago_dividendo', 'id'], name='dividend_keyset_idx'),
+            # ETag del listado: MAX(updated_at)/COUNT(*) por periodo desde el índice
+            models.Index(fields=['periodo_comercial', 'updated_at'], name='dividend_etag_idx'),
+            # Exportación delta (?updated_since=): keyset por (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='dividend_updated_idx'),
         ]
         ordering = ['-periodo_comercial', 'instrumento', 'fecha_pago_dividendo']
     
     def __str__(self):
-        return f"{self.instrumento} - {self.periodo_comercial} - {self.fecha_pago_dividendo}"
\ No newline at end of file
+        return f"{self.instrumento} - {self.periodo_comercial} - {self.fecha_pago_dividendo}"
+
+
+class DividendFactor(models.Model):
+    """
+    Copia tipada de factores_8_37: una fila por (dividendo, número de factor
+    SII 8..37). Se mantiene al escribir (miapp.factors) y permite filtrar y
+    ordenar por factor con un rango sobre el índice (factor_no, valor).
+    """
+    
+    dividend = models.ForeignKey(DividendMaintainer, on_delete=models.CASCADE, related_name='factors')
+    factor_no = models.PositiveSmallIntegerField(help_text="Número de factor SII (8 a 37)")
+    valor = models.DecimalField(max_digits=20, decimal_places=8)
+    
+    class Meta:
+        db_table = 'dividend_factors'
+        constraints = [
+            models.UniqueConstraint(fields=['dividend', 'factor_no'], name='dividend_factor_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['factor_no', 'valor', 'dividend'], name='dividend_factor_value_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.dividend_id} Factor-{self.factor_no}: {self.valor}"
+
+
+class SearchTrigram(models.Model):
+    """Índice invertido de trigramas para búsqueda de texto en bases sin FULLTEXT"""
+    
+    entity = models.CharField(max_length=50, help_text="Entidad indexada (ej. 'tax_grades')")
+    object_id = models.UUIDField(help_text="ID del registro indexado")
+    trigram = models.CharField(max_length=3)
+    
+    class Meta:
+        db_table = 'search_trigrams'
+        indexes = [
+            models.Index(fields=['entity', 'trigram', 'object_id'], name='search_trigram_lookup_idx'),
+            models.Index(fields=['entity', 'object_id'], name='search_trigram_doc_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.entity} {self.object_id} '{self.trigram}'"
+
+
+class TaxGradeSummary(models.Model):
+    """
+    Totales precalculados de TaxGrade por (año, tipo, fuente de ingreso, estado).
+    Se mantiene con deltas en cada escritura (miapp.summaries) y se puede
+    recalcular con `python manage.py rebuild_tax_grade_summary`.
+    """
+    
+    year = models.IntegerField()
+    source_type = models.CharField(max_length=20, choices=TaxGrade.SOURCE_TYPE_CHOICES)
+    fuente_ingreso = models.CharField(max_length=20, choices=TaxGrade.INGRESO_SOURCE_CHOICES)
+    status = models.CharField(max_length=10, choices=TaxGrade.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    record_count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'tax_grade_summaries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['year', 'source_type', 'fuente_ingreso', 'status'],
+                name='tax_grade_summary_group_uniq',
+            ),
+        ]
+        ordering = ['-year', 'source_type', 'fuente_ingreso', 'status']
+    
+    def __str__(self):
+        return f"{self.year} {self.source_type}/{self.fuente_ingreso}/{self.status}: {self.total_amount} ({self.record_count})"
+
+
+class DividendRollup(models.Model):
+    """
+    Totales precalculados de DividendMaintainer por (periodo, tipo de mercado,
+    origen). Se mantiene con deltas en cada escritura (miapp.summaries).
+    """
+    
+    periodo_comercial = models.IntegerField()
+    tipo_mercado = models.CharField(max_length=20, choices=DividendMaintainer.MARKET_TYPE_CHOICES)
+    origen_informacion = models.CharField(max_length=20, choices=DividendMaintainer.ORIGIN_CHOICES)
+    total_dividendo = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    total_valor_historico = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    record_count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'dividend_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['periodo_comercial', 'tipo_mercado', 'origen_informacion'],
+                name='dividend_rollup_group_uniq',
+            ),
+        ]
+        ordering = ['-periodo_comercial', 'tipo_mercado', 'origen_informacion']
+    
+    def __str__(self):
+        return f"{self.periodo_comercial} {self.tipo_mercado}/{self.origen_informacion}: {self.total_dividendo} ({self.record_count})"
+
+
+class DividendInstrumentSeries(models.Model):
+    """Totales de dividendos por instrumento y fecha de pago (series para gráficos)"""
+    
+    periodo_comercial = models.IntegerField()
+    instrumento = models.CharField(max_length=255)
+    fecha_pago_dividendo = models.DateField()
+    total_dividendo = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    total_valor_historico = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    payment_count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'dividend_instrument_series'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['periodo_comercial', 'instrumento', 'fecha_pago_dividendo'],
+                name='dividend_series_point_uniq',
+            ),
+        ]
+        indexes = [
+            # Serie de un instrumento ordenada por fecha (cruza periodos)
+            models.Index(fields=['instrumento', 'fecha_pago_dividendo'], name='dividend_series_instr_idx'),
+        ]
+        ordering = ['instrumento', 'fecha_pago_dividendo']
+    
+    def __str__(self):
+        return f"{self.instrumento} {self.fecha_pago_dividendo}: {self.total_dividendo}"
+
+
+class ChangeEvent(models.Model):
+    """
+    Outbox de cambios (GET /api/changes/, miapp.changes): una fila compacta por
+    escritura de calificaciones y dividendos, en la misma transacción
+    """
+    
+    OPERATION_CHOICES = [
+        ('create', 'Crear'),
+        ('update', 'Actualizar'),
+        ('delete', 'Eliminar'),
+    ]
+    
+    # El id autoincremental es el cursor del feed
+    id = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=50, help_text="Entidad afectada (ej. 'tax_grades')")
+    entity_id = models.UUIDField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    version = models.PositiveIntegerField(null=True, blank=True, help_text="Versión del registro tras el cambio")
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'change_events'
+        indexes = [
+            models.Index(fields=['entity', 'id'], name='change_event_entity_idx'),
+            # Compactación: último evento de cada registro
+            models.Index(fields=['entity_id', 'id'], name='change_event_record_idx'),
+        ]
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.id} {self.operation} {self.entity} {self.entity_id} v{self.version}"
+
+
+class ChangeFeedConsumer(models.Model):
+    """Posición confirmada (ack) de un consumidor del feed de cambios"""
+    
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0, help_text="Último id de change_events procesado")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'change_feed_consumers'
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
@@ -0,0 +1,198 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por keyset (cursor) sobre un orden único y estable.
+
+    En lugar de COUNT(*) + OFFSET, cada página filtra por los valores de la
+    última fila entregada (ej. year < 2023 OR (year = 2023 AND rut > 'x') ...),
+    por lo que el costo de una página no depende de su profundidad. El orden
+    debe terminar en una columna única (id) y estar respaldado por un índice.
+    Un queryset ordenado de otra forma (?ordering=, relevancia de ?search=) se
+    rechaza con 400: el cursor no puede representar ese orden.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = 'Cursor inválido'
+    invalid_ordering_message = 'La paginación por cursor solo admite el orden {ordering}'
+
+    def __init__(self, ordering, page_size=None):
+        self.ordering = tuple(ordering)
+        if page_size:
+            self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.check_ordering(queryset)
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self._reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Hacia adelante hay página anterior si se llegó con cursor; hacia atrás
+        # siempre hay página siguiente (la que originó el cursor)
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_position = self.previous_position = None
+        if rows:
+            if has_next:
+                self.next_position = self._position(rows[-1])
+            if has_previous:
+                self.previous_position = self._position(rows[0])
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_position, reverse=False))
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.previous_position, reverse=True))
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def check_ordering(self, queryset):
+        """El orden ya aplicado al queryset debe ser un prefijo de self.ordering"""
+        requested = tuple(queryset.query.order_by)
+        if requested != self.ordering[:len(requested)]:
+            raise ValidationError({
+                'detail': self.invalid_ordering_message.format(ordering=', '.join(self.ordering)),
+            })
+
+    # --- Cursor ------------------------------------------------------------
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'v': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            values = payload['v']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _position(self, row):
+        # `row` es una instancia o una fila de values_list(named=True) con los attname
+        position = []
+        for name in self.ordering:
+            field = self.model._meta.get_field(name.lstrip('-'))
+            value = getattr(row, field.attname)
+            position.append(value if isinstance(value, (int, float, str)) else str(value))
+        return position
+
+    # --- Filtro keyset -----------------------------------------------------
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        Construye (a > x) OR (a = x AND b > y) OR ... respetando la dirección
+        de cada columna, más una cota redundante sobre la primera columna para
+        que el optimizador use un rango sobre el índice.
+        """
+        clauses = []
+        for index, name in enumerate(ordering):
+            column = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {ordering[i].lstrip('-'): position[i] for i in range(index)}
+            clauses.append(Q(**equal, **{f'{column}__{lookup}': position[index]}))
+
+        first = ordering[0].lstrip('-')
+        bound = 'lte' if ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{first}__{bound}': position[0]}) & reduce(or_, clauses)
+
+
+def wants_keyset_pagination(request):
+    """El cliente pide paginación keyset con ?pagination=keyset o enviando un cursor"""
+    params = request.query_params
+    return params.get('pagination') == 'keyset' or KeysetPagination.cursor_query_param in params
+
+
+class KeysetPaginationMixin:
+    """
+    Habilita paginación keyset opcional en un ViewSet. Sin el parámetro se
+    mantiene la paginación por número de página configurada en REST_FRAMEWORK.
+    """
+
+    keyset_ordering = None
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator') and self.keyset_ordering
+                and wants_keyset_pagination(self.request)):
+            self._paginator = KeysetPagination(self.keyset_ordering)
+        return super().paginator
@@ -0,0 +1,86 @@
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el JSONRenderer de DRF
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional: sin él no se ofrece application/x-msgpack
+    msgpack = None
+
+
+class FileExportRenderer(renderers.BaseRenderer):
+    """
+    Renderer base para acciones que construyen su propia respuesta de archivo.
+    Solo existe para que la negociación de contenido acepte ?format=<tipo>;
+    los errores (dict) se devuelven como JSON.
+    """
+
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, str)):
+            return data
+        return renderers.JSONRenderer().render(data)
+
+
+class CSVExportRenderer(FileExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ParquetExportRenderer(FileExportRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer que usa orjson para las respuestas del fast path de los
+    listados marcadas con `fast_json = True` (miapp.fastlist). orjson
+    escribe algunos float distinto que json (0.00001 / 1e-05), por lo que solo
+    se usa en respuestas sin floats; todo lo demás (indent, ensure_ascii,
+    errores, respuestas normales) pasa por el JSONRenderer de DRF, con lo que
+    la salida es idéntica byte a byte.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        context = renderer_context or {}
+        response = context.get('response')
+        if (orjson is None or data is None or not getattr(response, 'fast_json', False)
+                or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, context) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Igual que DRF: U+2028/U+2029 escapados para poder incrustar el JSON en <script>
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    MessagePack (application/x-msgpack, ?format=msgpack). Los tipos que no
+    son nativos se convierten igual que en el JSON de DRF; los bytes (ej. las
+    matrices de la representación columnar) van como bin.
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = renderers.JSONRenderer.encoder_class
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=self.encoder_class().default)
+
+
+def available_renderer_classes(*renderer_classes):
+    """Quita MessagePackRenderer si msgpack no está instalado"""
+    return [cls for cls in renderer_classes if msgpack is not None or not issubclass(cls, MessagePackRenderer)]
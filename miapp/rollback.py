@@ -0,0 +1,340 @@
+"""
+Reversión de una importación completa (POST /api/imports/{id}/rollback/).
+
+Cada fila que escriben los importadores (miapp.services) queda marcada en su
+ImportRecord con el registro afectado (entity, entity_id), la operación
+(create/update), el estado anterior del registro (rollback_state) y la
+versión con que quedó. rollback_import() toma por registro el primer cambio
+de la importación (el estado previo a ella) y la última versión que escribió,
+y en bloques de IMPORT_ROLLBACK_CHUNK_SIZE registros, una transacción por
+bloque:
+
+- elimina los registros que la importación creó con un solo DELETE (más sus
+  filas de dividend_factors y del índice de búsqueda),
+- restaura los valores anteriores de los que actualizó con un solo UPDATE
+  (bulk_update),
+
+junto con la auditoría y los rollups del bloque. Los registros modificados
+después de la importación (otra versión) son conflictos: sin force la
+reversión se rechaza con 409 y se listan; con force se sobrescriben.
+"""
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .audit import dividend_audit_state, insert_audit_entries, tax_grade_audit_state
+from .cache import bump_cache_generations
+from .changes import change_event, insert_change_events, record_changes
+from .factors import sync_dividend_factors
+from .models import AuditLog, DividendFactor, DividendMaintainer, ImportRecord, TaxGrade, audit_keys
+from .search import SEARCH_DOCUMENTS, index_search_documents, remove_search_documents
+from .summaries import DIVIDEND_ROLLUPS, SNAPSHOT_LOOKUP_BATCH_SIZE, TAX_GRADE_ROLLUPS, SummaryDelta
+
+DEFAULT_CHUNK_SIZE = 1000
+# Ids en conflicto que se listan en la respuesta
+CONFLICT_SAMPLE_SIZE = 100
+# Estados de la importación desde los que se puede revertir
+ROLLBACK_FROM_STATUSES = ('done', 'failed')
+
+# Campos que se restauran; los de auditoría quedan con quien revierte
+ROLLBACK_FIELDS = {
+    TaxGrade: (
+        'rut', 'rut_normalizado', 'name', 'year', 'source_type', 'fuente_ingreso', 'amount', 'factor',
+        'calculation_basis', 'status',
+    ),
+    DividendMaintainer: (
+        'tipo_mercado', 'origen_informacion', 'periodo_comercial', 'instrumento', 'fecha_pago_dividendo',
+        'descripcion_dividendo', 'secuencia_evento_capital', 'acogido_isfut_isift', 'origen',
+        'factor_actualizacion', 'dividendo', 'valor_historico', 'campos_detallados_sii', 'factores_8_37',
+    ),
+}
+
+
+def rollback_chunk_size():
+    return getattr(settings, 'IMPORT_ROLLBACK_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+class RollbackConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'La importación no se puede revertir.'
+    default_code = 'rollback_conflict'
+
+
+def rollback_state(instance):
+    """Valores de los campos restaurables de un registro (serializables a JSON)"""
+    state = {}
+    for name in ROLLBACK_FIELDS[type(instance)]:
+        field = instance._meta.get_field(name)
+        value = getattr(instance, name)
+        if value is None or isinstance(field, models.JSONField) or isinstance(value, (int, str)):
+            state[name] = value
+        else:
+            # Montos y fechas como texto (Decimal/date no son JSON)
+            state[name] = field.value_to_string(instance)
+    return state
+
+
+def restore_state(instance, state):
+    """Asigna los valores de `state`; retorna los campos que cambiaron"""
+    changed = []
+    for name, value in state.items():
+        value = instance._meta.get_field(name).to_python(value)
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed.append(name)
+    return changed
+
+
+def import_change(instance, before, created):
+    """Campos de ImportRecord que marcan la escritura de `instance` por la importación"""
+    return {
+        'entity': instance._meta.db_table,
+        'entity_id': instance.pk,
+        'operation': 'create' if created else 'update',
+        'before': None if created else before,
+        'version': instance.version,
+    }
+
+
+def load_tax_grade_states(ruts_normalizados):
+    """
+    Estados actuales de los TaxGrade de un archivo, por (rut_normalizado,
+    año), cargados en lotes antes de importar (como load_summary_snapshots).
+    """
+    ruts = sorted({rut for rut in ruts_normalizados if rut})
+    states = {}
+    for start in range(0, len(ruts), SNAPSHOT_LOOKUP_BATCH_SIZE):
+        rows = TaxGrade.objects.filter(
+            rut_normalizado__in=ruts[start:start + SNAPSHOT_LOOKUP_BATCH_SIZE]
+        ).only(*ROLLBACK_FIELDS[TaxGrade])
+        for tax_grade in rows:
+            states[(tax_grade.rut_normalizado, tax_grade.year)] = rollback_state(tax_grade)
+    return states
+
+
+class RollbackTarget:
+    """Reversión de los registros de un modelo escritos por una importación"""
+
+    model = None
+    rollups = ()
+    year_field = None
+    audit_state = None
+
+    def __init__(self, import_obj):
+        self.import_obj = import_obj
+        self.entity = self.model._meta.db_table
+        self.pending = {}
+
+    def changes(self):
+        """
+        {id: (operación, estado previo, última versión)}: el primer cambio de
+        cada registro en la importación (un archivo puede escribirlo varias
+        veces) y la versión con que lo dejó el último.
+        """
+        changes = {}
+        rows = ImportRecord.objects.filter(
+            import_id=self.import_obj, entity=self.entity, entity_id__isnull=False,
+        ).order_by('entity_id', 'version').values_list('entity_id', 'operation', 'before', 'version')
+        for entity_id, operation, before, version in rows.iterator(chunk_size=SNAPSHOT_LOOKUP_BATCH_SIZE):
+            first = changes.get(entity_id)
+            changes[entity_id] = (operation, before, version) if first is None else (first[0], first[1], version)
+        return changes
+
+    def current_versions(self, ids):
+        versions = {}
+        chunk_size = rollback_chunk_size()
+        for start in range(0, len(ids), chunk_size):
+            versions.update(self.model.objects.filter(pk__in=ids[start:start + chunk_size]).values_list('pk', 'version'))
+        return versions
+
+    def remove_dependents(self, targets):
+        remove_search_documents(self.model, targets.values('pk'))
+
+    def after_restore(self, restored):
+        """Mantención de índices derivados; `restored` es [(instancia, campos restaurados)]"""
+        search_fields = set(SEARCH_DOCUMENTS.get(self.model, ()))
+        index_search_documents(instance for instance, changed in restored if search_fields.intersection(changed))
+
+    def write_chunk(self, changes, ids, user, force, audit):
+        """Revierte un bloque dentro de la transacción; retorna sus totales y años"""
+        totals = {'restored': 0, 'deleted': 0, 'missing': 0, 'conflict_ids': []}
+        years = set()
+        now = timezone.now()
+        delta = SummaryDelta(self.rollups)
+        current = {instance.pk: instance for instance in self.model.objects.select_for_update().filter(pk__in=ids)}
+        delete_ids, restored, audit_entries = [], [], []
+        update_fields = {'updated_by', 'updated_at', 'version'}
+
+        for pk in ids:
+            instance = current.get(pk)
+            operation, before, version = changes[pk]
+            if instance is None or (operation == 'update' and before is None):
+                # Eliminado después de la importación (o sin estado previo registrado)
+                totals['missing'] += 1
+                continue
+            if instance.version != version and not force:
+                totals['conflict_ids'].append(pk)
+                continue
+            years.add(getattr(instance, self.year_field))
+            if operation == 'create':
+                delete_ids.append(pk)
+                delta.change(delta.snapshot(instance), None)
+                continue
+            previous, before_snapshot = rollback_state(instance), delta.snapshot(instance)
+            changed = restore_state(instance, before)
+            totals['restored'] += 1
+            if not changed:
+                # Ya tiene los valores anteriores: no se escribe
+                continue
+            update_fields.update(changed)
+            instance.updated_by = user
+            instance.updated_at = now
+            instance.version += 1
+            years.add(getattr(instance, self.year_field))  # el año restaurado puede ser otro
+            delta.change(before_snapshot, delta.snapshot(instance))
+            restored.append((instance, changed))
+            audit_entries.append(AuditLog(
+                user_id=user, entity=self.entity, entity_id=str(pk), action='update',
+                before=previous, after=before, timestamp=now, **audit, **audit_keys(instance),
+            ))
+
+        if restored:
+            # Un UPDATE ... SET campo = CASE id ... por bloque, solo con los campos restaurados
+            self.model.objects.bulk_update(
+                [instance for instance, _ in restored], sorted(update_fields), batch_size=len(restored),
+            )
+            AuditLog.objects.bulk_create(audit_entries, batch_size=len(audit_entries))
+            record_changes([change_event(instance, 'update') for instance, _ in restored])
+            self.after_restore(restored)
+        if delete_ids:
+            targets = self.model.objects.filter(pk__in=delete_ids)
+            insert_audit_entries(
+                targets, user=user, action='delete', before=self.audit_state, after=None, timestamp=now, **audit,
+            )
+            insert_change_events(targets, 'delete', timestamp=now)
+            self.remove_dependents(targets)
+            # Sin cascadas es un DELETE directo; con cascadas (factores de dividendos,
+            # ya borrados en remove_dependents) QuerySet.delete() solo lee los pk
+            totals['deleted'] = targets.only('pk').delete()[1].get(self.model._meta.label, 0)
+        delta.apply()
+        return totals, years
+
+    def plan(self):
+        """Carga los cambios de la importación y cuenta lo que haría la reversión"""
+        self.pending = self.changes()
+        versions = self.current_versions(list(self.pending))
+        plan = {'restored': 0, 'deleted': 0, 'missing': 0, 'conflict_ids': []}
+        for pk, (operation, before, version) in self.pending.items():
+            if pk not in versions or (operation == 'update' and before is None):
+                plan['missing'] += 1
+                continue
+            if versions[pk] != version:
+                plan['conflict_ids'].append(pk)
+            plan['deleted' if operation == 'create' else 'restored'] += 1
+        return plan
+
+    def write(self, user, *, force=False, audit):
+        """Revierte los cambios cargados por plan(), en bloques de una transacción"""
+        totals = {'restored': 0, 'deleted': 0, 'missing': 0, 'conflict_ids': []}
+        ids = list(self.pending)
+        years = set()
+        chunk_size = rollback_chunk_size()
+        try:
+            for start in range(0, len(ids), chunk_size):
+                with transaction.atomic():
+                    chunk_totals, chunk_years = self.write_chunk(
+                        self.pending, ids[start:start + chunk_size], user, force, audit,
+                    )
+                for key in ('restored', 'deleted', 'missing'):
+                    totals[key] += chunk_totals[key]
+                totals['conflict_ids'] += chunk_totals['conflict_ids']
+                years.update(chunk_years)
+        finally:
+            # Invalidar la caché de respuestas de los años revertidos
+            bump_cache_generations(self.entity, years)
+        return totals
+
+
+class TaxGradeRollback(RollbackTarget):
+    model = TaxGrade
+    rollups = TAX_GRADE_ROLLUPS
+    year_field = 'year'
+    audit_state = staticmethod(tax_grade_audit_state)
+
+
+class DividendRollback(RollbackTarget):
+    model = DividendMaintainer
+    rollups = DIVIDEND_ROLLUPS
+    year_field = 'periodo_comercial'
+    audit_state = staticmethod(dividend_audit_state)
+
+    def remove_dependents(self, targets):
+        super().remove_dependents(targets)
+        DividendFactor.objects.filter(dividend__in=targets.values('pk')).delete()
+
+    def after_restore(self, restored):
+        super().after_restore(restored)
+        sync_dividend_factors(instance for instance, changed in restored if 'factores_8_37' in changed)
+
+
+ROLLBACK_TARGETS = (TaxGradeRollback, DividendRollback)
+
+
+def _summary(results, preview):
+    summary = {'preview': preview}
+    for key in ('restored', 'deleted', 'missing'):
+        summary[key] = sum(result[key] for result in results.values())
+    conflict_ids = [str(pk) for result in results.values() for pk in result['conflict_ids']]
+    summary['conflicts'] = len(conflict_ids)
+    summary['conflict_ids'] = conflict_ids[:CONFLICT_SAMPLE_SIZE]
+    summary['entities'] = {
+        entity: {key: value for key, value in result.items() if key != 'conflict_ids'}
+        for entity, result in results.items()
+    }
+    return summary
+
+
+def rollback_import(import_obj, user, *, force=False, preview=False, ip_address=None, user_agent=''):
+    """
+    Revierte una importación: elimina los registros que creó y restaura los
+    valores anteriores de los que actualizó. Lanza RollbackConflict (409) si
+    la importación no está terminada, ya fue revertida o (sin `force`) tiene
+    registros modificados después de ella.
+    """
+    if import_obj.status not in ROLLBACK_FROM_STATUSES:
+        raise RollbackConflict(
+            'La importación ya fue revertida.' if import_obj.status == 'rolled_back'
+            else 'La importación aún se está procesando.'
+        )
+
+    targets = [target_class(import_obj) for target_class in ROLLBACK_TARGETS]
+    summary = _summary({target.entity: target.plan() for target in targets}, preview=True)
+    if preview:
+        return summary
+    if summary['conflicts'] and not force:
+        raise RollbackConflict({
+            'detail': f"{summary['conflicts']} registros fueron modificados después de la importación; "
+                      'use force=true para sobrescribirlos.',
+            'conflict_ids': summary['conflict_ids'],
+        })
+
+    audit = {'ip_address': ip_address, 'user_agent': user_agent}
+    summary = _summary({target.entity: target.write(user, force=force, audit=audit) for target in targets}, False)
+    previous_status = import_obj.status
+    if not summary['conflicts']:
+        import_obj.status = 'rolled_back'
+        import_obj.save(update_fields=['status'])
+    summary['status'] = import_obj.status
+    AuditLog.objects.create(
+        user_id=user,
+        entity='imports',
+        entity_id=str(import_obj.id),
+        action='update',
+        before={'status': previous_status},
+        after={key: summary[key] for key in ('status', 'restored', 'deleted', 'missing', 'conflicts')},
+        timestamp=timezone.now(),
+        **audit,
+    )
+    return summary
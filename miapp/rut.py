@@ -0,0 +1,91 @@
+"""
+Normalización y validación de RUT (módulo 11).
+
+Los RUT llegan como `12.345.678-5`, `12345678-5` o `123456785`. La forma
+normalizada (columna TaxGrade.rut_normalizado) es el cuerpo sin ceros a la
+izquierda seguido del dígito verificador, sin puntos ni guion: `123456785`.
+
+validate_ruts() valida columnas completas de una vez (NumPy) para que los
+importadores rechacen en bloque los RUT mal formados.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+RUT_MAX_BODY_DIGITS = 9
+_RUT_CHARS_RE = re.compile(r'[^0-9K]')
+# Sufijo de los RUT leídos como número desde Excel (123456785.0); los puntos
+# de miles siempre van seguidos de tres dígitos, así que no hay ambigüedad
+_FLOAT_SUFFIX_RE = re.compile(r'\.0$')
+_BODY_RE = r'[0-9]{1,%d}' % RUT_MAX_BODY_DIGITS
+# Pesos 2, 3, 4, 5, 6, 7, 2, 3, ... desde el dígito de más a la derecha
+_WEIGHTS = np.resize(np.arange(2, 8), RUT_MAX_BODY_DIGITS)[::-1]
+_CHECK_DIGITS = np.array(['0'] + [str(n) for n in range(1, 10)] + ['K', '0'])
+
+
+def normalize_rut(value):
+    """Cuerpo + dígito verificador, sin puntos, guion ni ceros a la izquierda"""
+    if value is None:
+        return ''
+    text = _FLOAT_SUFFIX_RE.sub('', str(value).strip())
+    return _RUT_CHARS_RE.sub('', text.upper()).lstrip('0')
+
+
+def normalize_rut_prefix(value):
+    """Normaliza un prefijo de RUT para búsquedas por comienzo (solo cuerpo)"""
+    return re.sub(r'[^0-9]', '', str(value or '')).lstrip('0')
+
+
+def check_digit(body):
+    """Dígito verificador módulo 11 de un cuerpo de RUT"""
+    return str(compute_check_digits(np.array([body]))[0])
+
+
+def compute_check_digits(bodies):
+    """
+    Dígitos verificadores de un arreglo de cuerpos numéricos (strings de
+    1 a RUT_MAX_BODY_DIGITS dígitos), calculados en una sola operación.
+    """
+    bodies = np.asarray(bodies, dtype=f'U{RUT_MAX_BODY_DIGITS}')
+    if bodies.size == 0:
+        return np.array([], dtype='U1')
+    padded = np.char.zfill(bodies, RUT_MAX_BODY_DIGITS).astype(f'S{RUT_MAX_BODY_DIGITS}')
+    digits = np.frombuffer(padded.tobytes(), dtype=np.uint8).reshape(-1, RUT_MAX_BODY_DIGITS) - ord('0')
+    remainder = 11 - (digits.astype(np.int64) @ _WEIGHTS) % 11
+    return _CHECK_DIGITS[remainder]
+
+
+def validate_ruts(values):
+    """
+    Normaliza y valida una columna de RUT completa.
+
+    Retorna (normalizados, válidos): una Series con la forma normalizada y una
+    Series booleana, ambas con el mismo índice que `values`.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype='object')
+    if pd.api.types.is_float_dtype(series):
+        # Excel entrega los RUT sin guion como números (123456785.0)
+        series = series.astype('Int64')
+    text = series.astype('string').fillna('')
+    normalized = (
+        text.str.strip()
+        .str.replace(_FLOAT_SUFFIX_RE.pattern, '', regex=True)
+        .str.upper()
+        .str.replace(_RUT_CHARS_RE.pattern, '', regex=True)
+        .str.lstrip('0')
+    )
+    body = normalized.str[:-1]
+    dv = normalized.str[-1:]
+
+    valid = body.str.fullmatch(_BODY_RE).fillna(False).astype(bool)
+    expected = pd.Series('', index=series.index, dtype='string')
+    if valid.any():
+        expected[valid] = compute_check_digits(body[valid].to_numpy(dtype=str))
+    valid &= (dv == expected).fillna(False).astype(bool)
+    return normalized.astype(object), valid
+
+
+def is_valid_rut(value):
+    """Valida el dígito verificador de un RUT individual"""
+    return bool(validate_ruts([value])[1].iloc[0])
@@ -0,0 +1,252 @@
+"""
+Búsqueda de texto indexada para los listados (?search=).
+
+- MySQLFullTextBackend: usa los índices FULLTEXT creados en la migración
+  (MATCH ... AGAINST en modo booleano, con prefijos). Los RUT se buscan por
+  prefijo de rut_normalizado y las palabras que el índice no guarda (más
+  cortas que SEARCH_FULLTEXT_MIN_TOKEN_SIZE) con LIKE.
+- TrigramBackend: índice invertido de trigramas (tabla search_trigrams)
+  mantenido en cada escritura; se usa en bases sin FULLTEXT.
+- LikeBackend: el comportamiento original de SearchFilter (LIKE '%term%').
+
+El backend se elige con settings.SEARCH_BACKEND ('auto', 'mysql', 'trigram',
+'like' o la ruta a una clase). En todos los casos el queryset queda anotado
+con `search_rank` y ordenado por relevancia salvo que se pida ?ordering=.
+"""
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, OuterRef, Q, QuerySet, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import SearchTrigram, TaxGrade, DividendMaintainer
+from .rut import normalize_rut
+
+# Campos de texto indexados por entidad (deben coincidir con los índices FULLTEXT)
+SEARCH_DOCUMENTS = {
+    TaxGrade: ['rut', 'name', 'calculation_basis'],
+    DividendMaintainer: ['instrumento', 'descripcion_dividendo'],
+}
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+# Términos con forma de RUT (completo o prefijo): 12.345.678-5, 12345678-k, 12.345
+_RUT_TERM_RE = re.compile(r'[0-9][0-9.]*(-?[0-9kK])?')
+# Largo desde el que un número sin puntos ni guion se trata como RUT
+RUT_TERM_MIN_DIGITS = 7
+
+
+def normalize_text(value):
+    """Minúsculas sin tildes, solo letras y dígitos"""
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return _WORD_RE.findall(text.lower())
+
+
+def document_trigrams(values):
+    """Trigramas de un documento, con relleno de inicio/fin de palabra"""
+    trigrams = set()
+    for value in values:
+        for word in normalize_text(value):
+            padded = f'  {word} '
+            trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def query_trigrams(term):
+    """Trigramas internos de cada palabra buscada (equivalente a LIKE '%palabra%')"""
+    trigrams = set()
+    for word in normalize_text(term):
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def rut_term(term):
+    """RUT normalizado (prefijo) si el término tiene forma de RUT, si no None"""
+    term = term.strip()
+    if not _RUT_TERM_RE.fullmatch(term):
+        return None
+    if not any(char in term for char in '.-kK') and len(term) < RUT_TERM_MIN_DIGITS:
+        # Un número corto (ej. un año) se busca como texto
+        return None
+    return normalize_rut(term) or None
+
+
+def contains_all(queryset, words, fields):
+    """Cada palabra debe estar (LIKE '%palabra%') en alguno de los campos"""
+    for word in words:
+        queryset = queryset.filter(
+            Q(*[Q(**{f'{field}__icontains': word}) for field in fields], _connector=Q.OR)
+        )
+    return queryset
+
+
+def entity_name(model):
+    return model._meta.db_table
+
+
+class BaseSearchBackend:
+    """Interfaz de los backends de búsqueda"""
+
+    def search(self, queryset, term, fields):
+        raise NotImplementedError
+
+    def index_documents(self, instances):
+        """Mantener el índice luego de crear/actualizar registros"""
+
+    def remove_documents(self, model, ids):
+        """Mantener el índice luego de eliminar registros"""
+
+
+class LikeBackend(BaseSearchBackend):
+    """LIKE '%term%' sobre cada campo (sin índice, equivalente a SearchFilter)"""
+
+    def search(self, queryset, term, fields):
+        queryset = contains_all(queryset, term.split(), fields)
+        return queryset.annotate(search_rank=Value(1.0, output_field=FloatField()))
+
+
+class MySQLFullTextBackend(BaseSearchBackend):
+    """
+    MATCH ... AGAINST sobre los índices FULLTEXT (el índice lo mantiene MySQL).
+    InnoDB no indexa tokens de menos de innodb_ft_min_token_size caracteres
+    (SEARCH_FULLTEXT_MIN_TOKEN_SIZE): esas palabras se filtran con LIKE, y un
+    RUT (cuyos puntos lo parten en tokens cortos) por prefijo de rut_normalizado.
+    """
+
+    def search(self, queryset, term, fields):
+        if not normalize_text(term):
+            return queryset.none()
+
+        rut = rut_term(term) if 'rut' in fields and hasattr(queryset.model, 'rut_normalizado') else None
+        if rut:
+            return (
+                queryset
+                .filter(rut_normalizado__startswith=rut)
+                .annotate(search_rank=Value(1.0, output_field=FloatField()))
+            )
+
+        min_token_size = getattr(settings, 'SEARCH_FULLTEXT_MIN_TOKEN_SIZE', 3)
+        words, short_words = [], []
+        for word in term.split():
+            tokens = normalize_text(word)
+            if all(len(token) >= min_token_size for token in tokens):
+                words.extend(tokens)
+            else:
+                short_words.append(word)
+        queryset = contains_all(queryset, short_words, fields)
+        if not words:
+            return queryset.annotate(search_rank=Value(1.0, output_field=FloatField()))
+
+        quote = connection.ops.quote_name
+        table = quote(queryset.model._meta.db_table)
+        columns = ', '.join(f'{table}.{quote(field)}' for field in fields)
+        boolean_query = ' '.join(f'+{word}*' for word in words)
+        rank = RawSQL(f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)', [boolean_query],
+                      output_field=FloatField())
+        return queryset.annotate(search_rank=rank).filter(search_rank__gt=0)
+
+
+class TrigramBackend(BaseSearchBackend):
+    """
+    Índice invertido de trigramas. Un registro coincide si contiene al menos
+    SEARCH_TRIGRAM_MIN_SIMILARITY de los trigramas buscados; la relevancia es
+    la fracción de trigramas encontrados.
+    """
+
+    batch_size = 5000
+
+    def search(self, queryset, term, fields):
+        trigrams = query_trigrams(term)
+        if not trigrams:
+            # Palabras de menos de 3 caracteres no generan trigramas: LIKE sobre los campos
+            return LikeBackend().search(queryset, term, fields)
+
+        min_similarity = getattr(settings, 'SEARCH_TRIGRAM_MIN_SIMILARITY', 0.75)
+        min_hits = max(1, math.ceil(len(trigrams) * min_similarity))
+        hits = (
+            SearchTrigram.objects
+            .filter(entity=entity_name(queryset.model), trigram__in=trigrams)
+            .values('object_id')
+            .annotate(hits=Count('id'))
+            .filter(hits__gte=min_hits)
+        )
+        rank = Subquery(
+            hits.filter(object_id=OuterRef('pk')).values('hits')[:1]
+        )
+        return (
+            queryset
+            .filter(pk__in=hits.values('object_id'))
+            .annotate(search_rank=Cast(Coalesce(rank, 0), FloatField()) / len(trigrams))
+        )
+
+    def index_documents(self, instances):
+        instances = list(instances)
+        if not instances:
+            return
+        model = type(instances[0])
+        fields = SEARCH_DOCUMENTS.get(model)
+        if not fields:
+            return
+        entity = entity_name(model)
+        rows = [
+            SearchTrigram(entity=entity, object_id=instance.pk, trigram=trigram)
+            for instance in instances
+            for trigram in document_trigrams(getattr(instance, field) for field in fields)
+        ]
+        # Dentro de una escritura mayor se une a su transacción (sin SAVEPOINT)
+        with transaction.atomic(savepoint=False):
+            SearchTrigram.objects.filter(entity=entity, object_id__in=[i.pk for i in instances]).delete()
+            SearchTrigram.objects.bulk_create(rows, batch_size=self.batch_size)
+
+    def remove_documents(self, model, ids):
+        SearchTrigram.objects.filter(entity=entity_name(model), object_id__in=ids if isinstance(ids, QuerySet) else list(ids)).delete()
+
+
+SEARCH_BACKENDS = {
+    'mysql': MySQLFullTextBackend,
+    'trigram': TrigramBackend,
+    'like': LikeBackend,
+}
+
+
+def get_search_backend():
+    """Backend configurado en settings.SEARCH_BACKEND ('auto' según el motor de BD)"""
+    name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = 'mysql' if connection.vendor == 'mysql' else 'trigram'
+    backend_class = SEARCH_BACKENDS.get(name) or import_string(name)
+    return backend_class()
+
+
+def index_search_documents(instances):
+    """Actualizar el índice de búsqueda luego de escribir registros"""
+    get_search_backend().index_documents(instances)
+
+
+def remove_search_documents(model, ids):
+    """Quitar registros eliminados del índice de búsqueda (`ids`: lista o queryset de pk)"""
+    get_search_backend().remove_documents(model, ids)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Reemplazo de SearchFilter que enruta ?search= por el backend configurado.
+    Debe ir después de OrderingFilter para ordenar por relevancia cuando no
+    se pide un orden explícito.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        fields = getattr(view, 'search_fields', None)
+        if not term or not fields:
+            return queryset
+
+        queryset = get_search_backend().search(queryset, term, fields)
+        if not request.query_params.get('ordering'):
+            queryset = queryset.order_by(F('search_rank').desc(), *queryset.query.order_by)
+        return queryset
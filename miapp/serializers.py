@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import TaxGrade, Import, ImportRecord, AuditLog, DividendMaintainer
+from .rut import is_valid_rut
+from .fieldsets import SparseFieldsetSerializerMixin
+from .bulk import BulkListSerializer
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -65,7 +68,7 @@ class TaxGradeSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'rut', 'name', 'year', 'source_type', 'fuente_ingreso', 'amount', 'factor',
             'calculation_basis', 'status', 'created_by', 'created_by_username',
-            'created_at', 'updated_by', 'updated_by_username', 'updated_at'
+            'created_at', 'updated_by', 'updated_by_username', 'updated_at', 'version'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'fuente_ingreso']  # fuente_ingreso es de solo lectura
     
@@ -73,6 +76,8 @@ class TaxGradeSerializer(serializers.ModelSerializer):
         """Validar formato de RUT"""
         if not value or len(value.strip()) == 0:
             raise serializers.ValidationError("El RUT no puede estar vacío")
+        if not is_valid_rut(value):
+            raise serializers.ValidationError("RUT inválido: el dígito verificador no corresponde")
         return value.strip()
     
     def validate_year(self, value):
@@ -82,12 +87,29 @@ class TaxGradeSerializer(serializers.ModelSerializer):
         return value
     
 
-class TaxGradeListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listado de TaxGrade"""
+class TaxGradeBulkSerializer(TaxGradeSerializer):
+    """Ítem de POST /api/tax-grades/bulk/ (auditoría y fuente_ingreso los asigna el servidor)"""
+    
+    created_by_username = None
+    updated_by_username = None
+    
+    class Meta:
+        model = TaxGrade
+        fields = ['rut', 'name', 'year', 'source_type', 'amount', 'factor', 'calculation_basis', 'status']
+        list_serializer_class = BulkListSerializer
+
+
+class TaxGradeListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """Serializer simplificado para listado de TaxGrade (admite ?fields=/?exclude=)"""
     
     class Meta:
         model = TaxGrade
-        fields = ['id', 'rut', 'name', 'year', 'source_type', 'fuente_ingreso', 'amount', 'status']
+        fields = [
+            'id', 'rut', 'name', 'year', 'source_type', 'fuente_ingreso', 'amount', 'status',
+            'factor', 'calculation_basis', 'created_at', 'updated_at', 'version'
+        ]
+        # Solo se entregan (y se leen) si se piden en ?fields=
+        deferred_fields = ['factor', 'calculation_basis', 'created_at', 'updated_at', 'version']
 
 
 class ImportRecordSerializer(serializers.ModelSerializer):
@@ -97,7 +119,7 @@ class ImportRecordSerializer(serializers.ModelSerializer):
         model = ImportRecord
         fields = [
             'id', 'import_id', 'row_number_or_page', 'rut', 'year',
-            'status', 'error_message', 'created_at'
+            'status', 'error_message', 'created_at', 'entity', 'entity_id', 'operation'
         ]
         read_only_fields = ['id', 'created_at']
 
@@ -120,13 +142,20 @@ class ImportSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'uploaded_at', 'file_hash']
     
+    # Los conteos vienen anotados desde ImportViewSet.get_queryset; sin anotación se consultan
     def get_records_count(self, obj):
+        if hasattr(obj, 'records_total'):
+            return obj.records_total
         return obj.records.count()
     
     def get_success_count(self, obj):
+        if hasattr(obj, 'records_success'):
+            return obj.records_success
         return obj.records.filter(status='success').count()
     
     def get_error_count(self, obj):
+        if hasattr(obj, 'records_error'):
+            return obj.records_error
         return obj.records.filter(status='error').count()
 
 
@@ -134,6 +163,9 @@ class AuditLogSerializer(serializers.ModelSerializer):
     """Serializer para AuditLog"""
     
     user_username = serializers.CharField(source='user_id.username', read_only=True)
+    # Las actualizaciones se guardan como diferencia (AuditLog.delta): se reconstruyen
+    before = serializers.JSONField(source='before_state', read_only=True)
+    after = serializers.JSONField(source='after_state', read_only=True)
     
     class Meta:
         model = AuditLog
@@ -181,7 +213,7 @@ class DividendMaintainerSerializer(serializers.ModelSerializer):
             'factor_actualizacion', 'factores_8_37', 'dividendo', 'valor_historico',
             'campos_detallados_sii',
             'created_by', 'created_by_username', 'created_at',
-            'updated_by', 'updated_by_username', 'updated_at'
+            'updated_by', 'updated_by_username', 'updated_at', 'version'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
     
@@ -198,8 +230,26 @@ class DividendMaintainerSerializer(serializers.ModelSerializer):
         return value
 
 
-class DividendMaintainerListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listado de DividendMaintainer"""
+class DividendMaintainerBulkSerializer(DividendMaintainerSerializer):
+    """Ítem de POST /api/dividend-maintainers/bulk/ (los campos de auditoría los asigna el servidor)"""
+    
+    created_by_username = None
+    updated_by_username = None
+    
+    class Meta:
+        model = DividendMaintainer
+        fields = [
+            'tipo_mercado', 'origen_informacion', 'periodo_comercial',
+            'instrumento', 'fecha_pago_dividendo', 'descripcion_dividendo',
+            'secuencia_evento_capital', 'acogido_isfut_isift', 'origen',
+            'factor_actualizacion', 'factores_8_37', 'dividendo', 'valor_historico',
+            'campos_detallados_sii',
+        ]
+        list_serializer_class = BulkListSerializer
+
+
+class DividendMaintainerListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """Serializer simplificado para listado de DividendMaintainer (admite ?fields=/?exclude=)"""
     
     class Meta:
         model = DividendMaintainer
@@ -207,5 +257,7 @@ class DividendMaintainerListSerializer(serializers.ModelSerializer):
             'id', 'periodo_comercial', 'instrumento', 'fecha_pago_dividendo',
             'descripcion_dividendo', 'secuencia_evento_capital', 'acogido_isfut_isift',
             'origen', 'factor_actualizacion', 'factores_8_37', 'tipo_mercado', 'origen_informacion',
-            'dividendo', 'valor_historico', 'campos_detallados_sii'
+            'dividendo', 'valor_historico', 'campos_detallados_sii', 'updated_at', 'version'
         ]
+        # JSON pesados: solo se entregan (y se leen) si se piden en ?fields=
+        deferred_fields = ['factores_8_37', 'campos_detallados_sii', 'updated_at', 'version']
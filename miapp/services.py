@@ -5,14 +5,43 @@ import hashlib
 import pandas as pd
 import PyPDF2
 from io import StringIO, BytesIO
+from itertools import islice
 from pathlib import Path
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .models import Import, ImportRecord, TaxGrade, AuditLog, DividendMaintainer
+from .models import Import, ImportRecord, TaxGrade, AuditLog, DividendMaintainer, audit_keys
+from .search import index_search_documents
+from .rut import validate_ruts
+from .cache import bump_cache_generations
+from .factors import sync_dividend_factors
+from .summaries import (
+    DIVIDEND_ROLLUPS, SummaryDelta, dividend_snapshot, load_summary_snapshots, summary_snapshot,
+)
+from .changes import record_change
+from .rollback import import_change, load_tax_grade_states, rollback_state
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_IMPORT_CHUNK_SIZE = 500
+
+
+def import_chunk_size():
+    return getattr(settings, 'IMPORT_CHUNK_SIZE', DEFAULT_IMPORT_CHUNK_SIZE)
+
+
+def iter_chunks(rows, size):
+    """
+    Filas de un archivo en bloques de `size`. Los importadores escriben cada
+    bloque en una transacción (como miapp.bulk) y cada fila en un SAVEPOINT:
+    el registro, su evento en change_events, la auditoría y el ImportRecord
+    quedan juntos o no quedan.
+    """
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
 
 def calculate_file_hash(file_content):
     """Calcula el hash SHA-256 de un archivo"""
@@ -38,11 +67,39 @@ def get_file_type(file_name):
     return type_mapping.get(ext, 'unknown')
 
 
+def reject_invalid_ruts(ruts, import_obj, errors, first_row=1):
+    """
+    Valida el dígito verificador de una columna de RUT de una vez y registra
+    en bloque las filas rechazadas (ImportRecord con bulk_create). `first_row`
+    es el número de fila del primer RUT (para validar un archivo por bloques).
+    Retorna (normalizados, válidos) como listas alineadas con las filas.
+    """
+    ruts = list(ruts)
+    normalized, valid = validate_ruts(ruts)
+    rejected = []
+    for position in (~valid).to_numpy().nonzero()[0]:
+        raw = ruts[position]
+        raw = '' if raw is None or (isinstance(raw, float) and pd.isna(raw)) else str(raw).strip()
+        error_msg = f"RUT inválido: {raw}" if raw else "RUT es requerido"
+        errors.append(f"Fila {first_row + position}: {error_msg}")
+        rejected.append(ImportRecord(
+            import_id=import_obj,
+            row_number_or_page=first_row + position,
+            rut=raw[:20],
+            year=None,
+            status='error',
+            error_message=error_msg,
+        ))
+    ImportRecord.objects.bulk_create(rejected, batch_size=1000)
+    return normalized.tolist(), valid.tolist()
+
+
 def process_csv_file(file_content, import_obj, user):
     """Procesa un archivo CSV y crea registros"""
     errors = []
     success_count = 0
     row_number = 0
+    touched_years = set()
     
     try:
         # Leer CSV con manejo de encoding
@@ -73,110 +130,140 @@ def process_csv_file(file_content, import_obj, user):
             else:
                 file_content.seek(0)
         
-        csv_reader = csv.DictReader(file_content)
-        
-        for row in csv_reader:
-            row_number += 1
-            try:
-                # Validar campos requeridos
-                rut = row.get('rut', '').strip()
-                name = row.get('name', '').strip()
-                year = row.get('year', '').strip()
-                
-                if not rut:
-                    raise ValueError("RUT es requerido")
-                if not name:
-                    raise ValueError("Nombre es requerido")
-                if not year:
-                    raise ValueError("Año es requerido")
-                
-                try:
-                    year = int(year)
-                except ValueError:
-                    raise ValueError(f"Año inválido: {year}")
-                
-                # Obtener otros campos opcionales
-                source_type = row.get('source_type', 'manual').strip()
-                if source_type not in ['declaracion', 'certificado', 'manual', 'calculo']:
-                    source_type = 'manual'
-                
-                amount = row.get('amount', '0').strip()
-                try:
-                    amount = float(amount) if amount else 0.0
-                except ValueError:
-                    amount = 0.0
-                
-                factor = row.get('factor', '').strip()
-                try:
-                    factor = float(factor) if factor else None
-                except ValueError:
-                    factor = None
-                
-                calculation_basis = row.get('calculation_basis', '').strip()
-                status = row.get('status', 'activo').strip()
-                if status not in ['activo', 'inactivo']:
-                    status = 'activo'
-                
-                # Crear o actualizar TaxGrade
-                tax_grade, created = TaxGrade.objects.update_or_create(
-                    rut=rut,
-                    year=year,
-                    defaults={
-                        'name': name,
-                        'source_type': source_type,
-                        'fuente_ingreso': 'archivo',  # Marcar como proveniente de archivo
-                        'amount': amount,
-                        'factor': factor,
-                        'calculation_basis': calculation_basis,
-                        'status': status,
-                        'updated_by': user,
-                    }
-                )
-                
-                if not created:
-                    tax_grade.created_by = tax_grade.created_by or user
-                    tax_grade.save()
-                else:
-                    tax_grade.created_by = user
-                    tax_grade.save()
-                
-                # Registrar auditoría
-                AuditLog.objects.create(
-                    user_id=user,
-                    entity='tax_grades',
-                    entity_id=str(tax_grade.id),
-                    action='import',
-                    after={
-                        'rut': rut,
-                        'name': name,
-                        'year': year,
-                        'source_type': source_type,
-                    },
-                    timestamp=timezone.now()
-                )
-                
-                # Crear ImportRecord
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=rut,
-                    year=year,
-                    status='success',
-                )
-                success_count += 1
-                
-            except Exception as e:
-                error_msg = str(e)
-                errors.append(f"Fila {row_number}: {error_msg}")
-                
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=row.get('rut', '')[:20],
-                    year=None,
-                    status='error',
-                    error_message=error_msg[:500],
-                )
+        # El archivo se lee por bloques: los RUT, las fotos de totales y los
+        # estados de reversión se cargan solo para las filas del bloque
+        for chunk in iter_chunks(csv.DictReader(file_content), import_chunk_size()):
+            ruts_normalizados, ruts_validos = reject_invalid_ruts(
+                ((row.get('rut') or '') for row in chunk), import_obj, errors, first_row=row_number + 1
+            )
+            summary_snapshots = load_summary_snapshots(
+                rut for rut, valido in zip(ruts_normalizados, ruts_validos) if valido
+            )
+            rollback_states = load_tax_grade_states(
+                rut for rut, valido in zip(ruts_normalizados, ruts_validos) if valido
+            )
+            chunk_success = 0
+            summary_delta = SummaryDelta()
+            with transaction.atomic():
+                for row, rut_normalizado, rut_valido in zip(chunk, ruts_normalizados, ruts_validos):
+                    row_number += 1
+                    if not rut_valido:
+                        continue
+                    try:
+                        # Validar campos requeridos
+                        rut = row.get('rut', '').strip()
+                        name = row.get('name', '').strip()
+                        year = row.get('year', '').strip()
+                        
+                        if not rut:
+                            raise ValueError("RUT es requerido")
+                        if not name:
+                            raise ValueError("Nombre es requerido")
+                        if not year:
+                            raise ValueError("Año es requerido")
+                        
+                        try:
+                            year = int(year)
+                        except ValueError:
+                            raise ValueError(f"Año inválido: {year}")
+                        
+                        # Obtener otros campos opcionales
+                        source_type = row.get('source_type', 'manual').strip()
+                        if source_type not in ['declaracion', 'certificado', 'manual', 'calculo']:
+                            source_type = 'manual'
+                        
+                        amount = row.get('amount', '0').strip()
+                        try:
+                            amount = float(amount) if amount else 0.0
+                        except ValueError:
+                            amount = 0.0
+                        
+                        factor = row.get('factor', '').strip()
+                        try:
+                            factor = float(factor) if factor else None
+                        except ValueError:
+                            factor = None
+                        
+                        calculation_basis = row.get('calculation_basis', '').strip()
+                        status = row.get('status', 'activo').strip()
+                        if status not in ['activo', 'inactivo']:
+                            status = 'activo'
+                        
+                        # Crear o actualizar TaxGrade (una sola escritura; created_by solo al crear)
+                        defaults = {
+                            'rut': rut,
+                            'name': name,
+                            'source_type': source_type,
+                            'fuente_ingreso': 'archivo',  # Marcar como proveniente de archivo
+                            'amount': amount,
+                            'factor': factor,
+                            'calculation_basis': calculation_basis,
+                            'status': status,
+                            'updated_by': user,
+                        }
+                        # La fila se escribe completa o nada (SAVEPOINT dentro de la transacción del bloque)
+                        with transaction.atomic():
+                            tax_grade, created = TaxGrade.objects.update_or_create(
+                                rut_normalizado=rut_normalizado,
+                                year=year,
+                                defaults=defaults,
+                                create_defaults={**defaults, 'created_by': user},
+                            )
+                            index_search_documents([tax_grade])
+                            
+                            # Estado previo para poder revertir la importación
+                            summary_key = (tax_grade.rut_normalizado, tax_grade.year)
+                            change = import_change(tax_grade, rollback_states.get(summary_key), created)
+                            record_change(tax_grade, 'create' if created else 'update')
+                            
+                            # Registrar auditoría
+                            AuditLog.objects.create(
+                                user_id=user,
+                                entity='tax_grades',
+                                entity_id=str(tax_grade.id),
+                                action='import',
+                                after={
+                                    'rut': rut,
+                                    'name': name,
+                                    'year': year,
+                                    'source_type': source_type,
+                                },
+                                timestamp=timezone.now()
+                            )
+                            
+                            # Crear ImportRecord
+                            ImportRecord.objects.create(
+                                import_id=import_obj,
+                                row_number_or_page=row_number,
+                                rut=rut,
+                                year=year,
+                                status='success',
+                                **change,
+                            )
+                        
+                        # Fila escrita: delta de la tabla de totales y estados para las filas siguientes
+                        touched_years.add(year)
+                        after_snapshot = summary_snapshot(tax_grade)
+                        summary_delta.change(summary_snapshots.get(summary_key), after_snapshot)
+                        summary_snapshots[summary_key] = after_snapshot
+                        rollback_states[summary_key] = rollback_state(tax_grade)
+                        chunk_success += 1
+                        
+                    except Exception as e:
+                        error_msg = str(e)
+                        errors.append(f"Fila {row_number}: {error_msg}")
+                        
+                        ImportRecord.objects.create(
+                            import_id=import_obj,
+                            row_number_or_page=row_number,
+                            rut=row.get('rut', '')[:20],
+                            year=None,
+                            status='error',
+                            error_message=error_msg[:500],
+                        )
+                # Totales del bloque, en la misma transacción que sus filas
+                summary_delta.apply()
+            success_count += chunk_success
         
         return success_count, errors
         
@@ -184,6 +271,9 @@ def process_csv_file(file_content, import_obj, user):
         logger.error(f"Error procesando CSV: {str(e)}")
         errors.append(f"Error general al procesar CSV: {str(e)}")
         return success_count, errors
+    finally:
+        # Invalidar la caché de respuestas de los años tocados
+        bump_cache_generations('tax_grades', touched_years)
 
 
 def process_zip_file(file_content, import_obj, user):
@@ -259,6 +349,7 @@ def process_excel_file(file_content, import_obj, user):
     errors = []
     success_count = 0
     row_number = 0
+    touched_years = set()
     
     try:
         # Leer Excel con pandas
@@ -274,104 +365,133 @@ def process_excel_file(file_content, import_obj, user):
             errors.append(f"Columnas faltantes: {', '.join(missing_columns)}")
             return success_count, errors
         
-        for _, row in df.iterrows():
-            row_number += 1
-            try:
-                rut = str(row.get('rut', '')).strip()
-                name = str(row.get('name', '')).strip()
-                year = row.get('year', None)
-                
-                if pd.isna(rut) or not rut:
-                    raise ValueError("RUT es requerido")
-                if pd.isna(name) or not name:
-                    raise ValueError("Nombre es requerido")
-                if pd.isna(year):
-                    raise ValueError("Año es requerido")
-                
-                year = int(year)
-                
-                source_type = str(row.get('source_type', 'manual')).strip()
-                if source_type not in ['declaracion', 'certificado', 'manual', 'calculo']:
-                    source_type = 'manual'
-                
-                amount = row.get('amount', 0)
-                if pd.isna(amount):
-                    amount = 0.0
-                amount = float(amount)
-                
-                factor = row.get('factor', None)
-                if pd.notna(factor):
+        ruts_normalizados, ruts_validos = reject_invalid_ruts(df['rut'], import_obj, errors)
+        summary_snapshots = load_summary_snapshots(
+            rut for rut, valido in zip(ruts_normalizados, ruts_validos) if valido
+        )
+        rollback_states = load_tax_grade_states(
+            rut for rut, valido in zip(ruts_normalizados, ruts_validos) if valido
+        )
+        
+        for chunk in iter_chunks(df.iterrows(), import_chunk_size()):
+            chunk_success = 0
+            summary_delta = SummaryDelta()
+            with transaction.atomic():
+                for _, row in chunk:
+                    row_number += 1
+                    if not ruts_validos[row_number - 1]:
+                        continue
                     try:
-                        factor = float(factor)
-                    except (ValueError, TypeError):
-                        factor = None
-                else:
-                    factor = None
-                
-                calculation_basis = str(row.get('calculation_basis', '')).strip()
-                status = str(row.get('status', 'activo')).strip()
-                if status not in ['activo', 'inactivo']:
-                    status = 'activo'
-                
-                # Crear o actualizar TaxGrade
-                tax_grade, created = TaxGrade.objects.update_or_create(
-                    rut=rut,
-                    year=year,
-                    defaults={
-                        'name': name,
-                        'source_type': source_type,
-                        'fuente_ingreso': 'archivo',  # Marcar como proveniente de archivo
-                        'amount': amount,
-                        'factor': factor,
-                        'calculation_basis': calculation_basis,
-                        'status': status,
-                        'updated_by': user,
-                    }
-                )
-                
-                if not created:
-                    tax_grade.created_by = tax_grade.created_by or user
-                    tax_grade.save()
-                else:
-                    tax_grade.created_by = user
-                    tax_grade.save()
-                
-                # Registrar auditoría
-                AuditLog.objects.create(
-                    user_id=user,
-                    entity='tax_grades',
-                    entity_id=str(tax_grade.id),
-                    action='import',
-                    after={
-                        'rut': rut,
-                        'name': name,
-                        'year': year,
-                        'source_type': source_type,
-                    },
-                    timestamp=timezone.now()
-                )
-                
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=rut,
-                    year=year,
-                    status='success',
-                )
-                success_count += 1
-                
-            except Exception as e:
-                error_msg = str(e)
-                errors.append(f"Fila {row_number}: {error_msg}")
-                
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=str(row.get('rut', ''))[:20],
-                    year=None,
-                    status='error',
-                    error_message=error_msg[:500],
-                )
+                        rut = str(row.get('rut', '')).strip()
+                        name = str(row.get('name', '')).strip()
+                        year = row.get('year', None)
+                        
+                        if pd.isna(rut) or not rut:
+                            raise ValueError("RUT es requerido")
+                        if pd.isna(name) or not name:
+                            raise ValueError("Nombre es requerido")
+                        if pd.isna(year):
+                            raise ValueError("Año es requerido")
+                        
+                        year = int(year)
+                        
+                        source_type = str(row.get('source_type', 'manual')).strip()
+                        if source_type not in ['declaracion', 'certificado', 'manual', 'calculo']:
+                            source_type = 'manual'
+                        
+                        amount = row.get('amount', 0)
+                        if pd.isna(amount):
+                            amount = 0.0
+                        amount = float(amount)
+                        
+                        factor = row.get('factor', None)
+                        if pd.notna(factor):
+                            try:
+                                factor = float(factor)
+                            except (ValueError, TypeError):
+                                factor = None
+                        else:
+                            factor = None
+                        
+                        calculation_basis = str(row.get('calculation_basis', '')).strip()
+                        status = str(row.get('status', 'activo')).strip()
+                        if status not in ['activo', 'inactivo']:
+                            status = 'activo'
+                        
+                        # Crear o actualizar TaxGrade (una sola escritura; created_by solo al crear)
+                        defaults = {
+                            'rut': rut,
+                            'name': name,
+                            'source_type': source_type,
+                            'fuente_ingreso': 'archivo',  # Marcar como proveniente de archivo
+                            'amount': amount,
+                            'factor': factor,
+                            'calculation_basis': calculation_basis,
+                            'status': status,
+                            'updated_by': user,
+                        }
+                        # La fila se escribe completa o nada (SAVEPOINT dentro de la transacción del bloque)
+                        with transaction.atomic():
+                            tax_grade, created = TaxGrade.objects.update_or_create(
+                                rut_normalizado=ruts_normalizados[row_number - 1],
+                                year=year,
+                                defaults=defaults,
+                                create_defaults={**defaults, 'created_by': user},
+                            )
+                            index_search_documents([tax_grade])
+                            
+                            # Estado previo para poder revertir la importación
+                            summary_key = (tax_grade.rut_normalizado, tax_grade.year)
+                            change = import_change(tax_grade, rollback_states.get(summary_key), created)
+                            record_change(tax_grade, 'create' if created else 'update')
+                            
+                            # Registrar auditoría
+                            AuditLog.objects.create(
+                                user_id=user,
+                                entity='tax_grades',
+                                entity_id=str(tax_grade.id),
+                                action='import',
+                                after={
+                                    'rut': rut,
+                                    'name': name,
+                                    'year': year,
+                                    'source_type': source_type,
+                                },
+                                timestamp=timezone.now()
+                            )
+                            
+                            ImportRecord.objects.create(
+                                import_id=import_obj,
+                                row_number_or_page=row_number,
+                                rut=rut,
+                                year=year,
+                                status='success',
+                                **change,
+                            )
+                        
+                        # Fila escrita: delta de la tabla de totales y estados para las filas siguientes
+                        touched_years.add(year)
+                        after_snapshot = summary_snapshot(tax_grade)
+                        summary_delta.change(summary_snapshots.get(summary_key), after_snapshot)
+                        summary_snapshots[summary_key] = after_snapshot
+                        rollback_states[summary_key] = rollback_state(tax_grade)
+                        chunk_success += 1
+                        
+                    except Exception as e:
+                        error_msg = str(e)
+                        errors.append(f"Fila {row_number}: {error_msg}")
+                        
+                        ImportRecord.objects.create(
+                            import_id=import_obj,
+                            row_number_or_page=row_number,
+                            rut=str(row.get('rut', ''))[:20],
+                            year=None,
+                            status='error',
+                            error_message=error_msg[:500],
+                        )
+                # Totales del bloque, en la misma transacción que sus filas
+                summary_delta.apply()
+            success_count += chunk_success
         
         return success_count, errors
         
@@ -379,6 +499,9 @@ def process_excel_file(file_content, import_obj, user):
         logger.error(f"Error procesando Excel: {str(e)}")
         errors.append(f"Error general al procesar Excel: {str(e)}")
         return success_count, errors
+    finally:
+        # Invalidar la caché de respuestas de los años tocados
+        bump_cache_generations('tax_grades', touched_years)
 
 
 def generate_import_report(import_obj, errors):
@@ -451,6 +574,7 @@ def process_dividend_csv(file_content, import_obj, user):
     update_count = 0
     create_count = 0
     row_number = 0
+    touched_years = set()
     
     try:
         # Leer CSV con manejo de encoding
@@ -480,226 +604,250 @@ def process_dividend_csv(file_content, import_obj, user):
         csv_reader = csv.DictReader(file_content)
         headers = [h.lower().strip() for h in csv_reader.fieldnames or []]
         
-        for row in csv_reader:
-            row_number += 1
-            try:
-                # Validar campos requeridos
-                periodo_comercial = row.get('periodo_comercial', '').strip()
-                tipo_mercado = row.get('tipo_mercado', '').strip()
-                instrumento = row.get('instrumento', '').strip()
-                fecha_pago = row.get('fecha_pago_dividendo', '').strip()
-                secuencia = row.get('secuencia_evento_capital', '').strip()
-                
-                if not periodo_comercial:
-                    raise ValueError("periodo_comercial es requerido")
-                if not tipo_mercado:
-                    raise ValueError("tipo_mercado es requerido")
-                if not instrumento:
-                    raise ValueError("instrumento es requerido")
-                if not fecha_pago:
-                    raise ValueError("fecha_pago_dividendo es requerido")
-                
-                try:
-                    periodo_comercial = int(periodo_comercial)
-                except ValueError:
-                    raise ValueError(f"periodo_comercial inválido: {periodo_comercial}")
-                
-                if tipo_mercado not in ['acciones', 'cfi', 'fondos_mutuos']:
-                    raise ValueError(f"tipo_mercado inválido: {tipo_mercado}")
-                
-                # Parsear fecha
-                from datetime import datetime
-                try:
-                    fecha_pago_date = datetime.strptime(fecha_pago, '%Y-%m-%d').date()
-                except ValueError:
-                    raise ValueError(f"fecha_pago_dividendo inválida (formato: YYYY-MM-DD): {fecha_pago}")
-                
-                # Secuencia opcional pero si está presente debe ser > 10000
-                secuencia_int = None
-                if secuencia:
+        for chunk in iter_chunks(csv_reader, import_chunk_size()):
+            chunk_success = 0
+            rollup_delta = SummaryDelta(DIVIDEND_ROLLUPS)
+            with transaction.atomic():
+                for row in chunk:
+                    row_number += 1
                     try:
-                        secuencia_int = int(secuencia)
-                        if secuencia_int <= 10000:
-                            raise ValueError("secuencia_evento_capital debe ser superior a 10000")
-                    except ValueError as e:
-                        raise ValueError(f"secuencia_evento_capital inválida: {str(e)}")
-                
-                # Obtener campos opcionales
-                descripcion = row.get('descripcion_dividendo', '').strip()
-                origen_informacion = row.get('origen_informacion', 'sistema').strip()
-                if origen_informacion not in ['corredora', 'sistema']:
-                    origen_informacion = 'sistema'
-                
-                dividendo = row.get('dividendo', '0').strip()
-                try:
-                    dividendo = float(dividendo) if dividendo else 0.0
-                except ValueError:
-                    dividendo = 0.0
-                
-                factor_actualizacion = row.get('factor_actualizacion', '').strip()
-                try:
-                    factor_actualizacion = float(factor_actualizacion) if factor_actualizacion else None
-                except ValueError:
-                    factor_actualizacion = None
-                
-                valor_historico = row.get('valor_historico', '').strip()
-                try:
-                    valor_historico = float(valor_historico) if valor_historico else None
-                except ValueError:
-                    valor_historico = None
-                
-                acogido_isfut = row.get('acogido_isfut_isift', 'ninguno').strip()
-                if acogido_isfut not in ['isfut', 'isift', 'ninguno']:
-                    acogido_isfut = 'ninguno'
-                
-                # Recopilar factores (factor_1 a factor_31)
-                factores = {}
-                for i in range(1, 32):
-                    factor_key = f'factor_{i}'
-                    factor_value = row.get(factor_key, '').strip()
-                    if factor_value:
+                        # Validar campos requeridos
+                        periodo_comercial = row.get('periodo_comercial', '').strip()
+                        tipo_mercado = row.get('tipo_mercado', '').strip()
+                        instrumento = row.get('instrumento', '').strip()
+                        fecha_pago = row.get('fecha_pago_dividendo', '').strip()
+                        secuencia = row.get('secuencia_evento_capital', '').strip()
+                        
+                        if not periodo_comercial:
+                            raise ValueError("periodo_comercial es requerido")
+                        if not tipo_mercado:
+                            raise ValueError("tipo_mercado es requerido")
+                        if not instrumento:
+                            raise ValueError("instrumento es requerido")
+                        if not fecha_pago:
+                            raise ValueError("fecha_pago_dividendo es requerido")
+                        
                         try:
-                            factor_val = float(factor_value)
-                            factores[factor_key] = {
-                                'nombre': f'Factor-{i+7}' if i <= 31 else f'Factor {i}',
-                                'valor': factor_val
-                            }
+                            periodo_comercial = int(periodo_comercial)
                         except ValueError:
-                            pass  # Ignorar factores inválidos
-                
-                # LLAVE ÚNICA: periodo_comercial + instrumento + fecha_pago_dividendo + secuencia_evento_capital
-                # Buscar registro existente
-                lookup_kwargs = {
-                    'periodo_comercial': periodo_comercial,
-                    'instrumento': instrumento,
-                    'fecha_pago_dividendo': fecha_pago_date,
-                }
-                
-                if secuencia_int:
-                    lookup_kwargs['secuencia_evento_capital'] = secuencia_int
-                
-                # Obtener registro existente si existe
-                existing = DividendMaintainer.objects.filter(**lookup_kwargs).first()
-                
-                # Preparar datos para actualización/creación
-                defaults = {
-                    'tipo_mercado': tipo_mercado,
-                    'origen_informacion': origen_informacion,
-                    'origen': origen_informacion,
-                    'descripcion_dividendo': descripcion,
-                    'acogido_isfut_isift': acogido_isfut,
-                    'dividendo': dividendo,
-                    'factor_actualizacion': factor_actualizacion,
-                    'valor_historico': valor_historico,
-                    'factores_8_37': factores,
-                    'updated_by': user,
-                }
-                
-                if existing:
-                    # ACTUALIZAR registro existente
-                    before_data = {
-                        'factores_8_37': existing.factores_8_37,
-                        'dividendo': str(existing.dividendo),
-                        'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
-                        'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
-                    }
-                    
-                    # Actualizar campos
-                    for key, value in defaults.items():
-                        setattr(existing, key, value)
-                    existing.save()
-                    
-                    after_data = {
-                        'factores_8_37': existing.factores_8_37,
-                        'dividendo': str(existing.dividendo),
-                        'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
-                        'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
-                    }
-                    
-                    # Registrar auditoría de actualización
-                    AuditLog.objects.create(
-                        user_id=user,
-                        entity='dividend_maintainers',
-                        entity_id=str(existing.id),
-                        action='update',
-                        before=before_data,
-                        after=after_data,
-                        ip_address=None,
-                        user_agent='Bulk Import',
-                        timestamp=timezone.now()
-                    )
-                    
-                    update_count += 1
-                    action_type = 'actualizado'
-                    
-                else:
-                    # CREAR nuevo registro
-                    dividend = DividendMaintainer.objects.create(
-                        periodo_comercial=periodo_comercial,
-                        tipo_mercado=tipo_mercado,
-                        origen_informacion=origen_informacion,
-                        origen=origen_informacion,
-                        instrumento=instrumento,
-                        fecha_pago_dividendo=fecha_pago_date,
-                        secuencia_evento_capital=secuencia_int,
-                        descripcion_dividendo=descripcion,
-                        acogido_isfut_isift=acogido_isfut,
-                        dividendo=dividendo,
-                        factor_actualizacion=factor_actualizacion,
-                        valor_historico=valor_historico,
-                        factores_8_37=factores,
-                        created_by=user,
-                        updated_by=user,
-                    )
-                    
-                    after_data = {
-                        'periodo_comercial': periodo_comercial,
-                        'instrumento': instrumento,
-                        'fecha_pago_dividendo': str(fecha_pago_date),
-                        'factores_8_37': factores,
-                        'created_at': dividend.created_at.isoformat() if dividend.created_at else None,
-                    }
-                    
-                    # Registrar auditoría de creación
-                    AuditLog.objects.create(
-                        user_id=user,
-                        entity='dividend_maintainers',
-                        entity_id=str(dividend.id),
-                        action='create',
-                        before=None,
-                        after=after_data,
-                        ip_address=None,
-                        user_agent='Bulk Import',
-                        timestamp=timezone.now()
-                    )
-                    
-                    create_count += 1
-                    action_type = 'creado'
-                    existing = dividend
-                
-                # Crear ImportRecord
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=instrumento[:20],  # Usar instrumento como identificador
-                    year=periodo_comercial,
-                    status='success',
-                    error_message=f"Registro {action_type} exitosamente"
-                )
-                success_count += 1
-                
-            except Exception as e:
-                error_msg = str(e)
-                errors.append(f"Fila {row_number}: {error_msg}")
-                
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=row.get('instrumento', '')[:20] if 'instrumento' in row else '',
-                    year=None,
-                    status='error',
-                    error_message=error_msg[:500],
-                )
+                            raise ValueError(f"periodo_comercial inválido: {periodo_comercial}")
+                        
+                        if tipo_mercado not in ['acciones', 'cfi', 'fondos_mutuos']:
+                            raise ValueError(f"tipo_mercado inválido: {tipo_mercado}")
+                        
+                        # Parsear fecha
+                        from datetime import datetime
+                        try:
+                            fecha_pago_date = datetime.strptime(fecha_pago, '%Y-%m-%d').date()
+                        except ValueError:
+                            raise ValueError(f"fecha_pago_dividendo inválida (formato: YYYY-MM-DD): {fecha_pago}")
+                        
+                        # Secuencia opcional pero si está presente debe ser > 10000
+                        secuencia_int = None
+                        if secuencia:
+                            try:
+                                secuencia_int = int(secuencia)
+                                if secuencia_int <= 10000:
+                                    raise ValueError("secuencia_evento_capital debe ser superior a 10000")
+                            except ValueError as e:
+                                raise ValueError(f"secuencia_evento_capital inválida: {str(e)}")
+                        
+                        # Obtener campos opcionales
+                        descripcion = row.get('descripcion_dividendo', '').strip()
+                        origen_informacion = row.get('origen_informacion', 'sistema').strip()
+                        if origen_informacion not in ['corredora', 'sistema']:
+                            origen_informacion = 'sistema'
+                        
+                        dividendo = row.get('dividendo', '0').strip()
+                        try:
+                            dividendo = float(dividendo) if dividendo else 0.0
+                        except ValueError:
+                            dividendo = 0.0
+                        
+                        factor_actualizacion = row.get('factor_actualizacion', '').strip()
+                        try:
+                            factor_actualizacion = float(factor_actualizacion) if factor_actualizacion else None
+                        except ValueError:
+                            factor_actualizacion = None
+                        
+                        valor_historico = row.get('valor_historico', '').strip()
+                        try:
+                            valor_historico = float(valor_historico) if valor_historico else None
+                        except ValueError:
+                            valor_historico = None
+                        
+                        acogido_isfut = row.get('acogido_isfut_isift', 'ninguno').strip()
+                        if acogido_isfut not in ['isfut', 'isift', 'ninguno']:
+                            acogido_isfut = 'ninguno'
+                        
+                        # Recopilar factores (factor_1 a factor_31)
+                        factores = {}
+                        for i in range(1, 32):
+                            factor_key = f'factor_{i}'
+                            factor_value = row.get(factor_key, '').strip()
+                            if factor_value:
+                                try:
+                                    factor_val = float(factor_value)
+                                    factores[factor_key] = {
+                                        'nombre': f'Factor-{i+7}' if i <= 31 else f'Factor {i}',
+                                        'valor': factor_val
+                                    }
+                                except ValueError:
+                                    pass  # Ignorar factores inválidos
+                        
+                        # LLAVE ÚNICA: periodo_comercial + instrumento + fecha_pago_dividendo + secuencia_evento_capital
+                        # Buscar registro existente
+                        lookup_kwargs = {
+                            'periodo_comercial': periodo_comercial,
+                            'instrumento': instrumento,
+                            'fecha_pago_dividendo': fecha_pago_date,
+                        }
+                        
+                        if secuencia_int:
+                            lookup_kwargs['secuencia_evento_capital'] = secuencia_int
+                        
+                        # Obtener registro existente si existe
+                        existing = DividendMaintainer.objects.filter(**lookup_kwargs).first()
+                        before_snapshot = dividend_snapshot(existing) if existing else None
+                        before_state = rollback_state(existing) if existing else None
+                        
+                        # Preparar datos para actualización/creación
+                        defaults = {
+                            'tipo_mercado': tipo_mercado,
+                            'origen_informacion': origen_informacion,
+                            'origen': origen_informacion,
+                            'descripcion_dividendo': descripcion,
+                            'acogido_isfut_isift': acogido_isfut,
+                            'dividendo': dividendo,
+                            'factor_actualizacion': factor_actualizacion,
+                            'valor_historico': valor_historico,
+                            'factores_8_37': factores,
+                            'updated_by': user,
+                        }
+                        
+                        # La fila se escribe completa o nada (SAVEPOINT dentro de la transacción del bloque)
+                        with transaction.atomic():
+                            if existing:
+                                # ACTUALIZAR registro existente
+                                before_data = {
+                                    'factores_8_37': existing.factores_8_37,
+                                    'dividendo': str(existing.dividendo),
+                                    'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
+                                    'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
+                                }
+                                
+                                # Actualizar campos
+                                for key, value in defaults.items():
+                                    setattr(existing, key, value)
+                                existing.save()
+                                
+                                after_data = {
+                                    'factores_8_37': existing.factores_8_37,
+                                    'dividendo': str(existing.dividendo),
+                                    'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
+                                    'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
+                                }
+                                record_change(existing, 'update')
+                                
+                                # Registrar auditoría de actualización
+                                AuditLog.objects.create(
+                                    user_id=user,
+                                    entity='dividend_maintainers',
+                                    entity_id=str(existing.id),
+                                    action='update',
+                                    before=before_data,
+                                    after=after_data,
+                                    ip_address=None,
+                                    **audit_keys(existing),
+                                    user_agent='Bulk Import',
+                                    timestamp=timezone.now()
+                                )
+                                
+                                action_type = 'actualizado'
+                                
+                            else:
+                                # CREAR nuevo registro
+                                dividend = DividendMaintainer.objects.create(
+                                    periodo_comercial=periodo_comercial,
+                                    tipo_mercado=tipo_mercado,
+                                    origen_informacion=origen_informacion,
+                                    origen=origen_informacion,
+                                    instrumento=instrumento,
+                                    fecha_pago_dividendo=fecha_pago_date,
+                                    secuencia_evento_capital=secuencia_int,
+                                    descripcion_dividendo=descripcion,
+                                    acogido_isfut_isift=acogido_isfut,
+                                    dividendo=dividendo,
+                                    factor_actualizacion=factor_actualizacion,
+                                    valor_historico=valor_historico,
+                                    factores_8_37=factores,
+                                    created_by=user,
+                                    updated_by=user,
+                                )
+                                
+                                after_data = {
+                                    'periodo_comercial': periodo_comercial,
+                                    'instrumento': instrumento,
+                                    'fecha_pago_dividendo': str(fecha_pago_date),
+                                    'factores_8_37': factores,
+                                    'created_at': dividend.created_at.isoformat() if dividend.created_at else None,
+                                }
+                                record_change(dividend, 'create')
+                                
+                                # Registrar auditoría de creación
+                                AuditLog.objects.create(
+                                    user_id=user,
+                                    entity='dividend_maintainers',
+                                    entity_id=str(dividend.id),
+                                    action='create',
+                                    before=None,
+                                    after=after_data,
+                                    ip_address=None,
+                                    user_agent='Bulk Import',
+                                    timestamp=timezone.now()
+                                )
+                                
+                                action_type = 'creado'
+                                existing = dividend
+                            
+                            index_search_documents([existing])
+                            sync_dividend_factors([existing])
+                            
+                            # Crear ImportRecord
+                            ImportRecord.objects.create(
+                                import_id=import_obj,
+                                row_number_or_page=row_number,
+                                rut=instrumento[:20],  # Usar instrumento como identificador
+                                year=periodo_comercial,
+                                status='success',
+                                error_message=f"Registro {action_type} exitosamente",
+                                **import_change(existing, before_state, action_type == 'creado'),
+                            )
+                        
+                        # Fila escrita: delta de los rollups y contadores
+                        touched_years.add(existing.periodo_comercial)
+                        rollup_delta.change(before_snapshot, dividend_snapshot(existing))
+                        if action_type == 'creado':
+                            create_count += 1
+                        else:
+                            update_count += 1
+                        chunk_success += 1
+                        
+                    except Exception as e:
+                        error_msg = str(e)
+                        errors.append(f"Fila {row_number}: {error_msg}")
+                        
+                        ImportRecord.objects.create(
+                            import_id=import_obj,
+                            row_number_or_page=row_number,
+                            rut=row.get('instrumento', '')[:20] if 'instrumento' in row else '',
+                            year=None,
+                            status='error',
+                            error_message=error_msg[:500],
+                        )
+                # Totales del bloque, en la misma transacción que sus filas
+                rollup_delta.apply()
+            success_count += chunk_success
         
         # Agregar resumen al final
         if success_count > 0:
@@ -711,6 +859,9 @@ def process_dividend_csv(file_content, import_obj, user):
         logger.error(f"Error procesando CSV de dividendos: {str(e)}")
         errors.append(f"Error general al procesar CSV: {str(e)}")
         return success_count, errors
+    finally:
+        # Invalidar la caché de respuestas de los años tocados
+        bump_cache_generations('dividend_maintainers', touched_years)
 
 
 def process_dividend_excel(file_content, import_obj, user):
@@ -720,6 +871,7 @@ def process_dividend_excel(file_content, import_obj, user):
     update_count = 0
     create_count = 0
     row_number = 0
+    touched_years = set()
     
     try:
         # Leer Excel con pandas
@@ -735,222 +887,246 @@ def process_dividend_excel(file_content, import_obj, user):
             errors.append(f"Columnas faltantes: {', '.join(missing_columns)}")
             return success_count, errors
         
-        for _, row in df.iterrows():
-            row_number += 1
-            try:
-                # Similar a process_dividend_csv pero usando pandas
-                periodo_comercial = row.get('periodo_comercial', None)
-                tipo_mercado = str(row.get('tipo_mercado', '')).strip()
-                instrumento = str(row.get('instrumento', '')).strip()
-                fecha_pago = row.get('fecha_pago_dividendo', None)
-                secuencia = row.get('secuencia_evento_capital', None)
-                
-                if pd.isna(periodo_comercial):
-                    raise ValueError("periodo_comercial es requerido")
-                if not tipo_mercado or pd.isna(tipo_mercado):
-                    raise ValueError("tipo_mercado es requerido")
-                if not instrumento or pd.isna(instrumento):
-                    raise ValueError("instrumento es requerido")
-                if pd.isna(fecha_pago):
-                    raise ValueError("fecha_pago_dividendo es requerido")
-                
-                periodo_comercial = int(periodo_comercial)
-                
-                if tipo_mercado not in ['acciones', 'cfi', 'fondos_mutuos']:
-                    raise ValueError(f"tipo_mercado inválido: {tipo_mercado}")
-                
-                # Parsear fecha
-                from datetime import datetime
-                if isinstance(fecha_pago, str):
-                    fecha_pago_date = datetime.strptime(fecha_pago, '%Y-%m-%d').date()
-                elif hasattr(fecha_pago, 'date'):
-                    fecha_pago_date = fecha_pago.date()
-                else:
-                    raise ValueError(f"fecha_pago_dividendo inválida: {fecha_pago}")
-                
-                secuencia_int = None
-                if not pd.isna(secuencia):
-                    try:
-                        secuencia_int = int(secuencia)
-                        if secuencia_int <= 10000:
-                            raise ValueError("secuencia_evento_capital debe ser superior a 10000")
-                    except (ValueError, TypeError) as e:
-                        raise ValueError(f"secuencia_evento_capital inválida: {str(e)}")
-                
-                # Obtener campos opcionales
-                descripcion = str(row.get('descripcion_dividendo', '')).strip() if not pd.isna(row.get('descripcion_dividendo')) else ''
-                origen_informacion = str(row.get('origen_informacion', 'sistema')).strip()
-                if origen_informacion not in ['corredora', 'sistema']:
-                    origen_informacion = 'sistema'
-                
-                dividendo = row.get('dividendo', 0)
-                if pd.isna(dividendo):
-                    dividendo = 0.0
-                dividendo = float(dividendo)
-                
-                factor_actualizacion = row.get('factor_actualizacion', None)
-                if pd.notna(factor_actualizacion):
+        for chunk in iter_chunks(df.iterrows(), import_chunk_size()):
+            chunk_success = 0
+            rollup_delta = SummaryDelta(DIVIDEND_ROLLUPS)
+            with transaction.atomic():
+                for _, row in chunk:
+                    row_number += 1
                     try:
-                        factor_actualizacion = float(factor_actualizacion)
-                    except (ValueError, TypeError):
-                        factor_actualizacion = None
-                else:
-                    factor_actualizacion = None
-                
-                valor_historico = row.get('valor_historico', None)
-                if pd.notna(valor_historico):
-                    try:
-                        valor_historico = float(valor_historico)
-                    except (ValueError, TypeError):
-                        valor_historico = None
-                else:
-                    valor_historico = None
-                
-                acogido_isfut = str(row.get('acogido_isfut_isift', 'ninguno')).strip()
-                if acogido_isfut not in ['isfut', 'isift', 'ninguno']:
-                    acogido_isfut = 'ninguno'
-                
-                # Recopilar factores
-                factores = {}
-                for i in range(1, 32):
-                    factor_key = f'factor_{i}'
-                    if factor_key in df.columns:
-                        factor_value = row.get(factor_key)
-                        if pd.notna(factor_value):
+                        # Similar a process_dividend_csv pero usando pandas
+                        periodo_comercial = row.get('periodo_comercial', None)
+                        tipo_mercado = str(row.get('tipo_mercado', '')).strip()
+                        instrumento = str(row.get('instrumento', '')).strip()
+                        fecha_pago = row.get('fecha_pago_dividendo', None)
+                        secuencia = row.get('secuencia_evento_capital', None)
+                        
+                        if pd.isna(periodo_comercial):
+                            raise ValueError("periodo_comercial es requerido")
+                        if not tipo_mercado or pd.isna(tipo_mercado):
+                            raise ValueError("tipo_mercado es requerido")
+                        if not instrumento or pd.isna(instrumento):
+                            raise ValueError("instrumento es requerido")
+                        if pd.isna(fecha_pago):
+                            raise ValueError("fecha_pago_dividendo es requerido")
+                        
+                        periodo_comercial = int(periodo_comercial)
+                        
+                        if tipo_mercado not in ['acciones', 'cfi', 'fondos_mutuos']:
+                            raise ValueError(f"tipo_mercado inválido: {tipo_mercado}")
+                        
+                        # Parsear fecha
+                        from datetime import datetime
+                        if isinstance(fecha_pago, str):
+                            fecha_pago_date = datetime.strptime(fecha_pago, '%Y-%m-%d').date()
+                        elif hasattr(fecha_pago, 'date'):
+                            fecha_pago_date = fecha_pago.date()
+                        else:
+                            raise ValueError(f"fecha_pago_dividendo inválida: {fecha_pago}")
+                        
+                        secuencia_int = None
+                        if not pd.isna(secuencia):
                             try:
-                                factor_val = float(factor_value)
-                                factores[factor_key] = {
-                                    'nombre': f'Factor-{i+7}' if i <= 31 else f'Factor {i}',
-                                    'valor': factor_val
-                                }
+                                secuencia_int = int(secuencia)
+                                if secuencia_int <= 10000:
+                                    raise ValueError("secuencia_evento_capital debe ser superior a 10000")
+                            except (ValueError, TypeError) as e:
+                                raise ValueError(f"secuencia_evento_capital inválida: {str(e)}")
+                        
+                        # Obtener campos opcionales
+                        descripcion = str(row.get('descripcion_dividendo', '')).strip() if not pd.isna(row.get('descripcion_dividendo')) else ''
+                        origen_informacion = str(row.get('origen_informacion', 'sistema')).strip()
+                        if origen_informacion not in ['corredora', 'sistema']:
+                            origen_informacion = 'sistema'
+                        
+                        dividendo = row.get('dividendo', 0)
+                        if pd.isna(dividendo):
+                            dividendo = 0.0
+                        dividendo = float(dividendo)
+                        
+                        factor_actualizacion = row.get('factor_actualizacion', None)
+                        if pd.notna(factor_actualizacion):
+                            try:
+                                factor_actualizacion = float(factor_actualizacion)
                             except (ValueError, TypeError):
-                                pass
-                
-                # LLAVE ÚNICA: periodo_comercial + instrumento + fecha_pago_dividendo + secuencia_evento_capital
-                lookup_kwargs = {
-                    'periodo_comercial': periodo_comercial,
-                    'instrumento': instrumento,
-                    'fecha_pago_dividendo': fecha_pago_date,
-                }
-                
-                if secuencia_int:
-                    lookup_kwargs['secuencia_evento_capital'] = secuencia_int
-                
-                existing = DividendMaintainer.objects.filter(**lookup_kwargs).first()
-                
-                defaults = {
-                    'tipo_mercado': tipo_mercado,
-                    'origen_informacion': origen_informacion,
-                    'origen': origen_informacion,
-                    'descripcion_dividendo': descripcion,
-                    'acogido_isfut_isift': acogido_isfut,
-                    'dividendo': dividendo,
-                    'factor_actualizacion': factor_actualizacion,
-                    'valor_historico': valor_historico,
-                    'factores_8_37': factores,
-                    'updated_by': user,
-                }
-                
-                if existing:
-                    # ACTUALIZAR
-                    before_data = {
-                        'factores_8_37': existing.factores_8_37,
-                        'dividendo': str(existing.dividendo),
-                        'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
-                        'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
-                    }
-                    
-                    for key, value in defaults.items():
-                        setattr(existing, key, value)
-                    existing.save()
-                    
-                    after_data = {
-                        'factores_8_37': existing.factores_8_37,
-                        'dividendo': str(existing.dividendo),
-                        'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
-                        'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
-                    }
-                    
-                    AuditLog.objects.create(
-                        user_id=user,
-                        entity='dividend_maintainers',
-                        entity_id=str(existing.id),
-                        action='update',
-                        before=before_data,
-                        after=after_data,
-                        ip_address=None,
-                        user_agent='Bulk Import',
-                        timestamp=timezone.now()
-                    )
-                    
-                    update_count += 1
-                    action_type = 'actualizado'
-                else:
-                    # CREAR
-                    dividend = DividendMaintainer.objects.create(
-                        periodo_comercial=periodo_comercial,
-                        tipo_mercado=tipo_mercado,
-                        origen_informacion=origen_informacion,
-                        origen=origen_informacion,
-                        instrumento=instrumento,
-                        fecha_pago_dividendo=fecha_pago_date,
-                        secuencia_evento_capital=secuencia_int,
-                        descripcion_dividendo=descripcion,
-                        acogido_isfut_isift=acogido_isfut,
-                        dividendo=dividendo,
-                        factor_actualizacion=factor_actualizacion,
-                        valor_historico=valor_historico,
-                        factores_8_37=factores,
-                        created_by=user,
-                        updated_by=user,
-                    )
-                    
-                    after_data = {
-                        'periodo_comercial': periodo_comercial,
-                        'instrumento': instrumento,
-                        'fecha_pago_dividendo': str(fecha_pago_date),
-                        'factores_8_37': factores,
-                        'created_at': dividend.created_at.isoformat() if dividend.created_at else None,
-                    }
-                    
-                    AuditLog.objects.create(
-                        user_id=user,
-                        entity='dividend_maintainers',
-                        entity_id=str(dividend.id),
-                        action='create',
-                        before=None,
-                        after=after_data,
-                        ip_address=None,
-                        user_agent='Bulk Import',
-                        timestamp=timezone.now()
-                    )
-                    
-                    create_count += 1
-                    action_type = 'creado'
-                    existing = dividend
-                
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=instrumento[:20],
-                    year=periodo_comercial,
-                    status='success',
-                    error_message=f"Registro {action_type} exitosamente"
-                )
-                success_count += 1
-                
-            except Exception as e:
-                error_msg = str(e)
-                errors.append(f"Fila {row_number}: {error_msg}")
-                
-                ImportRecord.objects.create(
-                    import_id=import_obj,
-                    row_number_or_page=row_number,
-                    rut=str(row.get('instrumento', ''))[:20] if 'instrumento' in row else '',
-                    year=None,
-                    status='error',
-                    error_message=error_msg[:500],
-                )
+                                factor_actualizacion = None
+                        else:
+                            factor_actualizacion = None
+                        
+                        valor_historico = row.get('valor_historico', None)
+                        if pd.notna(valor_historico):
+                            try:
+                                valor_historico = float(valor_historico)
+                            except (ValueError, TypeError):
+                                valor_historico = None
+                        else:
+                            valor_historico = None
+                        
+                        acogido_isfut = str(row.get('acogido_isfut_isift', 'ninguno')).strip()
+                        if acogido_isfut not in ['isfut', 'isift', 'ninguno']:
+                            acogido_isfut = 'ninguno'
+                        
+                        # Recopilar factores
+                        factores = {}
+                        for i in range(1, 32):
+                            factor_key = f'factor_{i}'
+                            if factor_key in df.columns:
+                                factor_value = row.get(factor_key)
+                                if pd.notna(factor_value):
+                                    try:
+                                        factor_val = float(factor_value)
+                                        factores[factor_key] = {
+                                            'nombre': f'Factor-{i+7}' if i <= 31 else f'Factor {i}',
+                                            'valor': factor_val
+                                        }
+                                    except (ValueError, TypeError):
+                                        pass
+                        
+                        # LLAVE ÚNICA: periodo_comercial + instrumento + fecha_pago_dividendo + secuencia_evento_capital
+                        lookup_kwargs = {
+                            'periodo_comercial': periodo_comercial,
+                            'instrumento': instrumento,
+                            'fecha_pago_dividendo': fecha_pago_date,
+                        }
+                        
+                        if secuencia_int:
+                            lookup_kwargs['secuencia_evento_capital'] = secuencia_int
+                        
+                        existing = DividendMaintainer.objects.filter(**lookup_kwargs).first()
+                        before_snapshot = dividend_snapshot(existing) if existing else None
+                        before_state = rollback_state(existing) if existing else None
+                        
+                        defaults = {
+                            'tipo_mercado': tipo_mercado,
+                            'origen_informacion': origen_informacion,
+                            'origen': origen_informacion,
+                            'descripcion_dividendo': descripcion,
+                            'acogido_isfut_isift': acogido_isfut,
+                            'dividendo': dividendo,
+                            'factor_actualizacion': factor_actualizacion,
+                            'valor_historico': valor_historico,
+                            'factores_8_37': factores,
+                            'updated_by': user,
+                        }
+                        
+                        # La fila se escribe completa o nada (SAVEPOINT dentro de la transacción del bloque)
+                        with transaction.atomic():
+                            if existing:
+                                # ACTUALIZAR
+                                before_data = {
+                                    'factores_8_37': existing.factores_8_37,
+                                    'dividendo': str(existing.dividendo),
+                                    'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
+                                    'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
+                                }
+                                
+                                for key, value in defaults.items():
+                                    setattr(existing, key, value)
+                                existing.save()
+                                
+                                after_data = {
+                                    'factores_8_37': existing.factores_8_37,
+                                    'dividendo': str(existing.dividendo),
+                                    'factor_actualizacion': str(existing.factor_actualizacion) if existing.factor_actualizacion else None,
+                                    'updated_at': existing.updated_at.isoformat() if existing.updated_at else None,
+                                }
+                                record_change(existing, 'update')
+                                
+                                AuditLog.objects.create(
+                                    user_id=user,
+                                    entity='dividend_maintainers',
+                                    entity_id=str(existing.id),
+                                    action='update',
+                                    before=before_data,
+                                    after=after_data,
+                                    ip_address=None,
+                                    **audit_keys(existing),
+                                    user_agent='Bulk Import',
+                                    timestamp=timezone.now()
+                                )
+                                
+                                action_type = 'actualizado'
+                            else:
+                                # CREAR
+                                dividend = DividendMaintainer.objects.create(
+                                    periodo_comercial=periodo_comercial,
+                                    tipo_mercado=tipo_mercado,
+                                    origen_informacion=origen_informacion,
+                                    origen=origen_informacion,
+                                    instrumento=instrumento,
+                                    fecha_pago_dividendo=fecha_pago_date,
+                                    secuencia_evento_capital=secuencia_int,
+                                    descripcion_dividendo=descripcion,
+                                    acogido_isfut_isift=acogido_isfut,
+                                    dividendo=dividendo,
+                                    factor_actualizacion=factor_actualizacion,
+                                    valor_historico=valor_historico,
+                                    factores_8_37=factores,
+                                    created_by=user,
+                                    updated_by=user,
+                                )
+                                
+                                after_data = {
+                                    'periodo_comercial': periodo_comercial,
+                                    'instrumento': instrumento,
+                                    'fecha_pago_dividendo': str(fecha_pago_date),
+                                    'factores_8_37': factores,
+                                    'created_at': dividend.created_at.isoformat() if dividend.created_at else None,
+                                }
+                                record_change(dividend, 'create')
+                                
+                                AuditLog.objects.create(
+                                    user_id=user,
+                                    entity='dividend_maintainers',
+                                    entity_id=str(dividend.id),
+                                    action='create',
+                                    before=None,
+                                    after=after_data,
+                                    ip_address=None,
+                                    user_agent='Bulk Import',
+                                    timestamp=timezone.now()
+                                )
+                                
+                                action_type = 'creado'
+                                existing = dividend
+                            
+                            index_search_documents([existing])
+                            sync_dividend_factors([existing])
+                            
+                            ImportRecord.objects.create(
+                                import_id=import_obj,
+                                row_number_or_page=row_number,
+                                rut=instrumento[:20],
+                                year=periodo_comercial,
+                                status='success',
+                                error_message=f"Registro {action_type} exitosamente",
+                                **import_change(existing, before_state, action_type == 'creado'),
+                            )
+                        
+                        # Fila escrita: delta de los rollups y contadores
+                        touched_years.add(existing.periodo_comercial)
+                        rollup_delta.change(before_snapshot, dividend_snapshot(existing))
+                        if action_type == 'creado':
+                            create_count += 1
+                        else:
+                            update_count += 1
+                        chunk_success += 1
+                        
+                    except Exception as e:
+                        error_msg = str(e)
+                        errors.append(f"Fila {row_number}: {error_msg}")
+                        
+                        ImportRecord.objects.create(
+                            import_id=import_obj,
+                            row_number_or_page=row_number,
+                            rut=str(row.get('instrumento', ''))[:20] if 'instrumento' in row else '',
+                            year=None,
+                            status='error',
+                            error_message=error_msg[:500],
+                        )
+                # Totales del bloque, en la misma transacción que sus filas
+                rollup_delta.apply()
+            success_count += chunk_success
         
         if success_count > 0:
             errors.append(f"RESUMEN: {create_count} registros creados, {update_count} registros actualizados")
@@ -961,4 +1137,7 @@ def process_dividend_excel(file_content, import_obj, user):
         logger.error(f"Error procesando Excel de dividendos: {str(e)}")
         errors.append(f"Error general al procesar Excel: {str(e)}")
         return success_count, errors
+    finally:
+        # Invalidar la caché de respuestas de los años tocados
+        bump_cache_generations('dividend_maintainers', touched_years)
 
@@ -0,0 +1,336 @@
+"""
+Tablas de totales precalculados (rollups) mantenidas incrementalmente.
+
+- tax_grade_summaries: SUM(amount) y COUNT de TaxGrade por (año, tipo,
+  fuente de ingreso, estado).
+- dividend_rollups: SUM(dividendo), SUM(valor_historico) y COUNT de
+  DividendMaintainer por (periodo, tipo de mercado, origen).
+- dividend_instrument_series: los mismos totales por (periodo, instrumento,
+  fecha de pago), base de las series por instrumento.
+
+Cada escritura calcula la diferencia entre la "foto" del registro antes y
+después (grupo + montos) y la aplica como delta con UPDATE ... SET total =
+total + %s, de modo que los endpoints de estadísticas leen O(grupos) filas.
+Las escrituras en lote que tocan muchos grupos aplican todos sus deltas con
+una lectura, un bulk_update de incrementos y un bulk_create de los grupos nuevos.
+Los rebuild_* recalculan todo (o algunos años/periodos) con un GROUP BY.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import (
+    TaxGrade, TaxGradeSummary, DividendMaintainer, DividendRollup, DividendInstrumentSeries,
+)
+
+SNAPSHOT_LOOKUP_BATCH_SIZE = 1000
+# Desde esta cantidad de grupos los deltas se aplican con apply_deltas()
+BULK_DELTA_MIN_GROUPS = 20
+CENTS = Decimal('0.01')
+
+
+class Rollup:
+    """
+    Tabla de totales `model` agrupada por `group_fields`. `sum_fields` mapea
+    cada columna de total a la columna de origen que acumula y `count_field`
+    es la columna con la cantidad de registros.
+    """
+
+    def __init__(self, model, group_fields, sum_fields, count_field):
+        self.model = model
+        self.group_fields = tuple(group_fields)
+        self.sum_fields = dict(sum_fields)
+        self.count_field = count_field
+
+    def snapshot(self, row):
+        """(grupo, montos) de un registro (instancia o dict de values())"""
+        get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+        group = tuple(get(name) for name in self.group_fields)
+        values = tuple(Decimal(str(get(source) or 0)).quantize(CENTS) for source in self.sum_fields.values())
+        return group, values
+
+    def apply_delta(self, group, values, count):
+        filters = dict(zip(self.group_fields, group))
+        increments = {target: F(target) + value for target, value in zip(self.sum_fields, values)}
+        increments[self.count_field] = F(self.count_field) + count
+        if self.model.objects.filter(**filters).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                self.model.objects.create(
+                    **filters, **dict(zip(self.sum_fields, values)), **{self.count_field: count}
+                )
+        except IntegrityError:
+            # Otro proceso creó el grupo entretanto
+            self.model.objects.filter(**filters).update(**increments)
+
+    def apply_deltas(self, deltas):
+        """
+        Aplica {grupo: (montos, cantidad)}: una lectura de los grupos
+        existentes, un bulk_update con incrementos (F(total) + delta) y un
+        bulk_create de los grupos nuevos.
+        """
+        groups = list(deltas)
+        filters = {
+            f'{name}__in': {group[position] for group in groups}
+            for position, name in enumerate(self.group_fields)
+        }
+        existing = {
+            tuple(row[:-1]): row[-1]
+            for row in self.model.objects.filter(**filters).values_list(*self.group_fields, 'pk')
+        }
+
+        increments = []
+        for group, pk in existing.items():
+            if group not in deltas:
+                continue
+            values, count = deltas[group]
+            row = self.model(pk=pk, **{self.count_field: F(self.count_field) + count})
+            for target, value in zip(self.sum_fields, values):
+                setattr(row, target, F(target) + value)
+            increments.append(row)
+        if increments:
+            self.model.objects.bulk_update(
+                increments, [*self.sum_fields, self.count_field], batch_size=SNAPSHOT_LOOKUP_BATCH_SIZE
+            )
+
+        new_groups = [group for group in groups if group not in existing]
+        if not new_groups:
+            return
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create([
+                    self.model(
+                        **dict(zip(self.group_fields, group)),
+                        **dict(zip(self.sum_fields, deltas[group][0])),
+                        **{self.count_field: deltas[group][1]},
+                    )
+                    for group in new_groups
+                ], batch_size=SNAPSHOT_LOOKUP_BATCH_SIZE)
+        except IntegrityError:
+            # Otro proceso creó alguno de los grupos entretanto
+            for group in new_groups:
+                self.apply_delta(group, *deltas[group])
+
+    def group_totals(self, source):
+        """{grupo: (montos, cantidad)} de los registros de `source` (un GROUP BY)"""
+        aggregates = {
+            f'delta_{target}': Coalesce(Sum(source_field), Decimal(0))
+            for target, source_field in self.sum_fields.items()
+        }
+        rows = source.order_by().values(*self.group_fields).annotate(delta_count=Count('pk'), **aggregates)
+        return {
+            tuple(row[name] for name in self.group_fields): (
+                tuple(Decimal(str(row[f'delta_{target}'])).quantize(CENTS) for target in self.sum_fields),
+                row['delta_count'],
+            )
+            for row in rows
+        }
+
+    def rebuild(self, source, **target_filters):
+        """Reemplaza las filas de `target_filters` por el GROUP BY de `source`"""
+        aggregates = {
+            target: Coalesce(Sum(source_field), Decimal(0))
+            for target, source_field in self.sum_fields.items()
+        }
+        aggregates[self.count_field] = Count('pk')
+        groups = source.order_by().values(*self.group_fields).annotate(**aggregates)
+        with transaction.atomic():
+            self.model.objects.filter(**target_filters).delete()
+            created = self.model.objects.bulk_create(
+                [self.model(**group) for group in groups], batch_size=1000
+            )
+        return len(created)
+
+    def totals(self, queryset, group_by):
+        """Totales agrupados por `group_by` a partir de las filas de la tabla"""
+        aggregates = {target: Sum(target) for target in self.sum_fields}
+        aggregates[self.count_field] = Sum(self.count_field)
+        return (
+            queryset.order_by()
+            .values(*group_by)
+            .annotate(**aggregates)
+            .filter(**{f'{self.count_field}__gt': 0})
+            .order_by(*group_by)
+        )
+
+
+TAX_GRADE_SUMMARY = Rollup(
+    TaxGradeSummary,
+    ('year', 'source_type', 'fuente_ingreso', 'status'),
+    {'total_amount': 'amount'},
+    'record_count',
+)
+DIVIDEND_ROLLUP = Rollup(
+    DividendRollup,
+    ('periodo_comercial', 'tipo_mercado', 'origen_informacion'),
+    {'total_dividendo': 'dividendo', 'total_valor_historico': 'valor_historico'},
+    'record_count',
+)
+DIVIDEND_SERIES = Rollup(
+    DividendInstrumentSeries,
+    ('periodo_comercial', 'instrumento', 'fecha_pago_dividendo'),
+    {'total_dividendo': 'dividendo', 'total_valor_historico': 'valor_historico'},
+    'payment_count',
+)
+
+TAX_GRADE_ROLLUPS = (TAX_GRADE_SUMMARY,)
+DIVIDEND_ROLLUPS = (DIVIDEND_ROLLUP, DIVIDEND_SERIES)
+SUMMARY_GROUP_FIELDS = TAX_GRADE_SUMMARY.group_fields
+DIVIDEND_ROLLUP_GROUP_FIELDS = DIVIDEND_ROLLUP.group_fields
+
+
+class SummaryDelta:
+    """
+    Acumula deltas por grupo para un conjunto de rollups y los aplica en una
+    sola pasada. Las fotos son las que entrega snapshot() (una por rollup).
+    """
+
+    def __init__(self, rollups=TAX_GRADE_ROLLUPS):
+        self.rollups = rollups
+        self.deltas = {rollup: {} for rollup in rollups}
+
+    def snapshot(self, row):
+        return tuple(rollup.snapshot(row) for rollup in self.rollups)
+
+    def add(self, rollup, group, values, count):
+        current = self.deltas[rollup].get(group) or ((Decimal(0),) * len(values), 0)
+        self.deltas[rollup][group] = (
+            tuple(total + value for total, value in zip(current[0], values)),
+            current[1] + count,
+        )
+
+    def _accumulate(self, rollup, snapshot, sign):
+        group, values = snapshot
+        self.add(rollup, group, tuple(sign * value for value in values), sign)
+
+    def change(self, before, after):
+        for index, rollup in enumerate(self.rollups):
+            if before:
+                self._accumulate(rollup, before[index], -1)
+            if after:
+                self._accumulate(rollup, after[index], 1)
+
+    def apply(self):
+        for rollup, deltas in self.deltas.items():
+            pending = {group: delta for group, delta in deltas.items() if delta[1] or any(delta[0])}
+            if len(pending) >= BULK_DELTA_MIN_GROUPS:
+                rollup.apply_deltas(pending)
+            else:
+                for group, (values, count) in pending.items():
+                    rollup.apply_delta(group, values, count)
+            deltas.clear()
+
+
+def set_change_delta(queryset, rollups, changes=None):
+    """
+    Delta de una escritura por conjunto, calculado con un GROUP BY antes de
+    escribir: sin `changes` los registros de `queryset` se quitan de los
+    totales (DELETE); con `changes` ({campo de grupo: valor}) se mueven a los
+    grupos con esos valores (UPDATE ... SET campo = valor).
+    """
+    delta = SummaryDelta(rollups)
+    for rollup in rollups:
+        for group, (values, count) in rollup.group_totals(queryset).items():
+            delta.add(rollup, group, tuple(-value for value in values), -count)
+            if changes:
+                moved = tuple(changes.get(name, value) for name, value in zip(rollup.group_fields, group))
+                delta.add(rollup, moved, values, count)
+    return delta
+
+
+def summary_snapshot(tax_grade):
+    """Foto de un TaxGrade para tax_grade_summaries"""
+    return tuple(rollup.snapshot(tax_grade) for rollup in TAX_GRADE_ROLLUPS)
+
+
+def dividend_snapshot(dividend):
+    """Foto de un DividendMaintainer para los rollups de dividendos"""
+    return tuple(rollup.snapshot(dividend) for rollup in DIVIDEND_ROLLUPS)
+
+
+def record_summary_change(before=None, after=None, rollups=TAX_GRADE_ROLLUPS):
+    """Aplica el delta de una escritura individual (create: before=None; delete: after=None)"""
+    delta = SummaryDelta(rollups)
+    delta.change(before, after)
+    delta.apply()
+
+
+def record_dividend_rollup_change(before=None, after=None):
+    record_summary_change(before, after, DIVIDEND_ROLLUPS)
+
+
+def load_summary_snapshots(ruts_normalizados):
+    """
+    Fotos actuales de los TaxGrade de un archivo, por (rut_normalizado, año),
+    cargadas en lotes antes de importar para no consultar fila por fila.
+    """
+    ruts = sorted({rut for rut in ruts_normalizados if rut})
+    fields = {'rut_normalizado', *TAX_GRADE_SUMMARY.group_fields, *TAX_GRADE_SUMMARY.sum_fields.values()}
+    snapshots = {}
+    for start in range(0, len(ruts), SNAPSHOT_LOOKUP_BATCH_SIZE):
+        rows = TaxGrade.objects.filter(
+            rut_normalizado__in=ruts[start:start + SNAPSHOT_LOOKUP_BATCH_SIZE]
+        ).values(*fields)
+        for row in rows:
+            snapshots[(row['rut_normalizado'], row['year'])] = summary_snapshot(row)
+    return snapshots
+
+
+def rebuild_tax_grade_summary(years=None):
+    """Recalcula tax_grade_summaries con un GROUP BY (todos los años o `years`)"""
+    if years is None:
+        return TAX_GRADE_SUMMARY.rebuild(TaxGrade.objects.all())
+    return TAX_GRADE_SUMMARY.rebuild(TaxGrade.objects.filter(year__in=years), year__in=years)
+
+
+def rebuild_dividend_rollups(periodo_comercial):
+    """Recalcula los rollups de dividendos de un periodo (una transacción por tabla)"""
+    source = DividendMaintainer.objects.filter(periodo_comercial=periodo_comercial)
+    return {
+        rollup.model._meta.db_table: rollup.rebuild(source, periodo_comercial=periodo_comercial)
+        for rollup in DIVIDEND_ROLLUPS
+    }
+
+
+def summary_totals(queryset, group_by=SUMMARY_GROUP_FIELDS):
+    return TAX_GRADE_SUMMARY.totals(queryset, group_by)
+
+
+def downsample_series(rows, max_points):
+    """
+    Reduce una serie diaria [(fecha, dividendo, valor_historico, pagos), ...]
+    ordenada por fecha a lo más `max_points` tramos de igual duración,
+    sumando los montos de cada tramo. La fecha de cada punto es la primera
+    fecha con pagos del tramo.
+    """
+    if len(rows) <= max_points:
+        return [
+            {'fecha': fecha, 'total_dividendo': dividendo, 'total_valor_historico': historico, 'payment_count': pagos}
+            for fecha, dividendo, historico, pagos in rows
+        ]
+
+    days = np.array([fecha.toordinal() for fecha, *_ in rows], dtype=np.int64)
+    dividendos = np.array([float(row[1]) for row in rows])
+    historicos = np.array([float(row[2]) for row in rows])
+    pagos = np.array([row[3] for row in rows], dtype=np.int64)
+
+    edges = np.linspace(days[0], days[-1] + 1, max_points + 1)
+    buckets = np.clip(np.searchsorted(edges, days, side='right') - 1, 0, max_points - 1)
+    used, first_index = np.unique(buckets, return_index=True)
+    dividendo_sums = np.bincount(buckets, weights=dividendos, minlength=max_points)
+    historico_sums = np.bincount(buckets, weights=historicos, minlength=max_points)
+    pago_sums = np.bincount(buckets, weights=pagos, minlength=max_points)
+
+    return [
+        {
+            'fecha': rows[index][0],
+            'total_dividendo': Decimal(str(round(dividendo_sums[bucket], 2))),
+            'total_valor_historico': Decimal(str(round(historico_sums[bucket], 2))),
+            'payment_count': int(pago_sums[bucket]),
+        }
+        for bucket, index in zip(used, first_index)
+    ]
@@ -0,0 +1,11 @@
+from django import template
+
+from miapp.assets import asset_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset(name):
+    """URL de un asset de STATIC_ASSETS (con hash si se ejecutó build_assets)"""
+    return asset_url(name)
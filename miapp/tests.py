@@ -1,3 +1,1259 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import renderers
+from .archive import ArchivedAuditLogs, archive_audit_logs, decode_rows
+from .assets import IMMUTABLE_CACHE_CONTROL, asset_url, build_assets
+from .changes import record_change
+from .declarations import DeclarationFieldOverflow, get_layout, write_declaration
+from .diffs import PLAIN, ZLIB, decode_payload, encode_payload
+from .exports import DeltaWindow, decode_watermark, dividend_export_columns, write_dividend_parquet
+from .models import (
+    AuditLog, AuditLogArchive, ChangeEvent, DividendFactor, DividendMaintainer, DividendRollup, Import, ImportRecord, TaxGrade,
+    TaxGradeSummary,
+)
+from .search import MySQLFullTextBackend
+from .services import process_csv_file, process_dividend_csv
+from .summaries import SummaryDelta
+from .views import (
+    AuditLogViewSet, ChangeFeedViewSet, DividendMaintainerViewSet, ImportViewSet, TaxGradeViewSet,
+)
+
+TAX_GRADE = {
+    'rut': '12.345.678-5', 'name': 'Contribuyente', 'year': 2024,
+    'source_type': 'declaracion', 'amount': '1000.00',
+}
+DIVIDEND = {
+    'tipo_mercado': 'acciones', 'origen_informacion': 'corredora', 'periodo_comercial': 2024,
+    'instrumento': 'ACME', 'fecha_pago_dividendo': '2024-05-10', 'origen': 'corredora',
+    'dividendo': '150.00', 'valor_historico': '140.00',
+    'factores_8_37': {'factor_1': '0.5', 'factor_2': '0.25'},
+}
+
+
+class APIClientMixin:
+    """Cliente autenticado con JWT (como el frontend: el usuario se carga en cada request)"""
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+        self.user = User.objects.create_user('operador', password='clave-segura-123', is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+
+class QueryBudgetChecks(APIClientMixin):
+    """
+    Cada acción de `query_budgets` se ejecuta con QUERY_BUDGET_ENFORCE: el
+    middleware lanza QueryBudgetExceeded si la supera. Las escrituras se
+    miden en el peor caso (primer registro de su grupo de totales) y con el
+    SEARCH_BACKEND configurado ('auto': en sqlite el índice de trigramas, el
+    backend que más consultas escribe).
+    """
+
+    def run_actions(self, viewset, calls):
+        self.assertEqual(set(calls), set(viewset.query_budgets), 'Acciones sin prueba de presupuesto')
+        for action, call in calls.items():
+            with self.subTest(viewset=viewset.__name__, action=action):
+                response = call()
+                self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+                self.assertLessEqual(int(response['X-Query-Count']), viewset.query_budgets[action])
+
+    def test_tax_grade_budgets(self):
+        url = '/api/tax-grades/'
+        pk = self.client.post(url, TAX_GRADE, format='json').data['id']
+        self.run_actions(TaxGradeViewSet, {
+            'create': lambda: self.client.post(url, {**TAX_GRADE, 'rut': '11.111.111-1', 'year': 2023}, format='json'),
+            'list': lambda: self.client.get(url),
+            'retrieve': lambda: self.client.get(f'{url}{pk}/'),
+            'update': lambda: self.client.put(f'{url}{pk}/', {**TAX_GRADE, 'source_type': 'certificado'}, format='json'),
+            'partial_update': lambda: self.client.patch(f'{url}{pk}/', {'amount': '1200.00'}, format='json'),
+            'audit': lambda: self.client.get(f'{url}{pk}/audit/'),
+            'export': lambda: self.client.get(f'{url}export/', {'year': 2024}),
+            'stats': lambda: self.client.get(f'{url}stats/'),
+            'destroy': lambda: self.client.delete(f'{url}{pk}/'),
+        })
+
+    def test_dividend_budgets(self):
+        url = '/api/dividend-maintainers/'
+        pk = self.client.post(url, DIVIDEND, format='json').data['id']
+        self.run_actions(DividendMaintainerViewSet, {
+            'create': lambda: self.client.post(url, {**DIVIDEND, 'instrumento': 'OTRA', 'periodo_comercial': 2023}, format='json'),
+            'list': lambda: self.client.get(url),
+            'retrieve': lambda: self.client.get(f'{url}{pk}/'),
+            'update': lambda: self.client.put(
+                f'{url}{pk}/', {**DIVIDEND, 'tipo_mercado': 'cfi', 'factores_8_37': {'factor_1': '0.7'}}, format='json'
+            ),
+            'partial_update': lambda: self.client.patch(f'{url}{pk}/', {'dividendo': '160.00'}, format='json'),
+            'rollups': lambda: self.client.get(f'{url}rollups/'),
+            'series': lambda: self.client.get(f'{url}series/', {'instrumento': 'ACME'}),
+            'destroy': lambda: self.client.delete(f'{url}{pk}/'),
+        })
+
+    def test_import_budgets(self):
+        media_root = Path(tempfile.mkdtemp())
+        (media_root / 'reports').mkdir()
+        (media_root / 'reports' / 'report.txt').write_text('ok')
+        import_obj = Import.objects.create(
+            uploader_id=self.user, file_name='carga.csv', file_hash='0' * 64, file_type='csv',
+            status='done', report_path='reports/report.txt',
+        )
+        ImportRecord.objects.create(import_id=import_obj, row_number_or_page=2, status='success')
+        url = f'/api/imports/{import_obj.pk}/'
+        with override_settings(MEDIA_ROOT=media_root):
+            self.run_actions(ImportViewSet, {
+                'list': lambda: self.client.get('/api/imports/'),
+                'retrieve': lambda: self.client.get(url),
+                'records': lambda: self.client.get(f'{url}records/'),
+                'report': lambda: self.client.get(f'{url}report/'),
+            })
+
+    def test_audit_log_budgets(self):
+        self.client.post('/api/tax-grades/', TAX_GRADE, format='json')
+        log = AuditLog.objects.get()
+        self.run_actions(AuditLogViewSet, {
+            'list': lambda: self.client.get('/api/audit-logs/'),
+            'retrieve': lambda: self.client.get(f'/api/audit-logs/{log.pk}/'),
+            'timeline': lambda: self.client.get('/api/audit-logs/timeline/', {'rut': TAX_GRADE['rut']}),
+        })
+
+    def test_change_feed_budgets(self):
+        self.client.post('/api/tax-grades/', TAX_GRADE, format='json')
+        self.run_actions(ChangeFeedViewSet, {
+            'list': lambda: self.client.get('/api/changes/'),
+            'ack': lambda: self.client.post('/api/changes/ack/', {'consumer': 'erp', 'cursor': '1'}, format='json'),
+        })
+
+
+@override_settings(SEARCH_BACKEND='like')
+class KeysetPaginationTests(APIClientMixin, TestCase):
+    """?pagination=keyset del listado de calificaciones (miapp.pagination)"""
+
+    url = '/api/tax-grades/'
+
+    def setUp(self):
+        super().setUp()
+        for rut, year in (('12.345.678-5', 2024), ('11.111.111-1', 2024), ('9.876.543-3', 2023)):
+            self.client.post(self.url, {**TAX_GRADE, 'rut': rut, 'year': year}, format='json')
+
+    def test_pages_follow_keyset_ordering(self):
+        ruts, url, params = [], self.url, {'pagination': 'keyset', 'page_size': 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ruts += [row['rut'] for row in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ruts, ['11.111.111-1', '12.345.678-5', '9.876.543-3'])
+
+    def test_rejects_orderings_the_cursor_cannot_represent(self):
+        for params in ({'ordering': '-rut'}, {'ordering': 'amount'}, {'search': 'Contribuyente'}):
+            with self.subTest(**params):
+                response = self.client.get(self.url, {'pagination': 'keyset', **params})
+                self.assertEqual(response.status_code, 400)
+        # Un prefijo del orden keyset sí es representable
+        self.assertEqual(self.client.get(self.url, {'pagination': 'keyset', 'ordering': '-year'}).status_code, 200)
+
+
+class ResponseCacheTests(APIClientMixin, TestCase):
+    """Caché de respuestas versionada por (entidad, año) (miapp.cache)"""
+
+    url = '/api/tax-grades/'
+
+    def get(self, path='', **params):
+        response = self.client.get(f'{self.url}{path}', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_writes_bump_only_their_generations(self):
+        current = self.client.post(self.url, TAX_GRADE, format='json').data['id']
+        previous = self.client.post(self.url, {**TAX_GRADE, 'year': 2023}, format='json').data['id']
+        for params in ({'year': 2024}, {'year': 2023}):
+            self.assertEqual(self.get(**params)['X-Cache'], 'MISS')
+            self.assertEqual(self.get(**params)['X-Cache'], 'HIT')
+        self.assertEqual(self.get(f'{current}/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get(f'{current}/')['X-Cache'], 'HIT')
+
+        self.client.patch(f'{self.url}{previous}/', {'amount': '2000.00'}, format='json')
+        # El listado de otro año sigue en caché; el del año escrito y los detalles ('all') no
+        self.assertEqual(self.get(year=2024)['X-Cache'], 'HIT')
+        response = self.get(year=2023)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([row['amount'] for row in response.data['results']], ['2000.00'])
+        self.assertEqual(self.get(f'{current}/')['X-Cache'], 'MISS')
+
+    @override_settings(API_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.assertNotIn('X-Cache', self.get(year=2024))
+
+
+class ConditionalGetTests(APIClientMixin, TestCase):
+    """ETag / If-None-Match de listados y detalles (miapp.conditional)"""
+
+    url = '/api/tax-grades/'
+
+    def test_list_etag_returns_not_modified_until_a_write(self):
+        pk = self.client.post(self.url, TAX_GRADE, format='json').data['id']
+        etag = self.client.get(self.url, {'year': 2024})['ETag']
+        response = self.client.get(self.url, {'year': 2024}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        # El ETag débil que deja la compresión también vale
+        self.assertEqual(self.client.get(self.url, {'year': 2024}, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+        # Otros parámetros son otra representación
+        self.assertEqual(self.client.get(self.url, {'year': 2023}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.patch(f'{self.url}{pk}/', {'amount': '2000.00'}, format='json')
+        response = self.client.get(self.url, {'year': 2024}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_etag_follows_version(self):
+        pk = self.client.post(self.url, TAX_GRADE, format='json').data['id']
+        response = self.client.get(f'{self.url}{pk}/')
+        self.assertEqual(response['ETag'], f'"{pk}-1"')
+        self.assertEqual(self.client.get(f'{self.url}{pk}/', HTTP_IF_NONE_MATCH=f'"{pk}-1"').status_code, 304)
+
+
+class SparseFieldsetTests(APIClientMixin, TestCase):
+    """?fields= / ?exclude= de los listados (miapp.fieldsets)"""
+
+    url = '/api/dividend-maintainers/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.post(self.url, DIVIDEND, format='json')
+
+    def fetch(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results'][0], ' '.join(query['sql'] for query in queries)
+
+    def test_deferred_columns_are_not_fetched_unless_requested(self):
+        row, sql = self.fetch()
+        self.assertNotIn('factores_8_37', row)
+        self.assertIn('instrumento', row)
+        self.assertNotIn('factores_8_37', sql)
+        self.assertNotIn('campos_detallados_sii', sql)
+
+        row, sql = self.fetch(fields='id,instrumento,factores_8_37')
+        self.assertEqual(list(row), ['id', 'instrumento', 'factores_8_37'])
+        self.assertEqual(row['factores_8_37']['factor_1'], '0.5')
+        self.assertNotIn('"valor_historico"', sql)
+
+        row, sql = self.fetch(exclude='descripcion_dividendo,valor_historico')
+        self.assertNotIn('valor_historico', row)
+        self.assertNotIn('"valor_historico"', sql)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(self.url, {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', str(response.data['fields']))
+
+
+class FastListTests(APIClientMixin, TestCase):
+    """Fast path de los listados: values_list() + FastJSONRenderer (miapp.fastlist)"""
+
+    def get(self, url, **params):
+        for cache in caches.all():
+            cache.clear()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_same_json_as_the_serializer(self):
+        self.client.post('/api/tax-grades/', {**TAX_GRADE, 'factor': '0.125'}, format='json')
+        self.client.post('/api/dividend-maintainers/', DIVIDEND, format='json')
+        cases = [
+            ('/api/tax-grades/', {}),
+            ('/api/tax-grades/', {'fields': 'id,rut,amount,factor,created_at'}),
+            ('/api/dividend-maintainers/', {'fields': 'id,fecha_pago_dividendo,dividendo,factores_8_37'}),
+        ]
+        for url, params in cases:
+            with mock.patch('miapp.fastlist.FastListMixin.use_fast_list', return_value=False):
+                expected = self.get(url, **params)
+            # El fast path no pasa por el serializer fila a fila
+            with mock.patch('miapp.serializers.TaxGradeListSerializer.to_representation', side_effect=AssertionError), \
+                    mock.patch('miapp.serializers.DividendMaintainerListSerializer.to_representation', side_effect=AssertionError):
+                self.assertEqual(self.get(url, **params), expected, params)
+
+    def test_orjson_only_without_floats(self):
+        self.client.post('/api/dividend-maintainers/', {**DIVIDEND, 'factores_8_37': {'factor_1': 0.00001}}, format='json')
+        if renderers.orjson is None:
+            self.skipTest('orjson no está instalado')
+        url = '/api/dividend-maintainers/'
+        with mock.patch.object(renderers.orjson, 'dumps', side_effect=renderers.orjson.dumps) as dumps:
+            self.get(url)
+            self.assertEqual(dumps.call_count, 1)
+            # factores_8_37 puede traer floats: se escribe con el JSONRenderer de DRF
+            content = self.get(url, fields='id,factores_8_37')
+            self.assertEqual(dumps.call_count, 1)
+        self.assertIn(b'"factor_1":1e-05', content)
+
+
+class ColumnarAndCompressionTests(APIClientMixin, TestCase):
+    """?layout=columnar, MessagePack y ResponseCompressionMiddleware"""
+
+    url = '/api/dividend-maintainers/'
+
+    def setUp(self):
+        super().setUp()
+        for index in range(30):
+            factores = {'factor_1': '0.5', 'factor_3': '1.25'} if index % 2 else {}
+            self.client.post(self.url, {**DIVIDEND, 'instrumento': f'I{index:02d}', 'factores_8_37': factores}, format='json')
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_columnar_json_and_msgpack(self):
+        params = {'layout': 'columnar', 'fields': 'instrumento,factores_8_37', 'ordering': 'instrumento'}
+        data = self.client.get(self.url, params).data['results']
+        self.assertEqual(list(data['columns']), ['instrumento'])
+        self.assertEqual(data['columns']['instrumento'][:2], ['I00', 'I01'])
+        self.assertEqual(data['factor_numbers'], list(range(8, 38)))
+        self.assertEqual(len(data['factors']), 30)
+        self.assertEqual(data['factors'][0], [None] * 30)
+        self.assertEqual(data['factors'][1][:4], [0.5, None, 1.25, None])
+
+        try:
+            import msgpack
+        except ImportError:
+            self.skipTest('msgpack no está instalado')
+        response = self.client.get(self.url, params, HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertIn('Accept', response['Vary'])
+        factors = msgpack.unpackb(response.content)['results']['factors']
+        self.assertEqual((factors['dtype'], factors['shape']), ('<f8', [30, 30]))
+        matrix = np.frombuffer(factors['data'], dtype='<f8').reshape(factors['shape'])
+        self.assertTrue(np.isnan(matrix[0]).all())
+        self.assertEqual((matrix[1][0], matrix[1][2]), (0.5, 1.25))
+
+    def test_compressed_json_gets_weak_etag(self):
+        plain = self.client.get(self.url, {'periodo_comercial': 2024})
+        response = self.client.get(self.url, {'periodo_comercial': 2024}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['ETag'], f'W/{plain["ETag"]}')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        # El ETag débil sirve para el 304
+        conditional = self.client.get(
+            self.url, {'periodo_comercial': 2024}, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(conditional.status_code, 304)
+
+    def test_streamed_export_is_compressed_incrementally(self):
+        url = f'{self.url}export/'
+        plain = b''.join(self.client.get(url, {'periodo_comercial': 2024}).streaming_content)
+        response = self.client.get(url, {'periodo_comercial': 2024}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+        with self.settings(RESPONSE_COMPRESSION_MIN_LENGTH=len(plain) + 1):
+            response = self.client.get(url, {'periodo_comercial': 2024}, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(b''.join(response.streaming_content), plain)
+
+
+def make_import(user, file_name='carga.csv', file_type='csv'):
+    return Import.objects.create(
+        uploader_id=user, file_name=file_name, file_hash='0' * 64, file_type=file_type, status='processing',
+    )
+
+
+def fail_on_call(number):
+    """side_effect de record_change que falla en la llamada `number` (a mitad de la fila)"""
+    calls = []
+
+    def side_effect(instance, operation):
+        calls.append(instance)
+        if len(calls) == number:
+            raise DatabaseError('fallo simulado')
+        return record_change(instance, operation)
+    return side_effect
+
+
+def fail_on_apply(number):
+    """side_effect de SummaryDelta.apply que falla en el bloque `number`"""
+    calls = []
+    apply = SummaryDelta.apply
+
+    def side_effect(delta):
+        calls.append(delta)
+        if len(calls) == number:
+            raise DatabaseError('fallo simulado')
+        return apply(delta)
+    return side_effect
+
+
+TAX_GRADE_CSV = (
+    'rut,name,year,source_type,amount\n'
+    '12.345.678-5,Contribuyente,2024,declaracion,1000\n'
+    '11.111.111-1,Otro,2024,certificado,500\n'
+)
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTests(QueryBudgetChecks, TransactionTestCase):
+    """La transacción de la vista es la de la request, como en producción"""
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class NestedQueryBudgetTests(QueryBudgetChecks, TestCase):
+    """
+    Dentro de una transacción externa (la de TestCase o ATOMIC_REQUESTS) la
+    transacción de la vista es un SAVEPOINT con su RELEASE: una consulta más.
+    """
+
+
+class TaxGradeImportTests(TestCase):
+    """Importadores de calificaciones (miapp.services)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('operador', password='clave-segura-123')
+
+    def run_import(self, content):
+        import_obj = make_import(self.user)
+        success_count, errors = process_csv_file(content.encode('utf-8'), import_obj, self.user)
+        import_obj.status = 'done'
+        import_obj.save()
+        return import_obj, success_count, errors
+
+    def test_each_row_is_written_once(self):
+        first, success_count, errors = self.run_import(TAX_GRADE_CSV)
+        self.assertEqual((success_count, errors), (2, []))
+        self.assertEqual(set(first.records.values_list('operation', 'version')), {('create', 1)})
+        tax_grade = TaxGrade.objects.get(rut_normalizado='123456785')
+        self.assertEqual((tax_grade.version, tax_grade.created_by, tax_grade.fuente_ingreso), (1, self.user, 'archivo'))
+
+        second, _, _ = self.run_import(TAX_GRADE_CSV.replace('1000', '1500'))
+        self.assertEqual(set(second.records.values_list('operation', 'version')), {('update', 2)})
+        tax_grade.refresh_from_db()
+        self.assertEqual((tax_grade.version, tax_grade.amount, tax_grade.created_by), (2, 1500, self.user))
+
+    def test_failed_row_leaves_no_partial_writes(self):
+        with mock.patch('miapp.services.record_change', side_effect=fail_on_call(2)):
+            import_obj, success_count, errors = self.run_import(TAX_GRADE_CSV)
+        self.assertEqual(success_count, 1)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(
+            list(import_obj.records.order_by('row_number_or_page').values_list('status', flat=True)),
+            ['success', 'error'],
+        )
+        # La fila que falló no dejó el registro sin su evento (ni al revés)
+        self.assertQuerySetEqual(TaxGrade.objects.values_list('rut_normalizado', flat=True), ['123456785'])
+        self.assertEqual(ChangeEvent.objects.count(), 1)
+
+    @override_settings(IMPORT_CHUNK_SIZE=1)
+    def test_summary_is_applied_with_its_chunk(self):
+        with mock.patch.object(SummaryDelta, 'apply', autospec=True, side_effect=fail_on_apply(2)):
+            _, success_count, errors = self.run_import(TAX_GRADE_CSV)
+        # El bloque cuyo total falló se revierte entero y el error se informa
+        self.assertEqual(success_count, 1)
+        self.assertEqual(len(errors), 1)
+        self.assertQuerySetEqual(TaxGrade.objects.values_list('rut_normalizado', flat=True), ['123456785'])
+        self.assertQuerySetEqual(
+            TaxGradeSummary.objects.filter(record_count__gt=0).values_list('total_amount', 'record_count'),
+            [(1000, 1)],
+        )
+
+
+    @override_settings(IMPORT_CHUNK_SIZE=2)
+    def test_rejects_invalid_check_digits_per_chunk(self):
+        content = TAX_GRADE_CSV + '12.345.678-K,Mal DV,2024,manual,10\n,Sin RUT,2024,manual,10\n'
+        import_obj, success_count, errors = self.run_import(content)
+        self.assertEqual(success_count, 2)
+        self.assertEqual(errors, ['Fila 3: RUT inválido: 12.345.678-K', 'Fila 4: RUT es requerido'])
+        self.assertQuerySetEqual(
+            import_obj.records.filter(status='error').order_by('row_number_or_page').values_list('row_number_or_page', 'rut'),
+            [(3, '12.345.678-K'), (4, '')],
+        )
+        self.assertQuerySetEqual(
+            TaxGrade.objects.order_by('rut_normalizado').values_list('rut_normalizado', flat=True),
+            ['111111111', '123456785'],
+        )
+
+
+class RutNormalizadoTests(APIClientMixin, TestCase):
+    """Columna TaxGrade.rut_normalizado y su migración (0008)"""
+
+    def test_normalized_on_save_and_used_by_filters(self):
+        tax_grade = TaxGrade.objects.create(**{**TAX_GRADE, 'rut': '0012.345.678-5'})
+        self.assertEqual(tax_grade.rut_normalizado, '123456785')
+        tax_grade.rut = '11.111.111-1'
+        tax_grade.save(update_fields=['rut'])
+        tax_grade.refresh_from_db()
+        self.assertEqual(tax_grade.rut_normalizado, '111111111')
+
+        for params in ({'rut': '11111111-1'}, {'rut_prefix': '11.111'}):
+            response = self.client.get('/api/tax-grades/', params)
+            self.assertEqual([row['id'] for row in response.data['results']], [str(tax_grade.pk)], params)
+        response = self.client.get('/api/tax-grades/', {'rut_prefix': '12'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_migration_backfills_in_batches(self):
+        migration = importlib.import_module('miapp.migrations.0008_tax_grade_rut_normalizado')
+        for rut in ('12.345.678-5', '11111111-1', '7.654.321-K'):
+            TaxGrade.objects.create(**{**TAX_GRADE, 'rut': rut})
+        TaxGrade.objects.update(rut_normalizado='')
+        with mock.patch.object(migration, 'BACKFILL_BATCH_SIZE', 2):
+            migration.backfill_rut_normalizado(apps, None)
+        self.assertQuerySetEqual(
+            TaxGrade.objects.order_by('rut_normalizado').values_list('rut_normalizado', flat=True),
+            ['111111111', '123456785', '7654321K'],
+        )
+
+
+DIVIDEND_CSV = (
+    'periodo_comercial,tipo_mercado,instrumento,fecha_pago_dividendo,origen_informacion,dividendo,factor_1\n'
+    '2024,acciones,ACME,2024-05-10,corredora,150,0.5\n'
+    '2024,acciones,BETA,2024-06-10,corredora,80,0.25\n'
+)
+
+
+class DividendImportTests(TestCase):
+    """Importadores de dividendos (miapp.services)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('operador', password='clave-segura-123')
+
+    def run_import(self, content):
+        import_obj = make_import(self.user)
+        success_count, errors = process_dividend_csv(content.encode('utf-8'), import_obj, self.user)
+        import_obj.status = 'done'
+        import_obj.save()
+        return import_obj, success_count, errors
+
+    def test_failed_row_leaves_no_partial_writes(self):
+        with mock.patch('miapp.services.record_change', side_effect=fail_on_call(2)):
+            import_obj, success_count, _ = self.run_import(DIVIDEND_CSV)
+        self.assertEqual(success_count, 1)
+        self.assertQuerySetEqual(DividendMaintainer.objects.values_list('instrumento', flat=True), ['ACME'])
+        self.assertEqual(ChangeEvent.objects.count(), 1)
+        self.assertEqual(import_obj.records.filter(status='success').count(), 1)
+
+    @override_settings(IMPORT_CHUNK_SIZE=1)
+    def test_rollups_are_applied_with_their_chunk(self):
+        with mock.patch.object(SummaryDelta, 'apply', autospec=True, side_effect=fail_on_apply(2)):
+            _, success_count, errors = self.run_import(DIVIDEND_CSV)
+        self.assertEqual((success_count, len(errors)), (1, 1))
+        self.assertQuerySetEqual(DividendMaintainer.objects.values_list('instrumento', flat=True), ['ACME'])
+        self.assertQuerySetEqual(
+            DividendRollup.objects.filter(record_count__gt=0).values_list('total_dividendo', 'record_count'),
+            [(150, 1)],
+        )
+
+
+class MySQLFullTextSearchTests(TestCase):
+    """
+    Ruteo de términos de MySQLFullTextBackend (miapp.search). Los términos de
+    RUT y de palabras cortas no usan MATCH, así que se prueban en cualquier motor.
+    """
+
+    fields = ['rut', 'name', 'calculation_basis']
+
+    def setUp(self):
+        for rut, name in (('12.345.678-5', 'Inversiones de Chile'), ('12.399.111-2', 'Otro'), ('9.876.543-3', 'Otro')):
+            TaxGrade.objects.create(**{**TAX_GRADE, 'rut': rut, 'name': name})
+
+    def search(self, term):
+        queryset = MySQLFullTextBackend().search(TaxGrade.objects.order_by('rut'), term, self.fields)
+        return list(queryset.values_list('rut', flat=True))
+
+    def test_rut_terms_use_rut_prefix(self):
+        self.assertEqual(self.search('12.345.678-5'), ['12.345.678-5'])
+        self.assertEqual(self.search('123456785'), ['12.345.678-5'])
+        self.assertEqual(self.search('12.3'), ['12.345.678-5', '12.399.111-2'])
+
+    def test_short_words_use_like(self):
+        self.assertEqual(self.search('de'), ['12.345.678-5'])
+
+    def test_indexed_words_use_match(self):
+        queryset = MySQLFullTextBackend().search(TaxGrade.objects.all(), 'inversiones de', self.fields)
+        sql, params = queryset.query.sql_with_params()
+        self.assertIn('MATCH', sql)
+        self.assertIn('+inversiones*', params)
+        self.assertIn('%de%', params)
+
+
+class DeclarationTests(APIClientMixin, TestCase):
+    """Archivos de Declaraciones Juradas (miapp.declarations)"""
+
+    def create_tax_grade(self, **fields):
+        return TaxGrade.objects.create(**{**TAX_GRADE, 'rut_normalizado': '123456785', **fields})
+
+    def write(self, code):
+        output = io.BytesIO()
+        write_declaration(get_layout(code), 2024, output, '76.543.210-3')
+        return output.getvalue().decode('latin-1').split('\r\n')
+
+    def test_fixed_width_records(self):
+        self.create_tax_grade(factor='0.5')
+        header, detail, trailer, _ = self.write('calificaciones_fijo')
+        self.assertEqual(detail, '10123456785' + 'CONTRIBUYENTE'.ljust(60) + '1' + '1000'.zfill(15) + '5000'.zfill(10))
+        self.assertEqual(trailer, ('9' + '1'.zfill(10) + '1000'.zfill(18)).ljust(len(detail)))
+        self.assertTrue(header.startswith('02024' + '0765432103'))
+
+    def test_overflow_names_record_and_field(self):
+        tax_grade = self.create_tax_grade(factor='-123456.0000')
+        with self.assertRaisesMessage(
+            DeclarationFieldOverflow, f'calificaciones_fijo, detalle (pk={tax_grade.pk}): el campo factor',
+        ):
+            self.write('calificaciones_fijo')
+        tax_grade.factor = None
+        tax_grade.rut = '123.456.789.012-3'
+        tax_grade.save()
+        with self.assertRaisesMessage(DeclarationFieldOverflow, 'el campo rut (1234567890123)'):
+            self.write('calificaciones_fijo')
+        # El formato delimitado no tiene largo fijo
+        self.assertEqual(len(self.write('calificaciones_delimitado')), 4)
+
+    def test_endpoint_rejects_overflow_before_sending_the_file(self):
+        url = '/api/sii-declarations/calificaciones_fijo/'
+        self.create_tax_grade()
+        response = self.client.get(url, {'periodo_comercial': 2024})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="calificaciones_fijo_2024.txt"')
+        self.assertEqual(len(b''.join(response.streaming_content).split(b'\r\n')), 4)
+
+        overflow = self.create_tax_grade(rut='123.456.789.012-3', name='Otro')
+        response = self.client.get(url, {'periodo_comercial': 2024})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn(f'(pk={overflow.pk}): el campo rut', response.data['error'])
+
+
+class DividendBulkDeleteTests(APIClientMixin, TestCase):
+    """POST /api/dividend-maintainers/bulk-delete/ (miapp.bulk.delete_dividends)"""
+
+    url = '/api/dividend-maintainers/'
+
+    def test_deletes_filtered_set_with_dependents(self):
+        self.client.post(self.url, DIVIDEND, format='json')
+        keep = self.client.post(self.url, {**DIVIDEND, 'periodo_comercial': 2023, 'dividendo': '80.00'}, format='json').data['id']
+        response = self.client.post(f'{self.url}bulk-delete/?periodo_comercial=2024', {'expected_count': 1}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['count'], response.data['years']), (1, [2024]))
+        self.assertQuerySetEqual(DividendMaintainer.objects.values_list('pk', flat=True), [keep], transform=str)
+        self.assertEqual({str(pk) for pk in DividendFactor.objects.values_list('dividend_id', flat=True)}, {keep})
+        self.assertQuerySetEqual(
+            DividendRollup.objects.filter(record_count__gt=0).values_list('total_dividendo', 'record_count'),
+            [(80, 1)],
+        )
+        self.assertEqual(ChangeEvent.objects.filter(operation='delete').count(), 1)
+
+
+class DividendFactorTests(APIClientMixin, TestCase):
+    """Tabla dividend_factors sincronizada con factores_8_37 (miapp.factors)"""
+
+    url = '/api/dividend-maintainers/'
+
+    def factors(self, pk):
+        return dict(DividendFactor.objects.filter(dividend_id=pk).values_list('factor_no', 'valor'))
+
+    def create(self, instrumento, factores):
+        data = {**DIVIDEND, 'instrumento': instrumento, 'factores_8_37': factores}
+        return self.client.post(self.url, data, format='json').data['id']
+
+    def test_synced_on_create_update_and_bulk_writes(self):
+        pk = self.create('ACME', {'factor_1': '0.5', 'factor_2': {'nombre': 'Factor-9', 'valor': '0.25'}, 'factor_3': 'x'})
+        self.assertEqual(self.factors(pk), {8: Decimal('0.5'), 9: Decimal('0.25')})
+
+        self.client.patch(f'{self.url}{pk}/', {'factores_8_37': {'factor_3': '1.5'}}, format='json')
+        self.assertEqual(self.factors(pk), {10: Decimal('1.5')})
+
+        response = self.client.post(f'{self.url}bulk/', [
+            {**DIVIDEND, 'factores_8_37': {'factor_30': '2'}},
+            {**DIVIDEND, 'instrumento': 'BETA', 'factores_8_37': {'factor_1': '0.1'}},
+        ], format='json')
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1), response.data)
+        self.assertEqual(self.factors(pk), {37: Decimal('2')})
+        beta = DividendMaintainer.objects.get(instrumento='BETA').pk
+        self.assertEqual(self.factors(beta), {8: Decimal('0.1')})
+
+    def test_rolled_back_with_a_failed_write(self):
+        pk = self.create('ACME', {'factor_1': '0.5'})
+        with mock.patch('miapp.views.record_change', side_effect=DatabaseError('fallo simulado')):
+            with self.assertRaises(DatabaseError):
+                self.client.patch(f'{self.url}{pk}/', {'factores_8_37': {'factor_2': '0.9'}}, format='json')
+            with self.assertRaises(DatabaseError):
+                self.create('BETA', {'factor_1': '0.1'})
+        self.assertEqual(self.factors(pk), {8: Decimal('0.5')})
+        self.assertEqual(DividendFactor.objects.count(), 1)
+
+    def test_filters_and_ordering(self):
+        ids = {
+            'ACME': self.create('ACME', {'factor_1': '0.5'}),
+            'BETA': self.create('BETA', {'factor_1': '0.25', 'factor_2': '3'}),
+            'GAMA': self.create('GAMA', {}),
+        }
+        cases = [
+            ({'factor_8_min': '0.3'}, ['ACME']),
+            ({'factor_8_max': '0.3'}, ['BETA']),
+            ({'factor_8': '0.25', 'factor_9_min': '1'}, ['BETA']),
+            ({'ordering': 'factor_8'}, ['BETA', 'ACME', 'GAMA']),
+            ({'ordering': '-factor_8'}, ['ACME', 'BETA', 'GAMA']),
+        ]
+        for params, expected in cases:
+            response = self.client.get(self.url, params)
+            self.assertEqual([row['id'] for row in response.data['results']], [ids[name] for name in expected], params)
+        for params in ({'factor_7_min': '0'}, {'factor_8': 'uno'}, {'ordering': 'factor_38'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+    def test_rebuild_command(self):
+        pk = self.create('ACME', {'factor_1': '0.5'})
+        DividendMaintainer.objects.filter(pk=pk).update(factores_8_37={'factor_4': '0.75'})
+        self.create('BETA', {'factor_1': '0.1'})
+        DividendFactor.objects.filter(dividend_id=pk).delete()
+        output = io.StringIO()
+        call_command('rebuild_dividend_factors', batch_size=1, stdout=output)
+        self.assertIn('Factores sincronizados para 2 dividendos', output.getvalue())
+        self.assertEqual(self.factors(pk), {11: Decimal('0.75')})
+        self.assertEqual(DividendFactor.objects.count(), 2)
+
+
+class DividendExportTests(APIClientMixin, TestCase):
+    """GET /api/dividend-maintainers/export/ (miapp.exports)"""
+
+    url = '/api/dividend-maintainers/export/'
+
+    def setUp(self):
+        super().setUp()
+        for instrumento in ('ACME', 'BETA', 'GAMA'):
+            self.client.post('/api/dividend-maintainers/', {**DIVIDEND, 'instrumento': instrumento}, format='json')
+        self.client.post('/api/dividend-maintainers/', {**DIVIDEND, 'periodo_comercial': 2023}, format='json')
+
+    def test_csv_flattens_factors_into_columns(self):
+        # factores_8_37['factor_1'] es el Factor-8 del SII: columna factor_8
+        response = self.client.get(self.url, {'periodo_comercial': 2024})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="dividendos_2024.csv"')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(list(rows[0]), [name for name, _ in dividend_export_columns()])
+        self.assertEqual(sorted(row['instrumento'] for row in rows), ['ACME', 'BETA', 'GAMA'])
+        self.assertEqual(
+            (rows[0]['factor_8'], rows[0]['factor_9'], rows[0]['factor_10'], rows[0]['dividendo']),
+            ('0.5', '0.25', '', '150.00'),
+        )
+
+    def test_parquet_round_trip(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow no está instalado')
+        response = self.client.get(self.url, {'periodo_comercial': 2024, 'format': 'parquet'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="dividendos_2024.parquet"')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.schema.names, [name for name, _ in dividend_export_columns()])
+        self.assertEqual(
+            [str(table.schema.field(name).type) for name in ('periodo_comercial', 'fecha_pago_dividendo', 'dividendo', 'factor_8')],
+            ['int32', 'date32[day]', 'decimal128(15, 2)', 'double'],
+        )
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(sorted(table.column('factor_8').to_pylist()), [0.5, 0.5, 0.5])
+
+        # Un row group cada row_group_size filas
+        output = io.BytesIO()
+        queryset = DividendMaintainer.objects.filter(periodo_comercial=2024).order_by('pk')
+        self.assertEqual(write_dividend_parquet(queryset, output, chunk_size=2, row_group_size=2), 3)
+        metadata = pq.ParquetFile(io.BytesIO(output.getvalue())).metadata
+        self.assertEqual(
+            [metadata.row_group(index).num_rows for index in range(metadata.num_row_groups)], [2, 1],
+        )
+
+    def test_rejects_other_formats(self):
+        response = self.client.get(self.url, {'periodo_comercial': 2024, 'format': 'json'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('csv o parquet', response.data['error'])
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+class DeltaExportTests(APIClientMixin, TestCase):
+    """Exportación delta con ?updated_since= / ?watermark= (miapp.exports.DeltaWindow)"""
+
+    url = '/api/dividend-maintainers/export/'
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.since = now - timedelta(hours=2)
+        self.tied = now - timedelta(hours=1)
+        # Dos filas con el mismo updated_at, una anterior y una todavía dentro del margen de asentamiento
+        times = {'ACME': self.tied, 'BETA': self.tied, 'GAMA': now - timedelta(minutes=90), 'NUEVA': now}
+        self.ids = {}
+        for instrumento, updated_at in times.items():
+            pk = self.client.post('/api/dividend-maintainers/', {**DIVIDEND, 'instrumento': instrumento}, format='json').data['id']
+            DividendMaintainer.objects.filter(pk=pk).update(updated_at=updated_at)
+            self.ids[instrumento] = pk
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+    def test_resumes_from_watermark_with_ties(self):
+        rows = self.export(updated_since=self.since.isoformat())
+        tied = sorted([self.ids['ACME'], self.ids['BETA']])
+        self.assertEqual([row['id'] for row in rows], [self.ids['GAMA']] + tied)
+        self.assertEqual(list(rows[0])[-2:], ['updated_at', 'watermark'])
+        # Reanudar desde cada fila entrega exactamente las siguientes, también entre filas empatadas
+        for position, row in enumerate(rows):
+            resumed = self.export(watermark=row['watermark'])
+            self.assertEqual([resumed_row['id'] for resumed_row in resumed], tied[position:])
+
+        updated_at, pk = decode_watermark(rows[1]['watermark'], DividendMaintainer)
+        self.assertEqual((updated_at, str(pk)), (self.tied, tied[0]))
+        window = DeltaWindow(updated_since=self.since, position=(updated_at, pk))
+        chunks = list(window.chunks(DividendMaintainer.objects.values('pk', 'updated_at'), chunk_size=1))
+        self.assertEqual([[str(row['pk']) for row in chunk] for chunk in chunks], [[tied[1]]])
+
+    def test_settle_cutoff(self):
+        self.assertNotIn(self.ids['NUEVA'], [row['id'] for row in self.export(updated_since=self.since.isoformat())])
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=0):
+            rows = self.export(updated_since=self.since.isoformat())
+        self.assertEqual(rows[-1]['id'], self.ids['NUEVA'])
+
+    def test_tax_grade_json_delta_ends_with_watermark(self):
+        self.client.post('/api/tax-grades/', TAX_GRADE, format='json')
+        TaxGrade.objects.update(updated_at=self.tied)
+        url = '/api/tax-grades/export/'
+        data = json.loads(b''.join(self.client.get(url, {'updated_since': self.since.isoformat()}).streaming_content))
+        self.assertEqual(len(data['data']), 1)
+        self.assertEqual(data['watermark'], data['data'][0]['watermark'])
+        data = json.loads(b''.join(self.client.get(url, {'watermark': data['watermark']}).streaming_content))
+        self.assertEqual(data['data'], [])
+
+    def test_invalid_parameters(self):
+        for url, params in [
+            (self.url, {'watermark': 'no-es-un-watermark'}),
+            (self.url, {'updated_since': 'ayer'}),
+            ('/api/tax-grades/export/', {'watermark': 'no-es-un-watermark'}),
+            (self.url, {'updated_since': self.since.isoformat(), 'layout': 'columnar'}),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(response.data['error'], 'La exportación delta no admite layout=columnar')
+
+
+class ImportRollbackTests(APIClientMixin, TestCase):
+    """POST /api/imports/{id}/rollback/ (miapp.rollback)"""
+
+    def import_file(self, process, content):
+        import_obj = make_import(self.user)
+        process(content.encode('utf-8'), import_obj, self.user)
+        import_obj.status = 'done'
+        import_obj.save()
+        return import_obj
+
+    def rollback(self, import_obj, **params):
+        return self.client.post(f'/api/imports/{import_obj.pk}/rollback/', params, format='json')
+
+    def assertTotalsMatchRows(self, rollup_model, source_model, group_fields, total_field, source_field):
+        """La tabla de totales coincide con el GROUP BY de los registros"""
+        totals = rollup_model.objects.filter(record_count__gt=0).values_list(*group_fields, total_field, 'record_count')
+        rows = (
+            source_model.objects.values(*group_fields)
+            .annotate(total=Sum(source_field), count=Count('pk'))
+            .values_list(*group_fields, 'total', 'count')
+        )
+        self.assertEqual(set(totals), set(rows))
+
+    def assertTaxGradeSummaryMatches(self):
+        self.assertTotalsMatchRows(
+            TaxGradeSummary, TaxGrade, ('year', 'source_type', 'fuente_ingreso', 'status'), 'total_amount', 'amount',
+        )
+
+    def test_restores_updated_and_deletes_created_tax_grades(self):
+        self.client.post('/api/tax-grades/', TAX_GRADE, format='json')
+        import_obj = self.import_file(process_csv_file, TAX_GRADE_CSV.replace('1000', '1500'))
+
+        response = self.rollback(import_obj, preview=True)
+        self.assertEqual((response.data['restored'], response.data['deleted']), (1, 1))
+        self.assertEqual(TaxGrade.objects.count(), 2)
+
+        response = self.rollback(import_obj)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            (response.data['restored'], response.data['deleted'], response.data['status']), (1, 1, 'rolled_back'),
+        )
+        tax_grade = TaxGrade.objects.get()
+        self.assertEqual((tax_grade.rut_normalizado, tax_grade.amount), ('123456785', 1000))
+        self.assertTaxGradeSummaryMatches()
+        # Una importación revertida no se vuelve a revertir
+        self.assertEqual(self.rollback(import_obj).status_code, 409)
+
+    def test_records_changed_after_the_import_need_force(self):
+        pk = self.client.post('/api/tax-grades/', TAX_GRADE, format='json').data['id']
+        import_obj = self.import_file(process_csv_file, TAX_GRADE_CSV.replace('1000', '1500'))
+        self.client.patch(f'/api/tax-grades/{pk}/', {'amount': '1700.00'}, format='json')
+
+        response = self.rollback(import_obj)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflict_ids'], [str(pk)])
+        # Sin force no se revierte nada
+        self.assertEqual(TaxGrade.objects.count(), 2)
+        self.assertEqual(TaxGrade.objects.get(pk=pk).amount, 1700)
+
+        response = self.rollback(import_obj, force=True)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['deleted'], response.data['status']), (1, 'rolled_back'))
+        self.assertEqual(TaxGrade.objects.get().amount, 1000)
+        self.assertTaxGradeSummaryMatches()
+
+    def test_restores_dividends_and_their_rollups(self):
+        pk = self.client.post('/api/dividend-maintainers/', DIVIDEND, format='json').data['id']
+        import_obj = self.import_file(process_dividend_csv, DIVIDEND_CSV.replace(',150,', ',175,'))
+        self.assertEqual(DividendMaintainer.objects.count(), 2)
+
+        response = self.rollback(import_obj)
+        self.assertEqual(response.status_code, 200, response.data)
+        dividend = DividendMaintainer.objects.get()
+        self.assertEqual((str(dividend.pk), dividend.dividendo), (pk, 150))
+        self.assertTotalsMatchRows(
+            DividendRollup, DividendMaintainer, ('periodo_comercial', 'tipo_mercado', 'origen_informacion'),
+            'total_dividendo', 'dividendo',
+        )
+        self.assertEqual({str(pk) for pk in DividendFactor.objects.values_list('dividend_id', flat=True)}, {pk})
+
+
+class BulkUpsertTests(APIClientMixin, TestCase):
+    """POST /api/tax-grades/bulk/ y /api/dividend-maintainers/bulk/ (miapp.bulk)"""
+
+    def test_tax_grades_get_one_result_per_item(self):
+        pk = self.client.post('/api/tax-grades/', TAX_GRADE, format='json').data['id']
+        unchanged = {**TAX_GRADE, 'rut': '9.876.543-3'}
+        self.client.post('/api/tax-grades/', unchanged, format='json')
+        response = self.client.post('/api/tax-grades/bulk/', [
+            {**TAX_GRADE, 'rut': '12345678-5', 'amount': '1500.00'},
+            {**TAX_GRADE, 'amount': '1600.00'},
+            {**TAX_GRADE, 'rut': '11.111.111-1'},
+            {**TAX_GRADE, 'year': 'no es un año'},
+            unchanged,
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['updated', 'error', 'created', 'error', 'unchanged'],
+        )
+        self.assertIn('Llave duplicada', str(response.data['results'][1]['errors']))
+        self.assertIn('year', response.data['results'][3]['errors'])
+        self.assertEqual(
+            {key: response.data[key] for key in ('total', 'created', 'updated', 'unchanged', 'error')},
+            {'total': 5, 'created': 1, 'updated': 1, 'unchanged': 1, 'error': 2},
+        )
+        tax_grade = TaxGrade.objects.get(pk=pk)
+        self.assertEqual((tax_grade.amount, tax_grade.version), (1500, 2))
+        self.assertEqual(TaxGrade.objects.count(), 3)
+        self.assertEqual(
+            TaxGradeSummary.objects.aggregate(total=Sum('total_amount'), count=Sum('record_count')),
+            {'total': 3500, 'count': 3},
+        )
+        # Un evento del feed por registro escrito (los dos POST + creado + actualizado)
+        self.assertEqual(ChangeEvent.objects.count(), 4)
+
+    @override_settings(BULK_WRITE_CHUNK_SIZE=1)
+    def test_failed_chunk_is_rolled_back_and_reported(self):
+        items = [{**DIVIDEND, 'instrumento': name} for name in ('ACME', 'BETA', 'GAMA')]
+        with mock.patch('miapp.bulk.record_changes', side_effect=[None, DatabaseError('fallo simulado'), None]), \
+                self.assertLogs('miapp.bulk', 'ERROR'):
+            response = self.client.post('/api/dividend-maintainers/bulk/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'error', 'created'])
+        self.assertEqual(
+            set(DividendMaintainer.objects.values_list('instrumento', flat=True)), {'ACME', 'GAMA'},
+        )
+        self.assertEqual(DividendRollup.objects.get().record_count, 2)
+        self.assertEqual(DividendFactor.objects.count(), 4)
+
+
+class StreamIngestTests(APIClientMixin, TestCase):
+    """POST /api/ingest/{entidad}/ con NDJSON (miapp.ingest)"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = Path(tempfile.mkdtemp())
+        (media_root / 'reports').mkdir()
+        settings_override = override_settings(MEDIA_ROOT=media_root, REPORTS_DIR=media_root / 'reports')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def ingest(self, lines, content_type='application/x-ndjson'):
+        return self.client.generic('POST', '/api/ingest/tax-grades/', '\n'.join(lines), content_type=content_type)
+
+    @override_settings(INGEST_MAX_LINE_LENGTH=300)
+    def test_each_line_gets_its_own_result(self):
+        response = self.ingest([
+            json.dumps(TAX_GRADE),
+            '{"rut": ',
+            '[1, 2]',
+            json.dumps({**TAX_GRADE, 'rut': '11.111.111-1', 'year': 'no es un año'}),
+            '',
+            json.dumps({**TAX_GRADE, 'amount': '1500.00'}),
+            json.dumps({**TAX_GRADE, 'name': 'x' * 400}),
+        ])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            {key: response.data[key] for key in ('status', 'total', 'created', 'updated', 'error')},
+            {'status': 'done', 'total': 6, 'created': 1, 'updated': 1, 'error': 4},
+        )
+        records = {
+            record.row_number_or_page: record
+            for record in ImportRecord.objects.filter(import_id=response.data['import_id'])
+        }
+        self.assertEqual(
+            {number: record.status for number, record in records.items()},
+            {1: 'success', 2: 'error', 3: 'error', 4: 'error', 6: 'success', 7: 'error'},
+        )
+        self.assertIn('JSON inválido', records[2].error_message)
+        self.assertIn('Se espera un objeto JSON', records[3].error_message)
+        self.assertIn('year', records[4].error_message)
+        self.assertIn('300 bytes', records[7].error_message)
+        # La línea 6 repite la llave de la 1: se aplica después, como actualización
+        self.assertEqual((records[1].operation, records[6].operation), ('create', 'update'))
+        self.assertEqual(TaxGrade.objects.get().amount, 1500)
+
+    def test_requires_ndjson_content_type(self):
+        response = self.ingest([json.dumps(TAX_GRADE)], content_type='application/json')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(TaxGrade.objects.exists())
+
+
+class AuditTimelineTests(APIClientMixin, TestCase):
+    """Historial de auditoría por registro, RUT o instrumento (miapp.audit)"""
+
+    def setUp(self):
+        super().setUp()
+        self.tax_grade = self.client.post('/api/tax-grades/', TAX_GRADE, format='json').data['id']
+        self.client.patch(f'/api/tax-grades/{self.tax_grade}/', {'amount': '2000.00'}, format='json')
+        self.client.post('/api/tax-grades/', {**TAX_GRADE, 'rut': '11.111.111-1', 'year': 2023}, format='json')
+        self.dividend = self.client.post('/api/dividend-maintainers/', DIVIDEND, format='json').data['id']
+
+    def test_record_audit_is_a_list_unless_keyset_is_requested(self):
+        url = f'/api/tax-grades/{self.tax_grade}/audit/'
+        response = self.client.get(url)
+        self.assertEqual([log['action'] for log in response.data], ['update', 'create'])
+
+        response = self.client.get(url, {'pagination': 'keyset', 'page_size': 1})
+        self.assertEqual([log['action'] for log in response.data['results']], ['update'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([log['action'] for log in response.data['results']], ['create'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len(self.client.get(url, {'action': 'create'}).data), 1)
+
+    def test_timeline_filters(self):
+        url = '/api/audit-logs/timeline/'
+        cases = [
+            ({'rut': '12345678-5'}, [('tax_grades', 'update'), ('tax_grades', 'create')]),
+            ({'rut': '12.345.678-5', 'action': 'create'}, [('tax_grades', 'create')]),
+            ({'rut': '11111111-1', 'year': 2024}, []),
+            ({'instrumento': 'ACME'}, [('dividend_maintainers', 'create')]),
+            ({'entity_id': self.dividend, 'entity': 'dividend_maintainers'}, [('dividend_maintainers', 'create')]),
+        ]
+        for params, expected in cases:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, params)
+            self.assertEqual([(log['entity'], log['action']) for log in response.data['results']], expected, params)
+        self.assertEqual(self.client.get(url, {'year': 2024}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'rut': '12345678-5', 'year': 'x'}).status_code, 400)
+
+    def test_backfill_audit_keys_command(self):
+        # Entradas anteriores a las columnas de búsqueda; una sin estados (se lee del registro)
+        AuditLog.objects.update(rut='', instrumento='', year=None)
+        bare = AuditLog.objects.create(
+            user_id=self.user, entity='dividend_maintainers', entity_id=self.dividend, action='update',
+        )
+        AuditLog.objects.filter(pk=bare.pk).update(rut='', instrumento='', year=None)
+        output = io.StringIO()
+        call_command('backfill_audit_keys', chunk_size=2, stdout=output)
+        self.assertIn('Entradas de auditoría actualizadas: 5', output.getvalue())
+        self.assertEqual(
+            set(AuditLog.objects.values_list('entity', 'rut', 'instrumento', 'year')),
+            {
+                ('tax_grades', '123456785', '', 2024),
+                ('tax_grades', '111111111', '', 2023),
+                ('dividend_maintainers', '', 'ACME', 2024),
+            },
+        )
+
+
+BEFORE = {
+    'rut': '12.345.678-5', 'amount': '1000.00', 'factor': None, 'count': 1, 'active': True, 'ratio': 1.0,
+    'removed': 'x', 'factores_8_37': {'factor_1': '0.5', 'factor_2': '0.25', 'factor_3': '0.1'},
+}
+AFTER = {
+    'rut': '12.345.678-5', 'amount': '1500.00', 'factor': '0.3', 'count': True, 'active': 1, 'ratio': 1,
+    'added': [1, 2], 'factores_8_37': {'factor_1': '0.5', 'factor_2': '0.75', 'factor_4': '0.2'},
+}
+
+
+class AuditPayloadTests(TestCase):
+    """Diferencias comprimidas de before/after en audit_logs (miapp.diffs)"""
+
+    def assertRoundTrip(self, before, after):
+        data = encode_payload(before, after)
+        self.assertIsNotNone(data)
+        decoded = decode_payload(data)
+        # En Python 1 == 1.0 == True: se compara el JSON para verificar también los tipos
+        self.assertEqual(json.dumps(decoded, sort_keys=True), json.dumps((before, after), sort_keys=True))
+        return data
+
+    def test_update_diff_round_trip(self):
+        data = self.assertRoundTrip(BEFORE, AFTER)
+        self.assertEqual(data[:1], PLAIN)
+        # Cada campo va una sola vez: el RUT sin cambios no se repite
+        self.assertEqual(data.count(b'12.345.678-5'), 1)
+
+    @override_settings(AUDIT_PAYLOAD_COMPRESS_MIN_BYTES=0)
+    def test_compressed_round_trip(self):
+        self.assertNotEqual(self.assertRoundTrip(BEFORE, AFTER)[:1], PLAIN)
+        with mock.patch('miapp.diffs.zstandard', None):
+            self.assertEqual(self.assertRoundTrip(BEFORE, AFTER)[:1], ZLIB)
+            self.assertRoundTrip(None, AFTER)
+
+    def test_small_one_sided_payloads_stay_in_json_columns(self):
+        self.assertIsNone(encode_payload(None, {'rut': '12.345.678-5'}))
+        self.assertIsNone(encode_payload(None, None))
+        self.assertRoundTrip(None, {'name': 'x' * 1000})
+
+    def test_audit_log_reads_back_its_states(self):
+        created = AuditLog.objects.create(entity='tax_grades', entity_id='1', action='update', before=BEFORE, after=AFTER)
+        AuditLog.objects.bulk_create([
+            AuditLog(entity='tax_grades', entity_id='2', action='update', before=BEFORE, after=AFTER),
+        ])
+        # La instancia escrita conserva before/after en memoria
+        self.assertEqual((created.before, created.after), (BEFORE, AFTER))
+        for log in AuditLog.objects.all():
+            self.assertIsNone(log.before)
+            self.assertIsNone(log.after)
+            self.assertEqual((log.before_state, log.after_state), (BEFORE, AFTER))
+            self.assertEqual(log.rut, '123456785')
+
+
+class AuditArchiveTests(APIClientMixin, TestCase):
+    """Archivo mensual de audit_logs y su lectura desde el listado (miapp.archive)"""
+
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=400)
+        self.states = {}
+        for minute, (before, after) in enumerate([(None, BEFORE)] + [(BEFORE, {**AFTER, 'amount': n}) for n in range(4)]):
+            self.add_log(self.old + timedelta(minutes=minute), 'create' if before is None else 'update', before, after)
+        for minute in range(3):
+            self.add_log(timezone.now() - timedelta(minutes=minute), 'update', BEFORE, AFTER)
+
+    def add_log(self, timestamp, action, before, after):
+        log = AuditLog.objects.create(
+            user_id=self.user, entity='tax_grades', entity_id='1', action=action, before=before, after=after,
+        )
+        AuditLog.objects.filter(pk=log.pk).update(timestamp=timestamp)
+        self.states[str(log.pk)] = (before, after)
+
+    def archive(self):
+        moved = archive_audit_logs(cutoff=timezone.now() - timedelta(days=60), chunk_size=2)
+        self.assertEqual(sum(moved.values()), 5)
+        self.assertEqual(list(AuditLogArchive.objects.order_by('id').values_list('row_count', flat=True)), [2, 2, 1])
+
+    def test_round_trip_preserves_states(self):
+        # Las actualizaciones están guardadas como diferencia en `delta`
+        self.assertEqual(AuditLog.objects.filter(delta__isnull=False).count(), 7)
+        self.archive()
+        self.assertEqual(AuditLog.objects.count(), 3)
+        archived = ArchivedAuditLogs(self.old - timedelta(days=1), descending=False)
+        logs = archived[0:10]
+        self.assertEqual([log.action for log in logs], ['create'] + ['update'] * 4)
+        for log in logs:
+            self.assertEqual((log.before_state, log.after_state), self.states[str(log.pk)])
+            self.assertEqual((log.user_id, log.rut), (self.user, '123456785'))
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_listing_spans_hot_table_and_archive(self):
+        self.archive()
+        url = '/api/audit-logs/'
+        params = {'date_from': (self.old - timedelta(days=1)).isoformat()}
+        with mock.patch.object(PageNumberPagination, 'page_size', 3):
+            pages = [self.client.get(url, {**params, 'page': page}).data for page in (1, 2, 3)]
+            filtered = self.client.get(url, {**params, 'action': 'create'}).data
+        self.assertEqual([page['count'] for page in pages], [8, 8, 8])
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 2])
+        self.assertIsNone(pages[2]['next'])
+        timestamps = [log['timestamp'] for page in pages for log in page['results']]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual(len({log['id'] for page in pages for log in page['results']}), 8)
+        self.assertEqual(pages[2]['results'][-1]['after'], BEFORE)
+        self.assertEqual((filtered['count'], [log['action'] for log in filtered['results']]), (1, ['create']))
+
+    def test_count_decompresses_only_when_needed(self):
+        self.archive()
+        date_from = self.old - timedelta(days=1)
+        with mock.patch('miapp.archive.decode_rows', side_effect=decode_rows) as decode:
+            # Bloques completos en el rango y sin filtros: se cuentan con row_count
+            archived = ArchivedAuditLogs(date_from)
+            self.assertEqual(archived.count(), 5)
+            self.assertEqual(decode.call_count, 0)
+            # Una página descomprime solo sus bloques
+            self.assertEqual(len(archived[0:2]), 2)
+            self.assertEqual(decode.call_count, 2)
+
+            decode.reset_mock()
+            self.assertEqual(ArchivedAuditLogs(date_from, filters={'action': 'update'}).count(), 4)
+            self.assertEqual(decode.call_count, 3)
+            # Los conteos de los bloques quedan en caché para las páginas siguientes
+            self.assertEqual(ArchivedAuditLogs(date_from, filters={'action': 'update'}).count(), 4)
+            self.assertEqual(decode.call_count, 3)
+
+
+class StaticAssetTests(TestCase):
+    """Assets con hash de build_assets y la vista serve_asset (miapp.assets)"""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(STATIC_ASSETS_ROOT=Path(root.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_manifest_lookup(self):
+        # Sin build se usa el archivo original de static/
+        self.assertEqual(asset_url('js/app.js'), '/static/js/app.js')
+        target, _ = build_assets(['js/app.js'])['js/app.js']
+        self.assertRegex(target, r'^js/app\.[0-9a-f]{12}\.js$')
+        self.assertEqual(asset_url('js/app.js'), f'/assets/{target}')
+        self.assertEqual(asset_url('js/otro.js'), '/static/js/otro.js')
+        self.assertIn(f'src="/assets/{target}"', self.client.get('/').content.decode('utf-8'))
+
+    def test_serves_precompressed_variants_as_immutable(self):
+        target, variants = build_assets(['js/app.js'])['js/app.js']
+        url = f'/assets/{target}'
+        # br solo si la librería brotli está instalada
+        best = 'br' if 'br' in variants else 'gzip'
+        for accept_encoding, encoding in (('gzip, br', best), ('gzip', 'gzip'), ('', None)):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(response.get('Content-Encoding'), encoding, accept_encoding)
+            self.assertEqual(b''.join(response.streaming_content), variants[encoding or 'identity'])
+        # Solo se sirven los nombres del manifest
+        self.assertEqual(self.client.get('/assets/manifest.json').status_code, 404)
+        self.assertEqual(self.client.get('/assets/js/app.js').status_code, 404)
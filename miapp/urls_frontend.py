@@ -1,7 +1,10 @@
 from django.urls import path
-from .views_frontend import index
+
+from .assets import assets_url
+from .views_frontend import index, serve_asset
 
 urlpatterns = [
     path('', index, name='index'),
+    path(assets_url().lstrip('/') + '<path:path>', serve_asset, name='asset'),
 ]
 
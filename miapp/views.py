@@ -1,24 +1,37 @@
+import datetime
 import os
+import tempfile
 import threading
+from decimal import Decimal
 from io import BytesIO
-from django.http import FileResponse, JsonResponse
-from django.db.models import Q
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Prefetch, Q, Count, Sum
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import TaxGrade, Import, ImportRecord, AuditLog, DividendMaintainer
+from .models import (
+    TaxGrade, TaxGradeSummary, Import, ImportRecord, AuditLog, DividendMaintainer,
+    DividendRollup, DividendInstrumentSeries,
+)
 from .serializers import (
-    TaxGradeSerializer, TaxGradeListSerializer,
-    ImportSerializer, AuditLogSerializer, ImportFileSerializer,
+    TaxGradeSerializer, TaxGradeListSerializer, TaxGradeBulkSerializer,
+    ImportSerializer, ImportRecordSerializer, AuditLogSerializer, ImportFileSerializer,
     UserRegistrationSerializer,
-    DividendMaintainerSerializer, DividendMaintainerListSerializer
+    DividendMaintainerSerializer, DividendMaintainerListSerializer, DividendMaintainerBulkSerializer
 )
 from .services import (
     calculate_file_hash, get_file_type, process_csv_file,
@@ -26,6 +39,34 @@ from .services import (
     generate_import_report, detect_file_type_by_columns,
     process_dividend_csv, process_dividend_excel
 )
+from .exports import DeltaWindow, parse_timestamp, stream_dividend_csv, stream_json_delta, write_dividend_parquet
+from .archive import ARCHIVE_FILTERS, ArchivedAuditLogs, CombinedAuditLogs, archive_horizon
+from .audit import audit_key_filters
+from .declarations import (
+    LAYOUTS, DeclarationFieldOverflow, get_layout, write_declaration, declaration_file_name,
+)
+from .renderers import CSVExportRenderer, ParquetExportRenderer, MessagePackRenderer, available_renderer_classes
+from .pagination import KeysetPagination, KeysetPaginationMixin, wants_keyset_pagination
+from .fieldsets import SparseFieldsetMixin
+from .fastlist import FastListMixin, build_row_plan
+from .columnar import FACTORS_FIELD, SII_FIELD, columnar_payload, factor_matrix, sii_matrix, wants_columnar
+from .search import FullTextSearchFilter, index_search_documents, remove_search_documents
+from .factors import FACTOR_PARAM_RE, DividendFactorFilter, sync_dividend_factors
+from .rut import normalize_rut, normalize_rut_prefix
+from .cache import CachedResponseMixin
+from .bulk import (
+    BulkFilterMixin, DividendBulkUpsert, TaxGradeBulkUpsert, deactivate_tax_grades, delete_dividends,
+    is_truthy, parse_bulk_items,
+)
+from .conditional import ConditionalGetMixin, OptimisticConcurrencyMixin, PreconditionFailed
+from .rollback import rollback_import
+from .ingest import StreamIngestMixin
+from .changes import acknowledge, parse_cursor, parse_limit, read_changes, record_change
+from .summaries import (
+    SUMMARY_GROUP_FIELDS, DIVIDEND_ROLLUP, DIVIDEND_ROLLUP_GROUP_FIELDS, dividend_snapshot,
+    downsample_series, record_dividend_rollup_change, record_summary_change, summary_snapshot,
+    summary_totals,
+)
 from django.conf import settings
 import logging
 
@@ -81,7 +122,9 @@ class UserRegistrationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TaxGradeViewSet(viewsets.ModelViewSet):
+class TaxGradeViewSet(ConditionalGetMixin, OptimisticConcurrencyMixin, CachedResponseMixin, BulkFilterMixin,
+                      StreamIngestMixin, SparseFieldsetMixin, FastListMixin, KeysetPaginationMixin,
+                      viewsets.ModelViewSet):
     """
     ViewSet para TaxGrade con CRUD completo y búsqueda avanzada.
     
@@ -91,16 +134,46 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
     - POST /api/tax-grades/ - Crear
     - PUT /api/tax-grades/{id}/ - Actualizar
     - DELETE /api/tax-grades/{id}/ - Marcar como inactivo
-    - GET /api/tax-grades/export/ - Exportar histórico
+    - POST /api/tax-grades/bulk/ - Crear o actualizar en lote (miapp.bulk)
+    - POST /api/tax-grades/bulk-deactivate/ - Marcar como inactivos los que cumplen los filtros
+    - POST /api/ingest/tax-grades/ - Ingesta NDJSON en streaming (miapp.ingest)
+    - GET /api/tax-grades/export/ - Exportar histórico (?updated_since=/?watermark=: solo lo modificado)
+    - GET /api/tax-grades/stats/ - Totales por año/tipo/fuente/estado
+    
+    Con ?pagination=keyset el listado se pagina por cursor (next/previous) en el
+    orden -year, rut, id; con ?ordering= distinto o ?search= responde 400.
+    Listado y detalle se sirven desde la caché versionada por año (miapp.cache)
+    y responden 304 a If-None-Match; las escrituras aceptan If-Match y usan
+    concurrencia optimista sobre `version` (miapp.conditional).
     """
     
     queryset = TaxGrade.objects.all()
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['rut', 'year', 'source_type', 'status']
+    cache_entity = 'tax_grades'
+    cache_year_param = 'year'
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
+    filterset_fields = ['year', 'source_type', 'status']
     search_fields = ['rut', 'name', 'calculation_basis']
     ordering_fields = ['year', 'rut', 'created_at', 'amount']
     ordering = ['-year', 'rut']
+    bulk_filter_params = (
+        'year', 'source_type', 'status', 'rut', 'rut_prefix', 'year_from', 'year_to',
+        'date_from', 'date_to', 'search',
+    )
+    bulk_writer_class = TaxGradeBulkUpsert
+    bulk_serializer_class = TaxGradeBulkSerializer
+    keyset_ordering = ('-year', 'rut', 'id')
+    # Consultas SQL máximas por acción (incluye la carga del usuario del JWT),
+    # verificadas en miapp.tests.QueryBudgetTests. Las escrituras se miden en
+    # el peor caso: cambio de grupo de tax_grade_summaries (dos UPDATE más el
+    # INSERT del grupo nuevo con su SAVEPOINT), INSERT en change_events y en
+    # audit_logs, más la actualización del índice de trigramas (SEARCH_BACKEND
+    # 'auto' fuera de MySQL; con FULLTEXT el índice no cuesta consultas) y el
+    # SAVEPOINT si la request corre dentro de otra transacción.
+    query_budgets = {
+        'list': 4, 'retrieve': 3, 'create': 12, 'update': 14,
+        'partial_update': 11, 'destroy': 12, 'audit': 3, 'export': 3, 'stats': 2,
+    }
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -111,6 +184,12 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
         """Filtros adicionales por query params"""
         queryset = super().get_queryset()
         
+        # El listado solo lee las columnas pedidas (?fields=); el detalle resuelve los usernames en el mismo JOIN
+        if self.action == 'list':
+            queryset = self.only_fieldset(queryset)
+        else:
+            queryset = queryset.select_related('created_by', 'updated_by')
+        
         # --- INICIO DEL CAMBIO ---
         # Si el frontend NO está pidiendo un estado específico (ej: buscando 'inactivo'),
         # entonces filtramos por defecto para mostrar SOLO los 'activo'.
@@ -120,6 +199,16 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(status='activo')
         # --- FIN DEL CAMBIO ---
 
+        # Filtros por RUT sobre la columna normalizada (indexada con el año):
+        # ?rut= acepta cualquier formato (12.345.678-5, 123456785) y
+        # ?rut_prefix= busca por comienzo del cuerpo (LIKE '1234%')
+        rut = self.request.query_params.get('rut')
+        if rut:
+            queryset = queryset.filter(rut_normalizado=normalize_rut(rut))
+        rut_prefix = normalize_rut_prefix(self.request.query_params.get('rut_prefix'))
+        if rut_prefix:
+            queryset = queryset.filter(rut_normalizado__startswith=rut_prefix)
+        
         # Filtro por rango de años (Código original)
         year_from = self.request.query_params.get('year_from')
         year_to = self.request.query_params.get('year_to')
@@ -138,6 +227,7 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    @transaction.atomic
     def perform_create(self, serializer):
         """Crear TaxGrade y registrar auditoría"""
         # Si no se especifica fuente_ingreso, marcar como manual
@@ -148,6 +238,10 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
             created_by=self.request.user,
             updated_by=self.request.user
         )
+        index_search_documents([tax_grade])
+        record_summary_change(after=summary_snapshot(tax_grade))
+        record_change(tax_grade, 'create')
+        self.invalidate_cache(tax_grade.year)
         
         # Registrar auditoría
         AuditLog.objects.create(
@@ -161,17 +255,24 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
             timestamp=timezone.now()
         )
     
+    @transaction.atomic
     def perform_update(self, serializer):
-        """Actualizar TaxGrade y registrar auditoría"""
-        instance = self.get_object()
+        """Actualizar TaxGrade (UPDATE condicional por versión) y registrar auditoría"""
+        instance = serializer.instance
         before = self._serialize_model(instance)
+        before_snapshot = summary_snapshot(instance)
+        previous_year = instance.year
         
         # Preservar fuente_ingreso original (no se puede cambiar desde el frontend)
         # El campo es read_only en el serializer, pero por seguridad lo preservamos aquí también
         if 'fuente_ingreso' in serializer.validated_data:
             serializer.validated_data['fuente_ingreso'] = instance.fuente_ingreso
         
-        tax_grade = serializer.save(updated_by=self.request.user)
+        tax_grade = self.save_versioned(serializer, updated_by=self.request.user)
+        index_search_documents([tax_grade])
+        record_summary_change(before_snapshot, summary_snapshot(tax_grade))
+        record_change(tax_grade, 'update')
+        self.invalidate_cache(previous_year, tax_grade.year)
         after = self._serialize_model(tax_grade)
         
         # Registrar auditoría
@@ -187,11 +288,18 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
             timestamp=timezone.now()
         )
     
+    @transaction.atomic
     def perform_destroy(self, instance):
         """Marcar como inactivo en lugar de borrar"""
+        before_snapshot = summary_snapshot(instance)
         instance.status = 'inactivo'
         instance.updated_by = self.request.user
-        instance.save()
+        if not instance.save_if_version(self.expected_version, ['status', 'updated_by']):
+            raise PreconditionFailed()
+        record_summary_change(before_snapshot, summary_snapshot(instance))
+        # Para el feed es un update: el registro sigue existiendo (inactivo)
+        record_change(instance, 'update')
+        self.invalidate_cache(instance.year)
         
         # Registrar auditoría
         AuditLog.objects.create(
@@ -206,21 +314,65 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
             timestamp=timezone.now()
         )
     
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Crear o actualizar calificaciones en lote por (RUT, año), con un resultado por ítem"""
+        items = parse_bulk_items(request.data)
+        validated = TaxGradeBulkSerializer(many=True, context=self.get_serializer_context()).validate_items(items)
+        writer = TaxGradeBulkUpsert(
+            request.user, self._serialize_model,
+            ip_address=self._get_client_ip(), user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+        return Response(writer.run(validated))
+    
+    @action(detail=False, methods=['post'], url_path='bulk-deactivate')
+    def bulk_deactivate(self, request):
+        """Marcar como inactivas (un solo UPDATE) las calificaciones activas que cumplen los filtros"""
+        preview, expected_count = self.bulk_options()
+        return Response(deactivate_tax_grades(
+            self.bulk_filter_queryset(), request.user,
+            ip_address=self._get_client_ip(), user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            preview=preview, expected_count=expected_count,
+        ))
+    
     @action(detail=True, methods=['get'])
     def audit(self, request, pk=None):
-        """Obtener logs de auditoría para un TaxGrade específico"""
+        """
+        Logs de auditoría de un TaxGrade (lista completa, más recientes primero).
+        Con ?pagination=keyset se paginan por cursor (-timestamp, id).
+        """
         tax_grade = self.get_object()
         logs = AuditLog.objects.filter(
             entity='tax_grades',
             entity_id=str(tax_grade.id)
-        ).order_by('-timestamp')
+        ).select_related('user_id')
+        
+        action_param = request.query_params.get('action')
+        if action_param:
+            logs = logs.filter(action=action_param)
+        
+        if not wants_keyset_pagination(request):
+            serializer = AuditLogSerializer(logs.order_by('-timestamp', 'id'), many=True)
+            return Response(serializer.data)
         
-        serializer = AuditLogSerializer(logs, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(AuditLogViewSet.keyset_ordering)
+        page = paginator.paginate_queryset(logs, request, view=self)
+        serializer = AuditLogSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def export(self, request):
-        """Exportar histórico de TaxGrade (solo años activos)"""
+        """
+        Exportar histórico de TaxGrade (solo años activos). Con ?updated_since=
+        o ?watermark= entrega en streaming solo lo modificado (ver _delta_export).
+        """
+        try:
+            delta = DeltaWindow.from_params(request.query_params, TaxGrade)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if delta is not None:
+            return self._delta_export(delta)
+        
         year = request.query_params.get('year')
         if not year:
             return Response(
@@ -245,6 +397,68 @@ class TaxGradeViewSet(viewsets.ModelViewSet):
             'data': serializer.data
         })
     
+    def _delta_export(self, delta):
+        """
+        Calificaciones modificadas desde la marca de agua (de cualquier estado,
+        filtros opcionales year y status) en orden (updated_at, id), en
+        streaming. Cada fila y el final de la respuesta traen `watermark`.
+        """
+        queryset = TaxGrade.objects.select_related('created_by', 'updated_by')
+        year = self.request.query_params.get('year')
+        if year:
+            try:
+                queryset = queryset.filter(year=int(year))
+            except ValueError:
+                return Response({'error': 'Año inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        status_param = self.request.query_params.get('status')
+        if status_param:
+            queryset = queryset.filter(status=status_param)
+        
+        return StreamingHttpResponse(
+            stream_json_delta(queryset, delta, lambda chunk: TaxGradeSerializer(chunk, many=True).data),
+            content_type='application/json'
+        )
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Totales de amount y cantidad de registros desde la tabla de resumen.
+        Filtros: year, year_from, year_to, source_type, fuente_ingreso, status.
+        ?group_by= elige las columnas de agrupación (por defecto todas).
+        """
+        group_by = [
+            name.strip() for name in request.query_params.get('group_by', '').split(',') if name.strip()
+        ] or list(SUMMARY_GROUP_FIELDS)
+        invalid = [name for name in group_by if name not in SUMMARY_GROUP_FIELDS]
+        if invalid:
+            return Response(
+                {'error': f"group_by inválido: {', '.join(invalid)}. Opciones: {', '.join(SUMMARY_GROUP_FIELDS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = TaxGradeSummary.objects.all()
+        try:
+            for param, lookup in (('year', 'year'), ('year_from', 'year__gte'), ('year_to', 'year__lte')):
+                value = request.query_params.get(param)
+                if value:
+                    queryset = queryset.filter(**{lookup: int(value)})
+        except ValueError:
+            return Response({'error': 'Año inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        for param in ('source_type', 'fuente_ingreso', 'status'):
+            value = request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        
+        results = list(summary_totals(queryset, group_by))
+        return Response({
+            'group_by': group_by,
+            'results': results,
+            'totals': {
+                'total_amount': sum((row['total_amount'] for row in results), Decimal(0)),
+                'record_count': sum(row['record_count'] for row in results),
+            },
+        })
+    
     def _serialize_model(self, instance):
         """Serializar instancia para auditoría"""
         return {
@@ -277,6 +491,8 @@ class ImportViewSet(viewsets.ModelViewSet):
     - GET /api/imports/ - Listar imports
     - GET /api/imports/{id}/ - Detalle de import
     - GET /api/imports/{id}/report/ - Descargar reporte
+    - GET /api/imports/{id}/records/ - Registros de la importación (paginado por cursor)
+    - POST /api/imports/{id}/rollback/ - Revertir la importación (preview=true, force=true)
     """
     
     queryset = Import.objects.all()
@@ -286,10 +502,21 @@ class ImportViewSet(viewsets.ModelViewSet):
     filterset_fields = ['status', 'file_type']
     ordering_fields = ['uploaded_at']
     ordering = ['-uploaded_at']
+    query_budgets = {'list': 4, 'retrieve': 3, 'report': 2, 'records': 3}
     
     def get_queryset(self):
         """Filtrar por usuario si no es admin"""
         queryset = super().get_queryset()
+        # records/report/rollback no serializan la importación: sin prefetch ni conteos
+        if self.action not in ('records', 'report', 'rollback'):
+            queryset = queryset.select_related('uploader_id').prefetch_related(
+                # El estado previo de cada fila solo lo usa el rollback
+                Prefetch('records', queryset=ImportRecord.objects.defer('before'))
+            ).annotate(
+                records_total=Count('records'),
+                records_success=Count('records', filter=Q(records__status='success')),
+                records_error=Count('records', filter=Q(records__status='error')),
+            )
         if not self.request.user.is_staff:
             queryset = queryset.filter(uploader_id=self.request.user)
         return queryset
@@ -447,6 +674,40 @@ class ImportViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
     
+    @action(detail=True, methods=['get'])
+    def records(self, request, pk=None):
+        """Registros de una importación, paginados por cursor (row_number_or_page, id)"""
+        import_obj = self.get_object()
+        records = ImportRecord.objects.filter(import_id=import_obj)
+        
+        record_status = request.query_params.get('status')
+        if record_status:
+            records = records.filter(status=record_status)
+        
+        paginator = KeysetPagination(('row_number_or_page', 'id'))
+        page = paginator.paginate_queryset(records, request, view=self)
+        serializer = ImportRecordSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def rollback(self, request, pk=None):
+        """
+        Revertir la importación: elimina los registros que creó y restaura los
+        valores anteriores de los que actualizó (por bloques, un UPDATE y un
+        DELETE por bloque). Con preview=true solo informa qué se revertiría;
+        los registros modificados después de la importación responden 409
+        salvo con force=true.
+        """
+        import_obj = self.get_object()
+        data = request.data if hasattr(request.data, 'get') else {}
+        preview, force = (
+            is_truthy(request.query_params.get(name, data.get(name, ''))) for name in ('preview', 'force')
+        )
+        return Response(rollback_import(
+            import_obj, request.user, force=force, preview=preview,
+            ip_address=self._get_client_ip(), user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ))
+    
     @action(detail=True, methods=['get'])
     def report(self, request, pk=None):
         """Descargar reporte de importación"""
@@ -471,16 +732,29 @@ class ImportViewSet(viewsets.ModelViewSet):
             content_type='text/plain',
             filename=f"report_{import_obj.id}.txt"
         )
+    
+    def _get_client_ip(self):
+        """Obtener IP del cliente"""
+        x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = self.request.META.get('REMOTE_ADDR')
+        return ip
 
 
-class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+class AuditLogViewSet(KeysetPaginationMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet de solo lectura para AuditLog.
     Solo accesible para usuarios admin/auditor.
     
     Endpoints:
-    - GET /api/audit-logs/ - Listar logs
+    - GET /api/audit-logs/ - Listar logs (con date_from en meses archivados incluye el archivo)
     - GET /api/audit-logs/{id}/ - Detalle de log
+    - GET /api/audit-logs/timeline/ - Historial de un RUT, instrumento o registro, paginado por cursor
+    
+    ?rut=, ?instrumento= y ?year= filtran por las columnas de búsqueda de
+    audit_logs (indexadas junto al orden -timestamp, id).
     """
     
     queryset = AuditLog.objects.all()
@@ -490,14 +764,19 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['entity', 'action', 'user_id']
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
+    keyset_ordering = ('-timestamp', 'id')
+    # list: con date_from se consulta además el límite del archivo (si el rango
+    # llega a meses archivados se leen también sus bloques y no aplica el presupuesto)
+    query_budgets = {'list': 4, 'retrieve': 2, 'timeline': 2}
     
     def get_queryset(self):
         """Filtros adicionales"""
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('user_id')
         
         entity_id = self.request.query_params.get('entity_id')
         if entity_id:
             queryset = queryset.filter(entity_id=entity_id)
+        queryset = queryset.filter(**audit_key_filters(self.request.query_params))
         
         date_from = self.request.query_params.get('date_from')
         date_to = self.request.query_params.get('date_to')
@@ -507,27 +786,146 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(timestamp__lte=date_to)
         
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """Listado; si date_from llega a un mes archivado agrega las entradas de audit_log_archives"""
+        archived = self.archived_logs()
+        if archived is None:
+            return super().list(request, *args, **kwargs)
+        
+        # Con el archivo la cantidad de consultas depende de los bloques del rango: sin presupuesto
+        request._request._query_budget = None
+        hot = self.filter_queryset(self.get_queryset())
+        logs = CombinedAuditLogs(hot, archived) if archived.descending else CombinedAuditLogs(archived, hot)
+        # El archivo no admite cursor keyset: se pagina por número de página
+        self._paginator = PageNumberPagination()
+        page = self.paginate_queryset(logs)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def timeline(self, request):
+        """
+        Historial de ?rut=, ?instrumento= o ?entity_id= (con ?entity=), siempre
+        paginado por cursor: cada página es una búsqueda en el índice de la llave.
+        """
+        params = request.query_params
+        if not any(params.get(name) for name in ('rut', 'instrumento', 'entity_id')):
+            raise ValidationError({'detail': 'Indique rut, instrumento o entity_id.'})
+        logs = self.filter_queryset(self.get_queryset())
+        paginator = KeysetPagination(self.keyset_ordering)
+        page = paginator.paginate_queryset(logs, request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    def archived_logs(self):
+        """ArchivedAuditLogs de los filtros, o None si el rango no llega al archivo"""
+        params = self.request.query_params
+        if not params.get('date_from'):
+            return None
+        try:
+            date_from = parse_timestamp(params['date_from'], 'date_from')
+            date_to = parse_timestamp(params['date_to'], 'date_to') if params.get('date_to') else None
+        except ValueError:
+            return None
+        horizon = archive_horizon()
+        if horizon is None or date_from > horizon:
+            return None
+        return ArchivedAuditLogs(
+            date_from, date_to,
+            filters={
+                **{name: params[name] for name in ARCHIVE_FILTERS if params.get(name)},
+                **audit_key_filters(params),
+            },
+            descending=params.get('ordering') != 'timestamp',
+        )
 
 
-class DividendMaintainerViewSet(viewsets.ModelViewSet):
+class ChangeFeedViewSet(viewsets.ViewSet):
+    """
+    Feed de cambios de calificaciones y dividendos para sincronización
+    incremental (outbox change_events, miapp.changes).
+    
+    Endpoints:
+    - GET /api/changes/?since=<cursor>&limit=&entity= - Cambios posteriores al cursor, en orden
+    - POST /api/changes/ack/ - Confirmar lo procesado por un consumidor ({consumer, cursor})
+    """
+    
+    permission_classes = [IsAuthenticated]
+    # ack: SELECT ... FOR UPDATE del consumidor dentro de su transacción (más el
+    # SAVEPOINT si la request corre dentro de otra)
+    query_budgets = {'list': 2, 'ack': 9}
+    
+    def list(self, request):
+        """Página de eventos con id mayor a `since`; `cursor` es el `since` de la siguiente"""
+        return Response(read_changes(
+            since=parse_cursor(request.query_params.get('since')),
+            limit=parse_limit(request.query_params.get('limit')),
+            entity=request.query_params.get('entity'),
+        ))
+    
+    @action(detail=False, methods=['post'])
+    def ack(self, request):
+        """Confirmar que `consumer` procesó los eventos hasta `cursor` (habilita su compactación)"""
+        consumer = str(request.data.get('consumer') or '').strip()
+        if not consumer or len(consumer) > 100:
+            raise ValidationError({'consumer': 'Se requiere el nombre del consumidor (máximo 100 caracteres).'})
+        position = acknowledge(consumer, parse_cursor(request.data.get('cursor'), 'cursor'))
+        return Response({'consumer': consumer, 'cursor': str(position)})
+
+
+class DividendMaintainerViewSet(ConditionalGetMixin, OptimisticConcurrencyMixin, CachedResponseMixin,
+                                BulkFilterMixin, StreamIngestMixin, SparseFieldsetMixin, FastListMixin,
+                                KeysetPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet para DividendMaintainer con CRUD completo y filtros.
     
     Endpoints:
-    - GET /api/dividend-maintainers/ - Listar con filtros
+    - GET /api/dividend-maintainers/ - Listar con filtros (incluye factor_<n>, factor_<n>_min/_max
+      y ?ordering=factor_<n>, ver miapp.factors)
     - GET /api/dividend-maintainers/{id}/ - Detalle
     - POST /api/dividend-maintainers/ - Crear
     - PUT /api/dividend-maintainers/{id}/ - Actualizar
     - DELETE /api/dividend-maintainers/{id}/ - Eliminar
+    - POST /api/dividend-maintainers/bulk/ - Crear o actualizar en lote (miapp.bulk)
+    - POST /api/dividend-maintainers/bulk-delete/ - Eliminar los que cumplen los filtros
+    - POST /api/ingest/dividend-maintainers/ - Ingesta NDJSON en streaming (miapp.ingest)
+    - GET /api/dividend-maintainers/export/ - Exportar periodo (CSV/Parquet; ?updated_since=/?watermark=: delta)
+    - GET /api/dividend-maintainers/rollups/ - Totales por periodo, mercado y origen
+    - GET /api/dividend-maintainers/series/ - Serie de pagos de un instrumento
+    
+    El listado y la exportación aceptan ?layout=columnar (una lista por columna
+    y los factores como matriz, ver miapp.columnar); todas las acciones se
+    pueden pedir en MessagePack (Accept: application/x-msgpack o ?format=msgpack).
+    
+    Listado y detalle se sirven desde la caché versionada por periodo (miapp.cache)
+    y responden 304 a If-None-Match; las escrituras aceptan If-Match y usan
+    concurrencia optimista sobre `version` (miapp.conditional).
     """
     
     queryset = DividendMaintainer.objects.all()
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    renderer_classes = available_renderer_classes(*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer)
+    cache_entity = 'dividend_maintainers'
+    cache_year_param = 'periodo_comercial'
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, DividendFactorFilter, FullTextSearchFilter]
     filterset_fields = ['tipo_mercado', 'origen_informacion', 'periodo_comercial', 'origen']
     search_fields = ['instrumento', 'descripcion_dividendo']
     ordering_fields = ['periodo_comercial', 'fecha_pago_dividendo', 'instrumento']
+    bulk_filter_params = ('tipo_mercado', 'origen_informacion', 'periodo_comercial', 'origen', 'search', 'factor_<n>')
     ordering = ['-periodo_comercial', 'instrumento', 'fecha_pago_dividendo']
+    keyset_ordering = ('-periodo_comercial', 'instrumento', 'fecha_pago_dividendo', 'id')
+    bulk_writer_class = DividendBulkUpsert
+    bulk_serializer_class = DividendMaintainerBulkSerializer
+    # Verificados en miapp.tests.QueryBudgetTests. Las escrituras se miden en el
+    # peor caso: grupo nuevo en dividend_rollups y dividend_instrument_series
+    # (UPDATE + INSERT con SAVEPOINT en cada una), reemplazo de las filas de
+    # dividend_factors, INSERT en change_events y en audit_logs, más el índice
+    # de trigramas (SEARCH_BACKEND 'auto' fuera de MySQL) y el SAVEPOINT si la
+    # request corre dentro de otra transacción. El listado columnar con
+    # factores lee además dividend_factors (una consulta por página).
+    query_budgets = {
+        'list': 5, 'retrieve': 3, 'create': 18, 'update': 16,
+        'partial_update': 13, 'destroy': 12, 'rollups': 2, 'series': 2,
+    }
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -538,6 +936,11 @@ class DividendMaintainerViewSet(viewsets.ModelViewSet):
         """Filtros adicionales por query params"""
         queryset = super().get_queryset()
         
+        if self.action == 'list':
+            queryset = self.only_fieldset(queryset)
+        elif self.action != 'export':
+            queryset = queryset.select_related('created_by', 'updated_by')
+        
         # Filtro por tipo de mercado
         tipo_mercado = self.request.query_params.get('tipo_mercado')
         if tipo_mercado:
@@ -558,12 +961,18 @@ class DividendMaintainerViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    @transaction.atomic
     def perform_create(self, serializer):
         """Crear DividendMaintainer y registrar auditoría"""
         dividend = serializer.save(
             created_by=self.request.user,
             updated_by=self.request.user
         )
+        index_search_documents([dividend])
+        sync_dividend_factors([dividend])
+        record_dividend_rollup_change(after=dividend_snapshot(dividend))
+        record_change(dividend, 'create')
+        self.invalidate_cache(dividend.periodo_comercial)
         
         # Registrar auditoría
         AuditLog.objects.create(
@@ -577,12 +986,21 @@ class DividendMaintainerViewSet(viewsets.ModelViewSet):
             timestamp=timezone.now()
         )
     
+    @transaction.atomic
     def perform_update(self, serializer):
-        """Actualizar DividendMaintainer y registrar auditoría"""
-        instance = self.get_object()
+        """Actualizar DividendMaintainer (UPDATE condicional por versión) y registrar auditoría"""
+        instance = serializer.instance
         before = self._serialize_model(instance)
+        previous_periodo = instance.periodo_comercial
+        before_snapshot = dividend_snapshot(instance)
         
-        dividend = serializer.save(updated_by=self.request.user)
+        dividend = self.save_versioned(serializer, updated_by=self.request.user)
+        index_search_documents([dividend])
+        if 'factores_8_37' in serializer.validated_data:
+            sync_dividend_factors([dividend])
+        record_dividend_rollup_change(before_snapshot, dividend_snapshot(dividend))
+        record_change(dividend, 'update')
+        self.invalidate_cache(previous_periodo, dividend.periodo_comercial)
         after = self._serialize_model(dividend)
         
         # Registrar auditoría
@@ -599,23 +1017,281 @@ class DividendMaintainerViewSet(viewsets.ModelViewSet):
         )
     
     def perform_destroy(self, instance):
-        """Eliminar DividendMaintainer y registrar auditoría"""
+        """Eliminar DividendMaintainer (solo si la versión no cambió) y registrar auditoría"""
         before = self._serialize_model(instance)
+        before_snapshot = dividend_snapshot(instance)
         
-        # Registrar auditoría antes de eliminar
-        AuditLog.objects.create(
-            user_id=self.request.user,
-            entity='dividend_maintainers',
-            entity_id=str(instance.id),
-            action='delete',
-            before=before,
-            after=None,
-            ip_address=self._get_client_ip(),
-            user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
-            timestamp=timezone.now()
+        with transaction.atomic():
+            # Registrar auditoría antes de eliminar
+            AuditLog.objects.create(
+                user_id=self.request.user,
+                entity='dividend_maintainers',
+                entity_id=str(instance.id),
+                action='delete',
+                before=before,
+                after=None,
+                ip_address=self._get_client_ip(),
+                user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
+                timestamp=timezone.now()
+            )
+            
+            deleted, _ = DividendMaintainer.objects.filter(
+                pk=instance.pk, version=self.expected_version
+            ).delete()
+            if not deleted:
+                raise PreconditionFailed()
+            record_dividend_rollup_change(before_snapshot, None)
+            record_change(instance, 'delete')
+        
+        remove_search_documents(DividendMaintainer, [instance.pk])
+        self.invalidate_cache(instance.periodo_comercial)
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Crear o actualizar dividendos en lote por su llave única, con un resultado por ítem"""
+        items = parse_bulk_items(request.data)
+        validated = DividendMaintainerBulkSerializer(many=True, context=self.get_serializer_context()).validate_items(items)
+        writer = DividendBulkUpsert(
+            request.user, self._serialize_model,
+            ip_address=self._get_client_ip(), user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+        return Response(writer.run(validated))
+    
+    def has_bulk_filter(self, name):
+        return super().has_bulk_filter(name) or bool(FACTOR_PARAM_RE.match(name))
+    
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Eliminar (un solo DELETE) los dividendos que cumplen los filtros del listado"""
+        preview, expected_count = self.bulk_options()
+        # Los filtros por factor y la búsqueda leen tablas que se borran antes que los dividendos
+        freeze = any(
+            name == 'search' or FACTOR_PARAM_RE.match(name)
+            for name, value in request.query_params.items() if value.strip()
+        )
+        return Response(delete_dividends(
+            self.bulk_filter_queryset(), request.user,
+            ip_address=self._get_client_ip(), user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            preview=preview, expected_count=expected_count, freeze=freeze,
+        ))
+    
+    def use_fast_list(self):
+        # La representación columnar se arma siempre desde el fast path
+        return wants_columnar(self.request) or super().use_fast_list()
+    
+    def get_fast_list_plan(self):
+        if not wants_columnar(self.request):
+            return super().get_fast_list_plan()
+        fieldset = self.get_fieldset()
+        extra_columns = ('id', *(name.lstrip('-') for name in self.keyset_ordering))
+        if SII_FIELD in fieldset:
+            extra_columns += (SII_FIELD,)
+        return build_row_plan(
+            DividendMaintainerListSerializer,
+            tuple(name for name in fieldset if name not in (FACTORS_FIELD, SII_FIELD)),
+            extra_columns,
+        )
+    
+    def fast_list_data(self, plan, rows):
+        if not wants_columnar(self.request):
+            return super().fast_list_data(plan, rows)
+        fieldset = self.get_fieldset()
+        binary = self.request.accepted_renderer.format == MessagePackRenderer.format
+        factors = factor_matrix([row.id for row in rows]) if FACTORS_FIELD in fieldset else None
+        sii = sii_matrix([row.campos_detallados_sii for row in rows]) if SII_FIELD in fieldset else None
+        data = columnar_payload(plan, rows, factors, sii, binary)
+        return data, plan.json_safe and (binary or (factors is None and sii is None))
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        """JSON y MessagePack comparten URL: la respuesta varía según Accept"""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Accept',))
+        return response
+    
+    @action(detail=False, methods=['get'],
+            renderer_classes=available_renderer_classes(
+                JSONRenderer, CSVExportRenderer, ParquetExportRenderer, MessagePackRenderer
+            ))
+    def export(self, request):
+        """
+        Exportar dividendos de un periodo con factores y campos SII en columnas.
+        Con ?updated_since= o ?watermark= (periodo opcional) solo se exportan los
+        modificados, en orden (updated_at, id) y con las columnas updated_at y
+        watermark para reanudar desde cualquier fila.
+        """
+        try:
+            delta = DeltaWindow.from_params(request.query_params, DividendMaintainer)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        periodo_comercial = request.query_params.get('periodo_comercial')
+        if not periodo_comercial and delta is None:
+            return Response(
+                {'error': 'Parámetro "periodo_comercial" es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if periodo_comercial:
+            try:
+                periodo_comercial = int(periodo_comercial)
+            except ValueError:
+                return Response(
+                    {'error': 'Periodo comercial inválido'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        export_format = request.query_params.get('format', 'csv')
+        queryset = self.filter_queryset(self.get_queryset())
+        if wants_columnar(request):
+            if delta is not None:
+                return Response(
+                    {'error': 'La exportación delta no admite layout=columnar'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(self._columnar_export(queryset))
+        if export_format not in ('csv', 'parquet'):
+            return Response(
+                {'error': 'Formato inválido: use csv o parquet (o layout=columnar para JSON/MessagePack)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        file_name = f"dividendos_{periodo_comercial or 'delta'}.{export_format}"
+        
+        if export_format == 'parquet':
+            try:
+                output = tempfile.TemporaryFile()
+                write_dividend_parquet(queryset, output, delta=delta)
+            except ImportError:
+                return Response(
+                    {'error': 'La exportación Parquet requiere la librería pyarrow'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            output.seek(0)
+            return FileResponse(
+                output,
+                as_attachment=True,
+                filename=file_name,
+                content_type=ParquetExportRenderer.media_type
+            )
+        
+        response = StreamingHttpResponse(
+            stream_dividend_csv(queryset, delta=delta),
+            content_type='text/csv; charset=utf-8'
         )
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def rollups(self, request):
+        """
+        Totales de dividendo, valor histórico y cantidad de registros desde la
+        tabla dividend_rollups. Filtros: periodo_comercial, periodo_from,
+        periodo_to, tipo_mercado, origen_informacion. ?group_by= elige las
+        columnas de agrupación (por defecto todas).
+        """
+        group_by = [
+            name.strip() for name in request.query_params.get('group_by', '').split(',') if name.strip()
+        ] or list(DIVIDEND_ROLLUP_GROUP_FIELDS)
+        invalid = [name for name in group_by if name not in DIVIDEND_ROLLUP_GROUP_FIELDS]
+        if invalid:
+            return Response(
+                {'error': f"group_by inválido: {', '.join(invalid)}. Opciones: {', '.join(DIVIDEND_ROLLUP_GROUP_FIELDS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        instance.delete()
+        queryset = DividendRollup.objects.all()
+        try:
+            for param, lookup in (('periodo_comercial', 'periodo_comercial'),
+                                  ('periodo_from', 'periodo_comercial__gte'),
+                                  ('periodo_to', 'periodo_comercial__lte')):
+                value = request.query_params.get(param)
+                if value:
+                    queryset = queryset.filter(**{lookup: int(value)})
+        except ValueError:
+            return Response({'error': 'Periodo comercial inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        for param in ('tipo_mercado', 'origen_informacion'):
+            value = request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        
+        results = list(DIVIDEND_ROLLUP.totals(queryset, group_by))
+        return Response({
+            'group_by': group_by,
+            'results': results,
+            'totals': {
+                'total_dividendo': sum((row['total_dividendo'] for row in results), Decimal(0)),
+                'total_valor_historico': sum((row['total_valor_historico'] for row in results), Decimal(0)),
+                'record_count': sum(row['record_count'] for row in results),
+            },
+        })
+    
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """
+        Serie de pagos de un instrumento (?instrumento=) por fecha de pago,
+        desde dividend_instrument_series. Filtros: periodo_comercial,
+        date_from, date_to (YYYY-MM-DD). ?points= limita la cantidad de puntos
+        (por defecto 200); si la serie es más larga se agrupa en tramos.
+        """
+        instrumento = request.query_params.get('instrumento')
+        if not instrumento:
+            return Response(
+                {'error': 'Parámetro "instrumento" es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            points = int(request.query_params.get('points', 200))
+        except ValueError:
+            points = 0
+        if not 1 <= points <= 5000:
+            return Response({'error': 'points debe estar entre 1 y 5000'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = DividendInstrumentSeries.objects.filter(instrumento=instrumento)
+        try:
+            periodo_comercial = request.query_params.get('periodo_comercial')
+            if periodo_comercial:
+                queryset = queryset.filter(periodo_comercial=int(periodo_comercial))
+            for param, lookup in (('date_from', 'fecha_pago_dividendo__gte'),
+                                  ('date_to', 'fecha_pago_dividendo__lte')):
+                value = request.query_params.get(param)
+                if value:
+                    queryset = queryset.filter(**{lookup: datetime.date.fromisoformat(value)})
+        except ValueError:
+            return Response({'error': 'Periodo o fecha inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rows = list(
+            queryset.order_by()
+            .values('fecha_pago_dividendo')
+            .annotate(
+                dividendo=Sum('total_dividendo'),
+                valor_historico=Sum('total_valor_historico'),
+                pagos=Sum('payment_count'),
+            )
+            .filter(pagos__gt=0)
+            .order_by('fecha_pago_dividendo')
+            .values_list('fecha_pago_dividendo', 'dividendo', 'valor_historico', 'pagos')
+        )
+        return Response({
+            'instrumento': instrumento,
+            'points': points,
+            'raw_count': len(rows),
+            'results': downsample_series(rows, points),
+        })
+    
+    def _columnar_export(self, queryset):
+        """Periodo completo en representación columnar, con las matrices de factores y campos SII"""
+        serializer_class = DividendMaintainerListSerializer
+        plan = build_row_plan(
+            serializer_class,
+            tuple(name for name in serializer_class.available_fields() if name not in (FACTORS_FIELD, SII_FIELD)),
+            ('id', SII_FIELD),
+        )
+        rows = list(queryset.values_list(*plan.columns, named=True))
+        return columnar_payload(
+            plan, rows,
+            factors=factor_matrix([row.id for row in rows], queryset),
+            sii=sii_matrix([row.campos_detallados_sii for row in rows]),
+            binary=self.request.accepted_renderer.format == MessagePackRenderer.format,
+        )
     
     def _serialize_model(self, instance):
         """Serializar instancia para auditoría"""
@@ -637,3 +1313,80 @@ class DividendMaintainerViewSet(viewsets.ModelViewSet):
         else:
             ip = self.request.META.get('REMOTE_ADDR')
         return ip
+
+
+# Acción `ingest` (StreamIngestMixin) de cada ViewSet con ingesta NDJSON
+INGEST_VIEWS = {
+    'tax-grades': TaxGradeViewSet.as_view({'post': 'ingest'}),
+    'dividend-maintainers': DividendMaintainerViewSet.as_view({'post': 'ingest'}),
+}
+
+
+@csrf_exempt
+def ingest_view(request, entity):
+    """POST /api/ingest/{entity}/ - Ingesta NDJSON en streaming (miapp.ingest)"""
+    view = INGEST_VIEWS.get(entity)
+    if view is None:
+        raise Http404(f'Entidad de ingesta no encontrada: {entity}')
+    return view(request)
+
+
+class SIIDeclarationViewSet(viewsets.ViewSet):
+    """
+    Generación de archivos de Declaraciones Juradas del SII.
+    
+    Endpoints:
+    - GET /api/sii-declarations/ - Listar layouts disponibles
+    - GET /api/sii-declarations/{layout}/?periodo_comercial=YYYY - Descargar archivo
+    """
+    
+    permission_classes = [IsAuthenticated]
+    
+    def list(self, request):
+        """Listar layouts de declaración registrados"""
+        return Response([
+            {
+                'code': layout.code,
+                'description': layout.description,
+                'format': 'delimitado' if layout.delimiter else 'fijo',
+                'record_length': layout.record_length,
+            }
+            for layout in LAYOUTS.values()
+        ])
+    
+    def retrieve(self, request, pk=None):
+        """
+        Generar la declaración de un periodo en una sola pasada. Se escribe
+        primero en un archivo temporal: si un valor no cabe en su campo se
+        responde 422 en vez de entregar un archivo truncado.
+        """
+        layout = get_layout(pk)
+        if layout is None:
+            return Response(
+                {'error': f'Layout de declaración no encontrado: {pk}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        periodo_comercial = request.query_params.get('periodo_comercial')
+        try:
+            periodo_comercial = int(periodo_comercial)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Parámetro "periodo_comercial" es requerido y debe ser un año'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        declarant_rut = request.query_params.get('declarant_rut') or settings.SII_DECLARANT_RUT
+        output = tempfile.TemporaryFile()
+        try:
+            write_declaration(layout, periodo_comercial, output, declarant_rut)
+        except DeclarationFieldOverflow as exc:
+            output.close()
+            return Response({'error': str(exc)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        output.seek(0)
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=declaration_file_name(layout, periodo_comercial),
+            content_type='text/plain; charset=iso-8859-1'
+        )
@@ -1,6 +1,41 @@
+import mimetypes
+
+from django.http import FileResponse, Http404
 from django.shortcuts import render
+from django.utils.cache import patch_vary_headers
+
+from .assets import IMMUTABLE_CACHE_CONTROL, PRECOMPRESSED, asset_path
+from .compression import accepted_encodings
 
 def index(request):
     """Vista para servir el frontend"""
     return render(request, 'index.html')
 
+
+def serve_asset(request, path):
+    """
+    Sirve un asset con hash de build_assets: la variante precomprimida (.br o
+    .gz) que acepte el cliente y Cache-Control immutable.
+    """
+    source = asset_path(path)
+    if source is None:
+        raise Http404('Asset no encontrado')
+
+    content_type, _ = mimetypes.guess_type(source.name)
+    accepted = accepted_encodings(request)
+    file_path, encoding = source, None
+    for name, suffix in PRECOMPRESSED:
+        candidate = source.with_name(source.name + suffix)
+        if (name in accepted or '*' in accepted) and candidate.is_file():
+            file_path, encoding = candidate, name
+            break
+
+    response = FileResponse(
+        open(file_path, 'rb'), filename=source.name,
+        content_type=content_type or 'application/octet-stream',
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
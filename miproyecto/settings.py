@@ -23,8 +23,13 @@ MEDIA_URL = '/media/'
 # Upload directories
 IMPORTS_DIR = MEDIA_ROOT / 'imports'
 REPORTS_DIR = MEDIA_ROOT / 'reports'
+DECLARATIONS_DIR = MEDIA_ROOT / 'declarations'
 IMPORTS_DIR.mkdir(parents=True, exist_ok=True)
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+DECLARATIONS_DIR.mkdir(parents=True, exist_ok=True)
+
+# RUT del declarante usado en la cabecera de las Declaraciones Juradas del SII
+SII_DECLARANT_RUT = ''
 
 
 # Quick-start development settings - unsuitable for production
@@ -57,6 +62,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'miapp.middleware.ResponseCompressionMiddleware',
+    'miapp.middleware.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,6 +74,19 @@ MIDDLEWARE = [
     'miapp.middleware.AuditLogMiddleware',
 ]
 
+# Si es True, las acciones que superen su `query_budgets` lanzan un error
+# (usar en tests); si es False solo se registra un warning.
+QUERY_BUDGET_ENFORCE = False
+
+# Búsqueda de texto (?search=): 'auto' usa índices FULLTEXT en MySQL y el
+# índice de trigramas (tabla search_trigrams) en otros motores.
+SEARCH_BACKEND = 'auto'
+# Fracción mínima de trigramas del término que debe contener un registro
+SEARCH_TRIGRAM_MIN_SIMILARITY = 0.75
+# innodb_ft_min_token_size del servidor MySQL: las palabras más cortas no están
+# en el índice FULLTEXT y se buscan con LIKE
+SEARCH_FULLTEXT_MIN_TOKEN_SIZE = 3
+
 ROOT_URLCONF = 'miproyecto.urls'
 
 TEMPLATES = [
@@ -147,6 +167,12 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Assets con hash de contenido y precomprimidos (manage.py build_assets).
+# Se sirven desde STATIC_ASSETS_URL con Cache-Control immutable; sin build se usa static/.
+STATIC_ASSETS = ['js/app.js']
+STATIC_ASSETS_ROOT = BASE_DIR / 'static_assets'
+STATIC_ASSETS_URL = '/assets/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -166,8 +192,9 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # JSONRenderer de DRF que usa orjson (si está instalado) en el fast path de los listados
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'miapp.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -176,6 +203,81 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Caché de respuestas de la API (miapp.cache). API_CACHE_BACKEND elige el
+# backend: 'locmem' (LRU en memoria por proceso), 'file' o 'redis' (cualquier
+# servidor compatible con el protocolo de Redis). Las respuestas se invalidan
+# por generación, así que TIMEOUT solo acota cuánto ocupan. Con varios
+# procesos (gunicorn) usar 'file' o 'redis' para compartir las generaciones.
+API_CACHE_ENABLED = True
+API_CACHE_BACKEND = 'locmem'
+API_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-responses',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'api',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+# Fast path de los listados de tax grades y dividendos (miapp.fastlist): lee con
+# values_list() y serializa sin instancias; la salida es la misma del serializer
+API_FAST_LIST_ENABLED = True
+
+# Escrituras en lote (POST .../bulk/, miapp.bulk): máximo de ítems por petición y
+# ítems por transacción
+BULK_WRITE_MAX_ITEMS = 50000
+BULK_WRITE_CHUNK_SIZE = 500
+
+# Importación de archivos (miapp.services): filas por transacción
+IMPORT_CHUNK_SIZE = 500
+
+# Reversión de importaciones (POST /api/imports/{id}/rollback/, miapp.rollback):
+# registros por transacción (un UPDATE y un DELETE por bloque)
+IMPORT_ROLLBACK_CHUNK_SIZE = 1000
+
+# Ingesta NDJSON en streaming (POST /api/ingest/{entidad}/, miapp.ingest):
+# largo máximo de una línea en bytes (las más largas se registran como error)
+INGEST_MAX_LINE_LENGTH = 1024 * 1024
+
+# Feed de cambios (GET /api/changes/, miapp.changes): solo se entregan eventos
+# con más de CHANGE_FEED_SETTLE_SECONDS de antigüedad (transacciones aún
+# abiertas con ids menores) y como máximo CHANGE_FEED_MAX_LIMIT por página
+CHANGE_FEED_SETTLE_SECONDS = 5
+CHANGE_FEED_MAX_LIMIT = 5000
+
+# Archivo de auditoría (manage.py archive_audit_logs, miapp.archive): meses
+# que se conservan en audit_logs y entradas por bloque comprimido
+AUDIT_ARCHIVE_KEEP_MONTHS = 12
+AUDIT_ARCHIVE_CHUNK_SIZE = 5000
+
+# Payloads de auditoría (miapp.diffs): las actualizaciones se guardan como
+# diferencia y los documentos de más de estos bytes se comprimen (zstd o zlib)
+AUDIT_PAYLOAD_COMPRESS_MIN_BYTES = 512
+
+# Compresión de respuestas (ResponseCompressionMiddleware): brotli si está instalado,
+# si no gzip, según Accept-Encoding y solo sobre este tamaño en bytes
+RESPONSE_COMPRESSION_MIN_LENGTH = 1024
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        **API_CACHE_BACKENDS[API_CACHE_BACKEND],
+        'TIMEOUT': 600,
+        'KEY_PREFIX': 'miapp',
+    },
+}
+
 # Simple JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
@@ -25,7 +25,10 @@ from miapp.views import (
     TaxGradeViewSet,
     ImportViewSet,
     AuditLogViewSet,
+    ChangeFeedViewSet,
     DividendMaintainerViewSet,
+    SIIDeclarationViewSet,
+    ingest_view,
     CustomTokenObtainPairView,
     UserRegistrationView
 )
@@ -35,7 +38,9 @@ router = DefaultRouter()
 router.register(r'tax-grades', TaxGradeViewSet, basename='taxgrade')
 router.register(r'imports', ImportViewSet, basename='import')
 router.register(r'audit-logs', AuditLogViewSet, basename='auditlog')
+router.register(r'changes', ChangeFeedViewSet, basename='change')
 router.register(r'dividend-maintainers', DividendMaintainerViewSet, basename='dividendmaintainer')
+router.register(r'sii-declarations', SIIDeclarationViewSet, basename='siideclaration')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -44,6 +49,7 @@ urlpatterns = [
     path('api/auth/register/', UserRegistrationView.as_view(), name='user_register'),
     path('api/auth/login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/ingest/<str:entity>/', ingest_view, name='ingest'),
     path('api/', include(router.urls)),
     
     # Frontend (debe ir al final para capturar todas las demás rutas)
@@ -2,7 +2,8 @@
 const API_BASE_URL = '/api';
 let accessToken = localStorage.getItem('accessToken');
 let refreshToken = localStorage.getItem('refreshToken');
-let currentPage = 1;
+let currentPage = null; // Cursor de la página actual (paginación keyset), null = primera página
+let editingTaxETag = null; // ETag (versión) de la calificación en edición, se envía como If-Match
 
 // Initialize app
 document.addEventListener('DOMContentLoaded', function() {
@@ -287,17 +288,20 @@ function getAuthHeaders() {
 }
 
 // Tax Grades
-async function loadTaxGrades(page = 1) {
-    currentPage = page;
+async function loadTaxGrades(cursor = null) {
+    currentPage = cursor;
     const loading = document.getElementById('loading');
     const tbody = document.getElementById('taxTableBody');
     
     loading.classList.remove('hidden');
     tbody.innerHTML = '';
     
+    // Paginación por cursor: el costo de cada página no depende de su profundidad
     const params = new URLSearchParams({
-        page: page,
+        pagination: 'keyset',
+        fields: 'id,rut,name,year,source_type,fuente_ingreso,amount,factor,status',
     });
+    if (cursor) params.append('cursor', cursor);
     
     const rut = document.getElementById('searchRut').value;
     const year = document.getElementById('searchYear').value;
@@ -349,7 +353,12 @@ async function loadTaxGrades(page = 1) {
 }
 
 function searchTaxGrades() {
-    loadTaxGrades(1);
+    loadTaxGrades();
+}
+
+// Extrae el cursor de un link next/previous de la API
+function getCursorParam(url) {
+    return url ? new URL(url, window.location.origin).searchParams.get('cursor') : null;
 }
 
 function updatePagination(data) {
@@ -358,10 +367,10 @@ function updatePagination(data) {
     
     if (data.previous || data.next) {
         if (data.previous) {
-            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadTaxGrades(${currentPage - 1}); return false;">Anterior</a></li>`;
+            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadTaxGrades('${getCursorParam(data.previous)}'); return false;">Anterior</a></li>`;
         }
         if (data.next) {
-            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadTaxGrades(${currentPage + 1}); return false;">Siguiente</a></li>`;
+            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadTaxGrades('${getCursorParam(data.next)}'); return false;">Siguiente</a></li>`;
         }
     }
 }
@@ -389,6 +398,7 @@ function showCreateModal() {
     document.getElementById('modalTitle').textContent = 'Nueva Calificación';
     document.getElementById('taxForm').reset();
     document.getElementById('taxId').value = '';
+    editingTaxETag = null;
     
     // Establecer valores por defecto
     document.getElementById('taxSourceType').value = 'manual';
@@ -408,6 +418,7 @@ async function editTaxGrade(id) {
         const data = await response.json();
         
         if (response.ok) {
+            editingTaxETag = response.headers.get('ETag');
             document.getElementById('taxId').value = data.id;
             document.getElementById('taxRut').value = data.rut;
             document.getElementById('taxName').value = data.name;
@@ -490,16 +501,25 @@ async function saveTaxGrade() {
     const id = document.getElementById('taxId').value;
     const url = id ? `${API_BASE_URL}/tax-grades/${id}/` : `${API_BASE_URL}/tax-grades/`;
     const method = id ? 'PUT' : 'POST';
+    const headers = getAuthHeaders();
+    if (id && editingTaxETag) {
+        headers['If-Match'] = editingTaxETag;
+    }
     
     try {
         const response = await fetch(url, {
             method: method,
-            headers: getAuthHeaders(),
+            headers: headers,
             body: JSON.stringify(data)
         });
         
         const responseData = await response.json();
         
+        if (response.status === 412) {
+            alert('La calificación fue modificada por otro usuario. Vuelva a abrirla para ver los cambios.');
+            return;
+        }
+        
         if (response.ok) {
             bootstrap.Modal.getInstance(document.getElementById('taxModal')).hide();
             loadTaxGrades(currentPage);
@@ -980,7 +1000,7 @@ async function downloadReport(importId) {
 // ==================== DIVIDEND MAINTAINER ====================
 
 let selectedDividendIds = new Set();
-let currentDividendPage = 1;
+let currentDividendPage = null; // Cursor de la página actual de dividendos
 
 // Nombres de los 29 campos detallados del SII (según homologación)
 // Estos nombres se pueden personalizar según la pestaña 3.2 Homologación
@@ -1081,8 +1101,8 @@ function generateFactoresFields() {
 }
 
 // Load dividends
-async function loadDividends(page = 1) {
-    currentDividendPage = page;
+async function loadDividends(cursor = null) {
+    currentDividendPage = cursor;
     const loading = document.getElementById('dividendLoading');
     const tbody = document.getElementById('dividendTableBody');
     
@@ -1092,8 +1112,12 @@ async function loadDividends(page = 1) {
     tbody.innerHTML = '';
     
     const params = new URLSearchParams({
-        page: page,
+        pagination: 'keyset',
+        layout: 'columnar',
+        fields: 'id,tipo_mercado,instrumento,descripcion_dividendo,fecha_pago_dividendo,secuencia_evento_capital,'
+            + 'dividendo,valor_historico,factor_actualizacion,periodo_comercial,acogido_isfut_isift',
     });
+    if (cursor) params.append('cursor', cursor);
     
     const tipoMercado = document.getElementById('filterTipoMercado')?.value;
     const origenInformacion = document.getElementById('filterOrigenInformacion')?.value;
@@ -1112,7 +1136,7 @@ async function loadDividends(page = 1) {
         loading.classList.add('hidden');
         
         if (response.ok && data.results) {
-            tbody.innerHTML = data.results.map(d => {
+            tbody.innerHTML = columnarToRows(data.results).map(d => {
                 const fechaPago = d.fecha_pago_dividendo ? new Date(d.fecha_pago_dividendo).toLocaleDateString('es-ES', { day: '2-digit', month: '2-digit', year: 'numeric' }) : '-';
                 
                 return `
@@ -1141,15 +1165,33 @@ async function loadDividends(page = 1) {
     }
 }
 
+/**
+ * Convierte una respuesta ?layout=columnar ({columns: {campo: [...]}}) en
+ * una lista de objetos por fila
+ */
+function columnarToRows(table) {
+    const names = Object.keys(table.columns || {});
+    const length = names.length ? table.columns[names[0]].length : 0;
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const row = {};
+        for (const name of names) {
+            row[name] = table.columns[name][i];
+        }
+        rows[i] = row;
+    }
+    return rows;
+}
+
 function searchDividends() {
-    loadDividends(1);
+    loadDividends();
 }
 
 function clearDividendFilters() {
     document.getElementById('filterTipoMercado').value = '';
     document.getElementById('filterOrigenInformacion').value = '';
     document.getElementById('filterPeriodoComercial').value = '';
-    loadDividends(1);
+    loadDividends();
 }
 
 function updateDividendPagination(data) {
@@ -1160,10 +1202,10 @@ function updateDividendPagination(data) {
     
     if (data.previous || data.next) {
         if (data.previous) {
-            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadDividends(${currentDividendPage - 1}); return false;">Anterior</a></li>`;
+            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadDividends('${getCursorParam(data.previous)}'); return false;">Anterior</a></li>`;
         }
         if (data.next) {
-            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadDividends(${currentDividendPage + 1}); return false;">Siguiente</a></li>`;
+            pagination.innerHTML += `<li class="page-item"><a class="page-link" href="#" onclick="loadDividends('${getCursorParam(data.next)}'); return false;">Siguiente</a></li>`;
         }
     }
 }